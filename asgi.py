@@ -0,0 +1,361 @@
+"""
+Optional ASGI entry point.
+
+    uvicorn asgi:asgi_app --workers 4
+
+The read-heavy routes (game board, game data, chat history and profile) run as
+coroutines on an asyncio Postgres pool (psycopg 3), so a request waiting on the
+database doesn't hold a worker thread. Every other route is served by the Flask
+app unchanged through a WSGI bridge. Requests are routed with the Flask app's own
+url_map and the async views run inside a regular Flask request context, so
+sessions, flash messages, templates, cache headers and CSP are the same as with
+`gunicorn app:app`.
+
+Requires: pip install "psycopg[binary,pool]" a2wsgi uvicorn
+"""
+import io
+import sys
+import time
+import asyncio
+from flask import request, session, jsonify
+from flask.ctx import RequestContext
+from flask.sessions import SecureCookieSessionInterface
+from werkzeug.exceptions import HTTPException
+try:
+    from psycopg import AsyncCursor
+    from psycopg_pool import AsyncConnectionPool, PoolTimeout as AsyncPoolTimeout
+    from a2wsgi import WSGIMiddleware
+except ImportError as e:
+    raise ImportError('The ASGI entry point requires: pip install "psycopg[binary,pool]" a2wsgi') from e
+import db.async_queries as async_queries
+from helpers import login_required, cache_policy
+from sessions import PostgresSessionInterface
+from app import app, pool_timeout
+from extensions import get_services
+from views.games import (game_board_filters, board_fragment_key, cache_board, render_board, requested_game_ids,
+                         split_cached_games, cache_games, game_data_failed, game_data_response)
+from views.chat import chat_page_args, chat_fetch_failed, render_chat_page
+from views.auth import profile_fetch_failed, render_profile
+from metrics import query_name
+
+services = get_services(app)
+cache = services.cache
+fragments = services.fragments
+
+
+class TimedAsyncCursor(AsyncCursor):
+    """Async cursor reporting each execute to the same query metrics as the psycopg2 pool."""
+
+    async def execute(self, query, params=None, **kwargs):
+        caller = sys._getframe(1)
+        start = time.perf_counter()
+        try:
+            return await super().execute(query, params, **kwargs)
+        finally:
+            services.observe_query(query_name(caller), time.perf_counter() - start,
+                          max(self.rowcount, 0) if self.description is not None else 0)
+
+
+class TimedAsyncConnectionPool(AsyncConnectionPool):
+    """Async pool recording checkout waits in db_pool_wait_seconds."""
+
+    async def getconn(self, timeout=None):
+        start = time.perf_counter()
+        conn = await super().getconn(timeout=timeout)
+        services.pool_wait.observe(time.perf_counter() - start)
+        return conn
+
+
+# Pula asyncio tylko do odczytu; otwierana przy starcie serwera (lifespan)
+apool = TimedAsyncConnectionPool(
+    kwargs=dict(services.pool.connect_kwargs, autocommit=True, cursor_factory=TimedAsyncCursor),
+    min_size=app.config["ASYNC_DB_POOL_MIN"],
+    max_size=app.config["ASYNC_DB_POOL_MAX"],
+    timeout=app.config["DB_POOL_TIMEOUT"],
+    open=False,
+)
+app.register_error_handler(AsyncPoolTimeout, pool_timeout)
+
+
+@services.metrics.collector
+def async_pool_metrics():
+    stats = apool.get_stats()
+    return [
+        ("db_async_pool_size", "gauge", "Open async pooled connections.", stats.get("pool_size", 0)),
+        ("db_async_pool_available", "gauge", "Idle async pooled connections.", stats.get("pool_available", 0)),
+        ("db_async_pool_waiting", "gauge", "Requests waiting for an async pooled connection.",
+         stats.get("requests_waiting", 0)),
+        ("db_async_pool_errors_total", "counter", "Async checkouts that failed, e.g. timed out.",
+         stats.get("requests_errors", 0)),
+    ]
+
+# Pozostałe trasy obsługuje aplikacja Flask w puli wątków
+wsgi = WSGIMiddleware(app)
+
+
+async def cached_systems(conn):
+    """
+    Async cached_systems from extensions.py, sharing its cache.
+    Args:
+        conn (AsyncConnection): Connection used on a cache miss.
+    Returns:
+        list: System rows.
+    """
+
+    systems = cache.get(("systems",))
+    if systems is None:
+        async with conn.cursor() as cur:
+            systems = await async_queries.get_systems(cur)
+        cache.set(("systems",), systems, ttl=app.config["SYSTEMS_CACHE_TTL"])
+    return systems
+
+
+async def cached_game(game_id, cur=None):
+    """
+    Async cached_game from extensions.py, sharing its cache.
+    Args:
+        game_id (int): The id of the game post.
+        cur (AsyncCursor, optional): Cursor used on a cache miss; without it a connection is checked out.
+    Returns:
+        Game or None: The game, or None if it doesn't exist.
+    """
+
+    game = cache.get(("game", game_id))
+    if game is None:
+        if cur is None:
+            async with apool.connection() as conn, conn.cursor() as cur:
+                game = await async_queries.get_game_by_id(cur, game_id)
+        else:
+            game = await async_queries.get_game_by_id(cur, game_id)
+        if game is not None:
+            cache.set(("game", game_id), game, ttl=app.config["GAME_CACHE_TTL"])
+    return game
+
+
+# Widoki poniżej różnią się od swoich odpowiedników z views/ tylko dostępem do bazy:
+# parsowanie żądania i budowanie odpowiedzi to wspólne funkcje z tamtych modułów
+
+@cache_policy("private, no-cache", anonymous_only=True, etag=True)
+async def index():
+    """Async / from views/games.py."""
+    filters = game_board_filters(request.args)
+    board_key = board_fragment_key(filters)
+    board = fragments.get(board_key)
+    async with apool.connection() as conn:
+        if board is None:
+            async with conn.cursor() as cur:
+                board = cache_board(board_key, *await async_queries.get_games_page(cur, **filters))
+        systems = await cached_systems(conn)
+    return render_board(board, systems, filters)
+
+
+@cache_policy("public, max-age=0, must-revalidate", etag=True)
+async def game_data_batch():
+    """Async /game_data?ids=... from views/games.py."""
+    games, missing = split_cached_games(requested_game_ids(request.args))
+    if missing:
+        async with apool.connection() as conn, conn.cursor() as cur:
+            games.extend(cache_games(await async_queries.get_games_by_ids(cur, missing)))
+    return jsonify(games=[game._asdict() for game in games])
+
+
+@cache_policy("public, max-age=0, must-revalidate")
+async def game_data(game_id):
+    """Async /game_data/<game_id> from views/games.py."""
+    try:
+        game = await cached_game(game_id)
+    except Exception as e:
+        return game_data_failed(e)
+    return game_data_response(game)
+
+
+@login_required
+async def game_chat(game_id):
+    """Async /game_chat/<game_id> from views/chat.py; the SSE stream itself stays on the Flask app."""
+    before_id, limit = chat_page_args(request.args)
+    try:
+        async with apool.connection() as conn, conn.cursor() as cur:
+            chatroom = await async_queries.fetch_chat(cur, game_id)
+            messages = []
+            waiting = []
+            is_gm = False
+            if chatroom is not None:
+                messages = await async_queries.fetch_messages(cur, chatroom.id, before_id, limit)
+                game = await cached_game(game_id, cur)
+                is_gm = game is not None and game.gm_id == session["user"]["id"]
+                if is_gm:
+                    waiting = await async_queries.fetch_waiting_players(cur, chatroom.id)
+    except AsyncPoolTimeout:
+        raise
+    except Exception as e:
+        return chat_fetch_failed(e)
+    return render_chat_page(game_id, before_id, limit, messages, waiting, is_gm)
+
+
+@login_required
+async def profile():
+    """Async /profile from views/auth.py."""
+    user = session.get("user")["id"]
+    try:
+        async with apool.connection() as conn, conn.cursor() as cur:
+            user_profile = await async_queries.get_profile_view(cur, user)
+    except Exception as e:
+        return profile_fetch_failed(e)
+    return render_profile(user_profile)
+
+
+# Endpointy z blueprintów obsługiwane asynchronicznie (tylko GET)
+ASYNC_VIEWS = {
+    "games.index": index,
+    "games.game_data_batch": game_data_batch,
+    "games.game_data": game_data,
+    "chat.game_chat": game_chat,
+    "auth.profile": profile,
+}
+
+
+def wsgi_environ(scope):
+    """
+    Build a WSGI environ for a body-less ASGI HTTP request.
+    Args:
+        scope (dict): The ASGI connection scope.
+    Returns:
+        dict: The WSGI environ.
+    """
+
+    server = scope.get("server") or ("localhost", 80)
+    client = scope.get("client") or ("", 0)
+    environ = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": "",
+        "PATH_INFO": scope["path"].encode("utf-8").decode("latin-1"),
+        "QUERY_STRING": scope["query_string"].decode("latin-1"),
+        "SERVER_NAME": server[0],
+        "SERVER_PORT": str(server[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": client[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": True,
+        "wsgi.run_once": False,
+    }
+    for name, value in scope["headers"]:
+        key = name.decode("latin-1").upper().replace("-", "_")
+        if key not in ("CONTENT_TYPE", "CONTENT_LENGTH"):
+            key = f"HTTP_{key}"
+        value = value.decode("latin-1")
+        environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def open_session(environ):
+    """
+    Load the request's session without blocking the event loop.
+    The Postgres backend is read with the async pool, the signed cookie needs no I/O
+    and any other backend (Flask-Session) is opened in a worker thread.
+    Args:
+        environ (dict): The WSGI environ of the request.
+    Returns:
+        SessionMixin: The session.
+    """
+
+    interface = app.session_interface
+    req = app.request_class(environ)
+    if isinstance(interface, PostgresSessionInterface):
+        sid = interface.session_id(app, req)
+        row = None
+        if sid:
+            async with apool.connection() as conn:
+                cur = await conn.execute(interface.load_sql, (sid,))
+                row = await cur.fetchone()
+        return interface.session_from_row(app, sid, row)
+    if isinstance(interface, SecureCookieSessionInterface):
+        session = interface.open_session(app, req)
+    else:
+        session = await asyncio.to_thread(interface.open_session, app, req)
+    return session if session is not None else interface.make_null_session(app)
+
+
+def save_blocks(session):
+    """Whether saving the session does blocking I/O (Postgres write or Flask-Session)."""
+    interface = app.session_interface
+    if isinstance(interface, SecureCookieSessionInterface):
+        return False
+    if isinstance(interface, PostgresSessionInterface):
+        return session.modified or session.refresh or session.rotate
+    return True
+
+
+async def dispatch(view, environ, view_args):
+    """
+    Run an async view the way Flask runs a sync one: before_request, the view,
+    error handlers, after_request and saving the session.
+    Returns:
+        Response: The Flask response.
+    """
+
+    session = await open_session(environ)
+    with RequestContext(app, environ, session=session):
+        try:
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = await view(**view_args)
+            except Exception as e:
+                rv = app.handle_user_exception(e)
+            response = app.make_response(rv)
+            if save_blocks(session):
+                # Kontekst żądania jest kopiowany do wątku przez asyncio.to_thread
+                return await asyncio.to_thread(app.process_response, response)
+            return app.process_response(response)
+        except Exception as e:
+            return app.handle_exception(e)
+
+
+async def send_response(response, environ, send):
+    app_iter, status, headers = response.get_wsgi_response(environ)
+    try:
+        body = b"".join(app_iter)
+    finally:
+        if hasattr(app_iter, "close"):
+            app_iter.close()
+    await send({
+        "type": "http.response.start",
+        "status": int(status.split(" ", 1)[0]),
+        "headers": [(name.lower().encode("latin-1"), value.encode("latin-1")) for name, value in headers],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            await apool.open()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await apool.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+async def asgi_app(scope, receive, send):
+    """ASGI application: async views for ASYNC_VIEWS, the Flask app for everything else."""
+    if scope["type"] == "lifespan":
+        await lifespan(receive, send)
+        return
+    if scope["type"] == "http" and scope["method"] == "GET":
+        environ = wsgi_environ(scope)
+        try:
+            endpoint, view_args = app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            endpoint = None
+        view = ASYNC_VIEWS.get(endpoint)
+        if view is not None:
+            response = await dispatch(view, environ, view_args)
+            await send_response(response, environ, send)
+            return
+    await wsgi(scope, receive, send)
@@ -0,0 +1,112 @@
+"""
+Concurrency check for queries.apply_to_game.
+
+Creates a GM, one game without a chat room and --users applicants, then fires
+every application (each submitted --repeat times, like a double-clicked form)
+from --workers threads at once. Afterwards it checks that the game has exactly
+one chat room and every applicant exactly one waiting entry and one message.
+The created rows are deleted at the end.
+
+    python -m benchmarks.apply_concurrency --users 300 --workers 50
+"""
+import sys
+import time
+import argparse
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import db.queries as queries
+from db.pool import ConnectionPool
+from db.migrations.apply_migrations import connect_db
+from benchmarks.common import connect_kwargs
+
+
+def setup(conn, users):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO users (name, email, hash, filled_preferences)
+            SELECT 'bench_apply_' || i, 'bench_apply_' || i || '@example.com', 'x', true
+            FROM generate_series(0, %s) i
+            RETURNING id
+        """, (users,))
+        user_ids = sorted(row[0] for row in cur.fetchall())
+        gm_id, applicants = user_ids[0], user_ids[1:]
+        game_id = queries.add_game(cur, gm_id, "Bench apply", 4, None, "Concurrency check")
+    conn.commit()
+    return gm_id, game_id, applicants
+
+
+def cleanup(conn, game_id, user_ids):
+    with conn.cursor() as cur:
+        cur.execute("DELETE FROM chat_messages WHERE chatroom_id IN (SELECT id FROM chat_rooms WHERE game_id = %s)", (game_id,))
+        cur.execute("DELETE FROM waiting_for_accept WHERE chatroom_id IN (SELECT id FROM chat_rooms WHERE game_id = %s)", (game_id,))
+        cur.execute("DELETE FROM chat_rooms WHERE game_id = %s", (game_id,))
+        cur.execute("DELETE FROM games_posts WHERE id = %s", (game_id,))
+        cur.execute("DELETE FROM users WHERE id = ANY(%s)", (user_ids,))
+    conn.commit()
+
+
+def check(conn, game_id, applicants):
+    failures = []
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM chat_rooms WHERE game_id = %s", (game_id,))
+        rooms = [row[0] for row in cur.fetchall()]
+        if len(rooms) != 1:
+            failures.append(f"expected 1 chat room, found {len(rooms)}")
+            return failures
+        cur.execute("SELECT user_id, count(*) FROM waiting_for_accept WHERE chatroom_id = %s GROUP BY user_id", (rooms[0],))
+        waiting = dict(cur.fetchall())
+        cur.execute("SELECT user_id, count(*) FROM chat_messages WHERE chatroom_id = %s GROUP BY user_id", (rooms[0],))
+        messages = dict(cur.fetchall())
+    for user_id in applicants:
+        if waiting.get(user_id) != 1:
+            failures.append(f"user {user_id}: {waiting.get(user_id, 0)} waiting entries")
+        if messages.get(user_id) != 1:
+            failures.append(f"user {user_id}: {messages.get(user_id, 0)} messages")
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=300, help="number of applicants")
+    parser.add_argument("--repeat", type=int, default=2, help="submissions per applicant")
+    parser.add_argument("--workers", type=int, default=50, help="concurrent connections")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    gm_id, game_id, applicants = setup(conn, args.users)
+    pool = ConnectionPool(connect_kwargs(), minconn=0, maxconn=args.workers, timeout=60)
+    start_barrier = threading.Barrier(args.workers)
+
+    def apply(user_id):
+        with pool.connection() as worker_conn:
+            try:
+                start_barrier.wait(timeout=1)
+            except threading.BrokenBarrierError:
+                pass
+            with worker_conn.cursor() as cur:
+                result = queries.apply_to_game(cur, game_id, user_id, "Chcę dołączyć")
+            worker_conn.commit()
+            return result
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.workers) as executor:
+            results = list(executor.map(apply, applicants * args.repeat))
+        elapsed = time.perf_counter() - started
+        print(f"{len(results)} applications in {elapsed:.2f}s: {dict(Counter(results))}")
+        failures = check(conn, game_id, applicants)
+        expected = Counter({queries.APPLY_APPLIED: len(applicants),
+                            queries.APPLY_ALREADY_APPLIED: len(applicants) * (args.repeat - 1)})
+        if Counter(results) != expected:
+            failures.append(f"unexpected results {dict(Counter(results))}, expected {dict(expected)}")
+    finally:
+        pool.closeall()
+        cleanup(conn, game_id, [gm_id] + applicants)
+        conn.close()
+    if failures:
+        print("FAILED")
+        for failure in failures[:20]:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("OK: one chat room, one waiting entry and one message per applicant")
@@ -0,0 +1,84 @@
+import time
+import statistics
+from os import environ
+from config import ProdConfig, DevConfig
+
+
+def connect_kwargs():
+    """
+    Connection parameters of the configured database, for benchmarks that open their own pool.
+    Returns:
+        dict: Keyword arguments for psycopg2.connect.
+    """
+
+    config = ProdConfig if environ.get('FLASK_ENV', 'development') == 'production' else DevConfig
+    return dict(dbname=config.DBNAME, user=config.DBUSER, password=config.DBPASS,
+                host=config.DBHOST, port=config.DBPORT)
+
+
+class CountingCursor:
+    """Cursor wrapper counting executed statements."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.statements = 0
+
+    def execute(self, sql, params=None):
+        self.statements += 1
+        return self._cur.execute(sql, params)
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def percentile(samples, p):
+    """
+    Nearest-rank percentile.
+    Args:
+        samples (list): Measured values.
+        p (float): Percentile between 0 and 100.
+    Returns:
+        float: The percentile value, or 0.0 for no samples.
+    """
+
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    index = max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples):
+    """
+    Latency summary in milliseconds.
+    Args:
+        samples (list): Durations in seconds.
+    Returns:
+        dict: Count, mean, p50, p95 and p99 in milliseconds.
+    """
+
+    return {
+        "count": len(samples),
+        "mean_ms": statistics.fmean(samples) * 1000 if samples else 0.0,
+        "p50_ms": percentile(samples, 50) * 1000,
+        "p95_ms": percentile(samples, 95) * 1000,
+        "p99_ms": percentile(samples, 99) * 1000,
+    }
+
+
+def timed(function, repeat):
+    """
+    Call a function repeatedly and collect durations.
+    Args:
+        function (callable): Called without arguments.
+        repeat (int): Number of calls.
+    Returns:
+        list: Durations in seconds.
+    """
+
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        samples.append(time.perf_counter() - start)
+    return samples
@@ -0,0 +1,105 @@
+"""
+Render time of the game board with and without the fragment cache.
+
+Builds a board of --games synthetic games (no database needed) and times rendering
+every page of it (index.html, --page-size games per page):
+    before          - every card rendered by Jinja on every request, as before the cache
+    cold            - empty fragment cache: cards and grid rendered and stored
+    one changed     - one game's version changes each time: one card rendered, the grids reassembled
+    board hit       - the grids come from the cache, only the pages around them are rendered
+
+    python -m benchmarks.fragments --games 3000 --page-size 24 --repeat 20
+"""
+import argparse
+from flask import g, render_template
+from app import app
+from extensions import get_services
+from views.games import render_game_list, board_fragment_key
+from fragments import fragment_size
+from db.view_models import Game
+from benchmarks.common import summarize, timed
+
+
+def synthetic_games(count):
+    return [Game(
+        id=game_id,
+        title=f"Kampania {game_id}",
+        system_id=game_id % 10 + 1,
+        max_players=5,
+        description=("Drużyna wyrusza w góry, gdzie smok pilnuje starego skarbca. " * 6)[:300],
+        gm_id=game_id % 100 + 1,
+        accepted_players=game_id % 6,
+        version=1,
+    ) for game_id in range(count, 0, -1)]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=3000)
+    parser.add_argument("--page-size", type=int, default=app.config["GAMES_PAGE_SIZE"])
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--max-bytes", type=int, default=app.config["FRAGMENT_CACHE_MAX_BYTES"],
+                        help="fragment cache size; smaller than the board means evictions on every pass")
+    args = parser.parse_args()
+
+    fragments = get_services(app).fragments
+    fragments.max_bytes = args.max_bytes
+    games = synthetic_games(args.games)
+    pages = []
+    for start in range(0, len(games), args.page_size):
+        page_games = games[start:start + args.page_size]
+        before_id = games[start - 1].id if start else None
+        pages.append((page_games, {"before_id": before_id, "limit": args.page_size, "system_id": None,
+                                   "gm_id": None, "open_seats": False}))
+
+    with app.test_request_context("/"):
+        g.nonce = "benchmark-nonce"
+        # Dawny game_list.html: pętla po kartach w jednym szablonie
+        card_source = app.jinja_env.loader.get_source(app.jinja_env, "game_card.html")[0]
+        card_source = card_source.split("\n", 1)[1].rsplit("{% endmacro %}", 1)[0]
+        grid_source = app.jinja_env.loader.get_source(app.jinja_env, "game_list.html")[0]
+        uncached_grid = app.jinja_env.from_string(grid_source.replace(
+            "{% for card in cards %}{{card}}{% endfor %}", "{% for game in games %}" + card_source + "{% endfor %}"))
+
+        def page(game_list, filters):
+            return render_template("index.html", game_list=game_list, systems=[], filters=filters,
+                                   next_url=None, nonce=g.nonce)
+
+        def before():
+            for page_games, filters in pages:
+                page(uncached_grid.render(games=page_games, game_data=None), filters)
+
+        def board():
+            for page_games, filters in pages:
+                board_key = board_fragment_key(filters)
+                cached = fragments.get(board_key)
+                if cached is None:
+                    cached = render_game_list(page_games)
+                    fragments.set(board_key, cached, fragment_size(cached))
+                page(cached, filters)
+
+        def cold():
+            fragments.clear()
+            board()
+
+        def one_changed():
+            first_page = pages[0][0]
+            first_page[0] = first_page[0]._replace(version=first_page[0].version + 1)
+            fragments.bump("games")
+            board()
+
+        results = {}
+        # Naprzemiennie, żeby szum maszyny rozłożył się na wszystkie warianty
+        for _ in range(3):
+            for label, function in (("before", before), ("cold", cold), ("one changed", one_changed),
+                                    ("board hit", board)):
+                results.setdefault(label, []).extend(timed(function, args.repeat))
+        baseline = summarize(results["before"])["p50_ms"]
+        for label, samples in results.items():
+            result = summarize(samples)
+            print(f"{label:12} p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+                  f"{baseline / result['p50_ms']:6.1f}x")
+
+    stats = fragments.stats()
+    print(f"Fragment cache: {stats['size']} entries, {stats['bytes'] / 1024 / 1024:.1f} MiB "
+          f"of {stats['max_bytes'] / 1024 / 1024:.1f} MiB, {stats['evictions']} evictions")
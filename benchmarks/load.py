@@ -0,0 +1,132 @@
+"""
+Minimal asyncio HTTP/1.1 load generator for the benchmarks.
+
+Each virtual client keeps one keep-alive connection and sends its requests
+round-robin until the deadline, so thousands of concurrent clients fit in one
+process without a thread per client.
+"""
+import time
+import random
+import asyncio
+from collections import Counter
+from urllib.parse import urlencode
+
+
+async def read_response(reader):
+    """
+    Read one HTTP/1.1 response.
+    Returns:
+        tuple: Status code, headers dict (lower-case names) and body bytes.
+    """
+
+    head = await reader.readuntil(b"\r\n\r\n")
+    lines = head.decode("latin-1").split("\r\n")
+    status = int(lines[0].split(" ", 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        body = b""
+        while True:
+            size = int((await reader.readline()).strip(), 16)
+            chunk = await reader.readexactly(size + 2)
+            if size == 0:
+                break
+            body += chunk[:-2]
+    else:
+        body = await reader.readexactly(int(headers.get("content-length", 0)))
+    return status, headers, body
+
+
+def request_spec(spec):
+    """
+    Normalize a request description.
+    Args:
+        spec (str or tuple): A path to GET, or (name, method, path, form) where form
+            is a dict sent url-encoded (None for no body).
+    Returns:
+        tuple: Name used for the latency samples, method, path and body bytes.
+    """
+
+    if isinstance(spec, str):
+        return spec, "GET", spec, b""
+    name, method, path, form = spec
+    return name, method, path, urlencode(form).encode() if form else b""
+
+
+async def client(host, port, requests, headers, deadline, samples, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    extra = "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+    requests = [request_spec(spec) for spec in requests]
+    # Różne przesunięcia, żeby klienci nie trafiali jednocześnie w tę samą trasę
+    i = random.randrange(len(requests))
+    try:
+        while time.monotonic() < deadline:
+            name, method, path, body = requests[i % len(requests)]
+            i += 1
+            head = f"{method} {path} HTTP/1.1\r\nHost: {host}\r\n{extra}"
+            if body:
+                head += f"Content-Type: application/x-www-form-urlencoded\r\nContent-Length: {len(body)}\r\n"
+            start = time.perf_counter()
+            writer.write(head.encode("latin-1") + b"\r\n" + body)
+            try:
+                status, response_headers, _ = await read_response(reader)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                statuses["error"] += 1
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+                continue
+            samples.setdefault(name, []).append(time.perf_counter() - start)
+            statuses[status] += 1
+            if response_headers.get("connection") == "close":
+                writer.close()
+                reader, writer = await asyncio.open_connection(host, port)
+    finally:
+        writer.close()
+
+
+async def run_clients(host, port, clients, duration):
+    """
+    Drive a server with one keep-alive client per entry of `clients` for `duration` seconds.
+    Args:
+        host (str): Server host.
+        port (int): Server port.
+        clients (list): (requests, headers) per client; requests are request_spec() descriptions
+            cycled by the client, headers e.g. its session cookie.
+        duration (float): Seconds to run.
+    Returns:
+        dict: Latency samples per request name (seconds), status counts, request count and elapsed seconds.
+    """
+
+    samples = {}
+    statuses = Counter()
+    start = time.monotonic()
+    deadline = start + duration
+    await asyncio.gather(*(client(host, port, requests, headers or {}, deadline, samples, statuses)
+                           for requests, headers in clients))
+    elapsed = time.monotonic() - start
+    return {
+        "samples": samples,
+        "statuses": dict(statuses),
+        "requests": sum(len(s) for s in samples.values()),
+        "elapsed": elapsed,
+    }
+
+
+async def run_load(host, port, paths, concurrency, duration, headers=None):
+    """
+    Drive a server with `concurrency` keep-alive clients for `duration` seconds.
+    Args:
+        host (str): Server host.
+        port (int): Server port.
+        paths (list): Request paths, cycled by every client.
+        concurrency (int): Number of concurrent clients.
+        duration (float): Seconds to run.
+        headers (dict, optional): Extra request headers, e.g. a session cookie.
+    Returns:
+        dict: Latency samples per path (seconds), status counts, request count and elapsed seconds.
+    """
+
+    return await run_clients(host, port, [(paths, headers)] * concurrency, duration)
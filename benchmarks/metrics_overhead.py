@@ -0,0 +1,53 @@
+"""
+Cost of the /metrics instrumentation per query.
+
+Times queries.get_game_by_id on a plain psycopg2 connection and on one made by
+metrics.timed_connection_factory, then the bare Histogram.observe call (the
+request hooks make one observe per request). Use a database with games, e.g.
+after `python -m db.explain_queries --seed`.
+
+    python -m benchmarks.metrics_overhead --repeat 5000
+"""
+import argparse
+from psycopg2 import connect
+import db.queries as queries
+from metrics import Metrics, timed_connection_factory, QUERY_BUCKETS
+from benchmarks.common import connect_kwargs, summarize, timed
+
+
+def query_samples(conn, game_id, repeat):
+    with conn.cursor() as cur:
+        return timed(lambda: queries.get_game_by_id(cur, game_id), repeat)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5000)
+    args = parser.parse_args()
+
+    registry = Metrics()
+    histogram = registry.histogram("bench_seconds", "Benchmark.", ("query",), QUERY_BUCKETS)
+    timed_factory = timed_connection_factory(lambda name, seconds, rows: histogram.observe(seconds, name))
+
+    plain = connect(**connect_kwargs())
+    instrumented = connect(connection_factory=timed_factory, **connect_kwargs())
+    with plain.cursor() as cur:
+        cur.execute("SELECT min(id) FROM games_posts")
+        game_id = cur.fetchone()[0]
+    if game_id is None:
+        raise SystemExit("No games in the database; seed it first")
+
+    results = {}
+    # Naprzemiennie, żeby szum maszyny rozłożył się na oba warianty
+    for _ in range(3):
+        for label, conn in (("plain connection", plain), ("timed connection", instrumented)):
+            results.setdefault(label, []).extend(query_samples(conn, game_id, args.repeat))
+    for label, samples in results.items():
+        result = summarize(samples)
+        print(f"{label:28} p50 {result['p50_ms'] * 1000:8.1f} us  mean {result['mean_ms'] * 1000:8.1f} us")
+
+    result = summarize(timed(lambda: histogram.observe(0.003, "queries.get_game_by_id"), args.repeat * 10))
+    print(f"{'Histogram.observe':28} p50 {result['p50_ms'] * 1000:8.2f} us  mean {result['mean_ms'] * 1000:8.2f} us")
+
+    plain.close()
+    instrumented.close()
@@ -0,0 +1,73 @@
+"""
+Profile page loader benchmark: the old five-query path against get_profile_view.
+
+Creates a throwaway GM/player with --games games in each role inside a
+transaction that is rolled back at the end, so it can run against any
+development database.
+
+    python -m benchmarks.profile_loader --games 500 --repeat 200
+"""
+import argparse
+import db.queries as queries
+from db.migrations.apply_migrations import connect_db
+from benchmarks.common import CountingCursor, summarize, timed
+
+
+def seed_user(cur, games):
+    cur.execute("""
+        INSERT INTO users (name, email, hash, filled_preferences)
+        VALUES ('bench_profile', 'bench_profile@example.com', 'x', true),
+               ('bench_profile_gm', 'bench_profile_gm@example.com', 'x', true)
+        RETURNING id
+    """)
+    user_id, other_gm = [row[0] for row in cur.fetchall()]
+    cur.execute("INSERT INTO players (user_id) VALUES (%s)", (user_id,))
+    cur.execute("INSERT INTO gms (user_id) VALUES (%s)", (user_id,))
+    cur.execute("""
+        INSERT INTO games_posts (title, system_id, max_players, description, gm_id, accepted_players)
+        SELECT 'Bench game ' || i, NULL, 4, repeat('Opis. ', 100), CASE WHEN i %% 2 = 0 THEN %s ELSE %s END, 0
+        FROM generate_series(1, %s) i
+    """, (user_id, other_gm, games * 2))
+    cur.execute("""
+        INSERT INTO chat_rooms (game_id) SELECT id FROM games_posts WHERE gm_id = %s
+    """, (other_gm,))
+    cur.execute("""
+        INSERT INTO users_in_chat (chatroom_id, user_id)
+        SELECT r.id, %s FROM chat_rooms r JOIN games_posts g ON g.id = r.game_id WHERE g.gm_id = %s
+    """, (user_id, other_gm))
+    cur.execute("ANALYZE games_posts, chat_rooms, users_in_chat")
+    return user_id
+
+
+def old_profile(cur, user_id):
+    user_profile = queries.get_user_profile(cur, user_id)._asdict()
+    user_profile["player"] = queries.get_user_player_status(cur, user_id)
+    player_games = queries.fetch_all_players_games(cur, user_id) if user_profile["player"] else None
+    user_profile["gm"] = queries.get_user_gm_status(cur, user_id)
+    gm_games = queries.fetch_all_gm_games(cur, user_id) if user_profile["gm"] else None
+    return user_profile, player_games, gm_games
+
+
+def new_profile(cur, user_id):
+    return queries.get_profile_view(cur, user_id)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--games", type=int, default=500, help="games per role for the benchmark user")
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    conn = connect_db()
+    try:
+        with conn.cursor() as raw:
+            user_id = seed_user(raw, args.games)
+            for label, loader in (("5 queries", old_profile), ("get_profile_view", new_profile)):
+                cur = CountingCursor(raw)
+                loader(cur, user_id)
+                samples = timed(lambda: loader(raw, user_id), args.repeat)
+                stats = summarize(samples)
+                print(f"{label:18} queries={cur.statements} "
+                      f"mean={stats['mean_ms']:.2f}ms p50={stats['p50_ms']:.2f}ms p95={stats['p95_ms']:.2f}ms")
+    finally:
+        conn.rollback()
+        conn.close()
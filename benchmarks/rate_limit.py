@@ -0,0 +1,40 @@
+"""
+Latency of a rate limit check with each backend of ratelimit.py.
+
+Every check takes a token from an IP bucket and a user bucket, cycling through
+--clients clients, like a request to a route decorated with @rate_limited. Requires
+the rate_limits table (db/migrations/add_rate_limits181026.sql) for the Postgres
+run; its buckets are deleted at the end.
+
+    python -m benchmarks.rate_limit --repeat 5000 --clients 1000
+"""
+import argparse
+import itertools
+from db.pool import ConnectionPool
+from ratelimit import TokenBucketLimiter, PostgresRateLimiter
+from benchmarks.common import connect_kwargs, summarize, timed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5000)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--backends", default="memory,postgres")
+    args = parser.parse_args()
+    pool = ConnectionPool(connect_kwargs(), minconn=1, maxconn=2)
+    for backend in args.backends.split(","):
+        limiter = PostgresRateLimiter(pool) if backend == "postgres" else TokenBucketLimiter()
+        clients = itertools.cycle(range(args.clients))
+
+        def check():
+            client = next(clients)
+            limiter.check([f"bench:ip:10.0.{client // 256}.{client % 256}", f"bench:user:{client}"], 10 / 60, 5)
+
+        stats = summarize(timed(check, args.repeat))
+        print(f"{backend:9} mean={stats['mean_ms']:.4f}ms p50={stats['p50_ms']:.4f}ms p95={stats['p95_ms']:.4f}ms")
+    if "postgres" in args.backends:
+        with pool.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM rate_limits WHERE key LIKE 'bench:%'")
+            conn.commit()
+    pool.closeall()
@@ -0,0 +1,120 @@
+"""
+Memory and latency of large result sets: SELECT * with DictCursor rows against the
+narrow projections and row types of db/queries.py.
+
+For the game board and a chat room's history, --rows rows are fetched four ways:
+SELECT * or the projection, into DictCursor rows or into tuples (made into the
+row types of db/view_models.py by the query functions of queries.py for the
+projection). Memory is what the fetched rows keep allocated (tracemalloc, while
+the list is held) and the peak while fetching.
+
+The games come from the database (seed it first, e.g. `python -m db.explain_queries
+--seed`); the chat room with --rows messages is created inside a transaction that
+is rolled back at the end.
+
+    python -m benchmarks.rows --rows 5000 --repeat 20
+"""
+import gc
+import argparse
+import tracemalloc
+from psycopg2 import connect
+from psycopg2.extras import DictCursor
+import db.queries as queries
+from benchmarks.common import connect_kwargs, summarize, timed
+
+OLD_GAMES_SQL = "SELECT * FROM games_posts ORDER BY id DESC LIMIT %s"
+OLD_MESSAGES_SQL = """
+    SELECT * FROM chat_messages WHERE chatroom_id = %s ORDER BY timestamp DESC, id DESC LIMIT %s
+"""
+
+
+def workloads(chatroom_id, rows):
+    """
+    Ways of fetching each result set, as (label, cursor_factory, loader) per workload.
+    Returns:
+        dict: Workload name to its variants.
+    """
+
+    def select_all(sql, params):
+        def load(cur):
+            cur.execute(sql, params)
+            return cur.fetchall()
+        return load
+
+    games_sql, games_params = queries.games_page_query(None, rows, None, None, False)
+    games = lambda cur: queries.get_games_page(cur, limit=rows)[0]
+    messages = lambda cur: queries.fetch_messages(cur, chatroom_id, limit=rows)
+    return {
+        "games": [
+            ("SELECT * + DictCursor", DictCursor, select_all(OLD_GAMES_SQL, (rows,))),
+            ("SELECT * + tuples", None, select_all(OLD_GAMES_SQL, (rows,))),
+            ("projection + DictCursor", DictCursor, select_all(games_sql, games_params)),
+            ("projection + Game", None, games),
+        ],
+        "messages": [
+            ("SELECT * + DictCursor", DictCursor, select_all(OLD_MESSAGES_SQL, (chatroom_id, rows))),
+            ("SELECT * + tuples", None, select_all(OLD_MESSAGES_SQL, (chatroom_id, rows))),
+            ("projection + DictCursor", DictCursor, select_all(queries.MESSAGES_SQL, (chatroom_id, rows))),
+            ("projection + ChatMessage", None, messages),
+        ],
+    }
+
+
+def seed_chatroom(cur, messages):
+    """
+    Create a chat room (not tied to a game) with `messages` messages from the last minutes.
+    Returns:
+        int: The chat room's id.
+    """
+
+    cur.execute("INSERT INTO chat_rooms (game_id) VALUES (NULL) RETURNING id")
+    chatroom_id = cur.fetchone()[0]
+    cur.execute("SELECT create_chat_partitions((localtimestamp - interval '1 day')::timestamp, localtimestamp::timestamp)")
+    cur.execute("""
+        INSERT INTO chat_messages (chatroom_id, user_id, message, timestamp)
+        SELECT %s, NULL, 'Wiadomość testowa numer ' || i || '. ' || repeat('Treść. ', 10),
+               localtimestamp - i * interval '10 milliseconds'
+        FROM generate_series(1, %s) i
+    """, (chatroom_id, messages))
+    return chatroom_id
+
+
+def retained_memory(conn, cursor_factory, load):
+    """
+    Memory allocated by a fetch: what the rows keep and the peak while fetching.
+    Returns:
+        tuple: Retained bytes, peak bytes and the number of rows.
+    """
+
+    with conn.cursor(cursor_factory=cursor_factory) as cur:
+        gc.collect()
+        tracemalloc.start()
+        try:
+            result = load(cur)
+            # Wynik libpq nie jest liczony (pamięć C), tylko obiekty Pythona wierszy
+            retained, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    return retained, peak, len(result)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    conn = connect(**connect_kwargs())
+    with conn.cursor() as cur:
+        chatroom_id = seed_chatroom(cur, args.rows)
+
+    for name, variants in workloads(chatroom_id, args.rows).items():
+        print(f"{name}:")
+        for label, cursor_factory, load in variants:
+            retained, peak, count = retained_memory(conn, cursor_factory, load)
+            with conn.cursor(cursor_factory=cursor_factory) as cur:
+                result = summarize(timed(lambda: load(cur), args.repeat))
+            print(f"    {label:26} {count:6} rows  {retained / max(count, 1):7.0f} B/row kept  "
+                  f"peak {peak / 1024 / 1024:6.1f} MiB  p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms")
+    conn.rollback()
+    conn.close()
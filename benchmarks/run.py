@@ -0,0 +1,379 @@
+"""
+Load-test suite for the app's routes, with a regression check against a baseline.
+
+Starts a throwaway Postgres (initdb + pg_ctl in a temporary directory, unix socket
+only), creates the schema and applies the migrations, seeds users, games, chat
+rooms and messages, starts the app under gunicorn (or asgi.py under uvicorn) and
+runs each traffic scenario against it:
+
+    anonymous   board pages, game details (single and batch), the login form
+    logged_in   board, profile, game details, chat history, applying for a game
+    mixed       70% anonymous and 28% logged-in clients, the rest logging in
+
+Results (p50/p95/p99 per route and scenario, throughput, status counts) are
+written as JSON. With --baseline the results are compared against an earlier
+run and the command exits with status 1 when a latency percentile grew, or the
+throughput dropped, by more than --tolerance. Needs initdb and pg_ctl on PATH
+(or --pg-bin) and gunicorn; Postgres refuses to run as root.
+
+    python -m benchmarks.run --output bench.json --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --output bench.json --baseline benchmarks/baseline.json
+    python -m benchmarks.run --compare bench.json --baseline benchmarks/baseline.json
+"""
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+from datetime import datetime, timezone
+from urllib.parse import urlencode
+import bcrypt
+from psycopg2 import connect
+from db.models import create_tables
+from db.explain_queries import SEED_SQL
+from benchmarks.common import summarize
+from benchmarks.load import run_clients
+from benchmarks.serving_modes import HOST, server_command, wait_for_port, request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PASSWORD = "bench_password"
+DBNAME = "bench"
+
+SCENARIOS = {
+    "anonymous": {"anonymous": 1.0},
+    "logged_in": {"logged_in": 1.0},
+    "mixed": {"anonymous": 0.70, "logged_in": 0.28, "login": 0.02},
+}
+
+
+class ThrowawayPostgres:
+    """
+    Postgres cluster in a temporary directory, listening only on a unix socket there.
+    Args:
+        bin_dir (str, optional): Directory with initdb and pg_ctl; PATH is searched by default.
+    """
+
+    def __init__(self, bin_dir=None):
+        self.bin_dir = bin_dir
+        self.dir = None
+
+    def _bin(self, name):
+        path = os.path.join(self.bin_dir, name) if self.bin_dir else shutil.which(name)
+        if not path:
+            raise SystemExit(f"{name} not found; put the Postgres bin directory on PATH or pass --pg-bin")
+        return path
+
+    def start(self):
+        self.dir = tempfile.mkdtemp(prefix="ttrpg_bench_")
+        data = os.path.join(self.dir, "data")
+        subprocess.run([self._bin("initdb"), "-D", data, "-U", "postgres", "-A", "trust", "-E", "UTF8",
+                        "--no-sync"], check=True, stdout=subprocess.DEVNULL)
+        subprocess.run([self._bin("pg_ctl"), "-D", data, "-l", os.path.join(self.dir, "postgres.log"), "-w",
+                        "-o", f"-c listen_addresses='' -k {self.dir}", "start"], check=True, stdout=subprocess.DEVNULL)
+        conn = connect(dbname="postgres", user="postgres", host=self.dir)
+        conn.autocommit = True
+        with conn.cursor() as cur:
+            cur.execute(f"CREATE DATABASE {DBNAME}")
+        conn.close()
+        return {"DBNAME": DBNAME, "DBUSER": "postgres", "DBPASS": "", "DBHOST": self.dir, "DBPORT": "5432"}
+
+    def stop(self):
+        if self.dir is None:
+            return
+        subprocess.run([self._bin("pg_ctl"), "-D", os.path.join(self.dir, "data"), "-m", "fast", "-w", "stop"],
+                       stdout=subprocess.DEVNULL)
+        shutil.rmtree(self.dir, ignore_errors=True)
+        self.dir = None
+
+
+def db_connect(db_env):
+    return connect(dbname=db_env["DBNAME"], user=db_env["DBUSER"], password=db_env["DBPASS"],
+                   host=db_env["DBHOST"], port=db_env["DBPORT"])
+
+
+def prepare_database(db_env, args):
+    """
+    Create the schema, apply the migrations and seed the database.
+    Returns:
+        dict: The seed sizes.
+    """
+
+    conn = db_connect(db_env)
+    create_tables(conn)
+    subprocess.run([sys.executable, "-m", "db.migrations.apply_migrations"], cwd=ROOT,
+                   env=dict(os.environ, **db_env), check=True, stdout=subprocess.DEVNULL)
+
+    seed = {"users": args.users, "games": args.games, "messages": args.messages}
+    start = time.monotonic()
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM users)")
+        if cur.fetchone()[0]:
+            raise SystemExit("The benchmark database must be empty")
+        for sql in SEED_SQL:
+            cur.execute(sql, seed)
+        # Jeden hash dla wszystkich: logowanie kosztuje tyle, co na produkcji, a seed nie liczy bcrypta N razy
+        password_hash = bcrypt.hashpw(PASSWORD.encode(), bcrypt.gensalt(args.bcrypt_rounds)).decode()
+        cur.execute("UPDATE users SET hash = %s", (password_hash,))
+    conn.commit()
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute("VACUUM ANALYZE")
+    conn.close()
+    print(f"Seeded {seed} in {time.monotonic() - start:.1f}s")
+    return seed
+
+
+def sample_ids(db_env, count):
+    """
+    Pick games and users for the requests.
+    Returns:
+        tuple: Game ids, a board cursor for the second page and user names.
+    """
+
+    conn = db_connect(db_env)
+    with conn.cursor() as cur:
+        cur.execute("SELECT id FROM games_posts ORDER BY random() LIMIT %s", (count,))
+        game_ids = [row[0] for row in cur.fetchall()]
+        cur.execute("SELECT id FROM games_posts ORDER BY id DESC OFFSET 24 LIMIT 1")
+        row = cur.fetchone()
+        cursor = row[0] + 1 if row else None
+        cur.execute("SELECT name FROM users ORDER BY random() LIMIT %s", (count,))
+        names = [row[0] for row in cur.fetchall()]
+    conn.close()
+    return game_ids, cursor, names
+
+
+def log_in(port, name):
+    """
+    Log a seeded user in.
+    Returns:
+        str: The Cookie header value of the session.
+    """
+
+    response, _ = request(port, "POST", "/login", urlencode({"user": name, "password": PASSWORD}),
+                          {"Content-Type": "application/x-www-form-urlencoded"})
+    cookie = response.getheader("Set-Cookie")
+    if response.status != 302 or not cookie:
+        raise SystemExit(f"Login of {name} failed with {response.status}")
+    return cookie.split(";", 1)[0]
+
+
+def client_requests(kind, rng, game_ids, cursor, names):
+    """
+    Requests one client of the given kind cycles through; route weights come from repetition.
+    Returns:
+        list: request_spec() descriptions.
+    """
+
+    games = rng.sample(game_ids, min(len(game_ids), 10))
+    if kind == "anonymous":
+        requests = ["/"] * 4
+        if cursor is not None:
+            requests += [("GET /?before", "GET", f"/?before={cursor}", None)] * 2
+        requests += [("GET /game_data/<id>", "GET", f"/game_data/{game_id}", None) for game_id in games[:3]]
+        requests += [("GET /game_data?ids", "GET", "/game_data?ids=" + ",".join(map(str, games)), None)] * 2
+        requests += [("GET /login", "GET", "/login", None)]
+    elif kind == "logged_in":
+        requests = ["/"] * 3 + ["/profile"] * 2
+        requests += [("GET /game_data/<id>", "GET", f"/game_data/{game_id}", None) for game_id in games[:2]]
+        requests += [("GET /game_chat/<id>", "GET", f"/game_chat/{game_id}", None) for game_id in games[2:5]]
+        requests += [("GET /apply_for_game/<id>", "GET", f"/apply_for_game/{games[5]}", None),
+                     ("POST /apply_for_game/<id>", "POST", f"/apply_for_game/{games[6]}",
+                      {"message": "Chętnie dołączę"})]
+    else:
+        requests = [("POST /login", "POST", "/login", {"user": rng.choice(names), "password": PASSWORD})]
+    rng.shuffle(requests)
+    return requests
+
+
+def scenario_clients(mix, concurrency, rng, game_ids, cursor, names, cookies):
+    counts = {kind: int(round(share * concurrency)) for kind, share in mix.items()}
+    for kind, share in mix.items():
+        counts[kind] = max(counts[kind], 1 if share else 0)
+    clients = []
+    for kind, count in counts.items():
+        for i in range(count):
+            headers = {"Cookie": cookies[i % len(cookies)]} if kind == "logged_in" else {}
+            clients.append((client_requests(kind, rng, game_ids, cursor, names), headers))
+    return clients
+
+
+def run_scenario(port, clients, args):
+    asyncio.run(run_clients(HOST, port, clients, args.warmup))
+    result = asyncio.run(run_clients(HOST, port, clients, args.duration))
+    all_samples = [s for samples in result["samples"].values() for s in samples]
+    routes = {}
+    for name, samples in sorted(result["samples"].items()):
+        routes[name] = dict(summarize(samples), throughput_rps=len(samples) / result["elapsed"])
+    return {
+        "clients": len(clients),
+        "throughput_rps": result["requests"] / result["elapsed"],
+        "requests": result["requests"],
+        "statuses": {str(status): count for status, count in result["statuses"].items()},
+        "overall": summarize(all_samples),
+        "routes": routes,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind((HOST, 0))
+        return s.getsockname()[1]
+
+
+def run_benchmarks(args):
+    postgres = None
+    if args.use_configured_db:
+        db_env = {name: os.environ.get(name, "") for name in ("DBNAME", "DBUSER", "DBPASS", "DBHOST", "DBPORT")}
+    else:
+        postgres = ThrowawayPostgres(args.pg_bin)
+        db_env = postgres.start()
+    server = None
+    try:
+        seed = prepare_database(db_env, args)
+        game_ids, cursor, names = sample_ids(db_env, max(args.sessions, 50))
+        port = free_port()
+        env = dict(os.environ, **db_env, FLASK_ENV="production", BCRYPT_LOG_ROUNDS=str(args.bcrypt_rounds),
+                   SECRET_KEY=os.environ.get("SECRET_KEY") or os.urandom(16).hex(),
+                   SESSION_COOKIE_NAME=os.environ.get("SESSION_COOKIE_NAME") or "session",
+                   DB_POOL_MAX=str(args.connections), ASYNC_DB_POOL_MAX=str(args.connections),
+                   # Cały ruch idzie z jednego IP; limity zamieniłyby logowania i zgłoszenia w 429
+                   RATE_LIMIT_ENABLED="0")
+        server = subprocess.Popen(server_command(args.server, port, args.workers, args.connections), cwd=ROOT, env=env)
+        wait_for_port(port)
+        cookies = [log_in(port, name) for name in names[:args.sessions]]
+
+        results = {
+            "meta": {
+                "started": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "commit": git_commit(),
+                "server": args.server,
+                "workers": args.workers,
+                "connections": args.connections,
+                "concurrency": args.concurrency,
+                "duration": args.duration,
+                "bcrypt_rounds": args.bcrypt_rounds,
+                "seed": seed,
+                "cpus": os.cpu_count(),
+            },
+            "scenarios": {},
+        }
+        rng = random.Random(args.random_seed)
+        for name in args.scenarios.split(","):
+            clients = scenario_clients(SCENARIOS[name], args.concurrency, rng, game_ids, cursor, names, cookies)
+            result = results["scenarios"][name] = run_scenario(port, clients, args)
+            overall = result["overall"]
+            print(f"{name:10} {result['throughput_rps']:8.0f} req/s  p50 {overall['p50_ms']:7.1f} ms  "
+                  f"p95 {overall['p95_ms']:7.1f} ms  p99 {overall['p99_ms']:7.1f} ms  {result['statuses']}")
+            for route, stats in result["routes"].items():
+                print(f"    {route:28} {stats['throughput_rps']:7.0f} req/s  p50 {stats['p50_ms']:7.1f} ms  "
+                      f"p95 {stats['p95_ms']:7.1f} ms  p99 {stats['p99_ms']:7.1f} ms")
+        return results
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if postgres is not None:
+            postgres.stop()
+
+
+def compare(current, baseline, tolerance, min_delta_ms):
+    """
+    Compare two result files.
+    Args:
+        current (dict): Results of this run.
+        baseline (dict): Stored results.
+        tolerance (float): Allowed relative change, e.g. 0.15 for 15%.
+        min_delta_ms (float): Latency changes smaller than this are noise.
+    Returns:
+        list: Descriptions of the regressions.
+    """
+
+    regressions = []
+    for name, scenario in current["scenarios"].items():
+        base = baseline["scenarios"].get(name)
+        if base is None:
+            continue
+        if scenario["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{name}: throughput {base['throughput_rps']:.0f} -> {scenario['throughput_rps']:.0f} req/s")
+        routes = dict(scenario["routes"], overall=scenario["overall"])
+        base_routes = dict(base["routes"], overall=base["overall"])
+        for route, stats in routes.items():
+            if route not in base_routes:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                old, new = base_routes[route][key], stats[key]
+                if new > old * (1 + tolerance) and new - old > min_delta_ms:
+                    regressions.append(f"{name} {route}: {key[:3]} {old:.1f} -> {new:.1f} ms")
+    return regressions
+
+
+def load_json(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def write_json(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"Wrote {path}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=20000)
+    parser.add_argument("--games", type=int, default=20000)
+    parser.add_argument("--messages", type=int, default=200000, help="chat messages in total")
+    parser.add_argument("--scenarios", default="anonymous,logged_in,mixed", help="comma separated: " + ", ".join(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of measured load per scenario")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unmeasured load per scenario")
+    parser.add_argument("--sessions", type=int, default=20, help="logged-in users shared by the logged-in clients")
+    parser.add_argument("--server", choices=("wsgi", "asgi"), default="wsgi")
+    parser.add_argument("--workers", type=int, default=2, help="server worker processes")
+    parser.add_argument("--connections", type=int, default=16,
+                        help="database connections (and gunicorn threads) per worker")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12, help="cost of the seeded password hashes")
+    parser.add_argument("--random-seed", type=int, default=1, help="seed for picking request targets")
+    parser.add_argument("--pg-bin", help="directory with initdb and pg_ctl")
+    parser.add_argument("--use-configured-db", action="store_true",
+                        help="seed the (empty) database from DBNAME/DBHOST/... instead of a throwaway one")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--save-baseline", help="also write the results to this baseline file")
+    parser.add_argument("--baseline", help="compare the results against this file")
+    parser.add_argument("--compare", help="don't run; compare this results file against --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.15, help="allowed relative regression")
+    parser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore latency changes below this")
+    args = parser.parse_args()
+
+    if args.compare:
+        if not args.baseline:
+            parser.error("--compare needs --baseline")
+        results = load_json(args.compare)
+    else:
+        results = run_benchmarks(args)
+        if args.output:
+            write_json(args.output, results)
+        if args.save_baseline:
+            write_json(args.save_baseline, results)
+    if args.baseline:
+        regressions = compare(results, load_json(args.baseline), args.tolerance, args.min_delta_ms)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+        print("No regressions against the baseline")
@@ -0,0 +1,84 @@
+"""
+Latency of queries.search_games on a large synthetic board.
+
+Fills games_posts with POSTS posts written from a Polish word list, where word
+frequency is skewed so that a few words appear in most posts, plus a long tail
+of rare place names in the titles, then times searches for common, medium and rare words, multi-word and
+prefix queries, with and without the system filter. Use a throwaway database
+with users and systems (e.g. after `python -m db.explain_queries --seed`).
+
+    python -m benchmarks.search --posts 1000000 --repeat 50
+"""
+import argparse
+from psycopg2 import connect
+import db.queries as queries
+from benchmarks.common import connect_kwargs, summarize, timed
+
+WORDS = [
+    "gra", "sesja", "kampania", "gracz", "postać", "przygoda", "drużyna", "świat", "miasto", "magia",
+    "smok", "lochy", "zamek", "las", "potwór", "skarb", "bohater", "wojna", "królestwo", "demon",
+    "horror", "śledztwo", "kosmos", "statek", "cyberpunk", "wampir", "wilkołak", "kult", "bóg", "klątwa",
+    "pustynia", "góry", "morze", "pirat", "złodziej", "mag", "kapłan", "rycerz", "elf", "krasnolud",
+    "nekromanta", "artefakt", "portal", "labirynt", "intryga", "dwór", "spisek", "zaraza", "mroźny", "czarnoksiężnik",
+]
+
+# Nazwy miejsc z trzech sylab: długi ogon rzadkich słów (ok. 1 na 8000 ogłoszeń każde)
+SYLLABLES = ["ka", "ro", "mi", "za", "wo", "le", "dra", "gor", "sta", "nie",
+             "bo", "ry", "ła", "ści", "wę", "ta", "ku", "ny", "go", "sze"]
+
+SEED_SQL = """
+    INSERT INTO games_posts (title, system_id, max_players, description, gm_id, accepted_players)
+    SELECT
+        initcap(w[1 + floor(power(random(), 2) * %(n)s)::int]) || ' ' || initcap(
+            s[1 + floor(random() * %(s)s)::int] || s[1 + floor(random() * %(s)s)::int] || s[1 + floor(random() * %(s)s)::int]),
+        (SELECT min(id) FROM systems) + i %% 7,
+        4 + i %% 3,
+        (SELECT string_agg(d.w[1 + floor(power(random(), 4) * %(n)s)::int], ' ')
+         FROM generate_series(1, 30 + i %% 20), (SELECT %(words)s::text[] AS w) d),
+        (SELECT min(id) FROM users),
+        0
+    FROM generate_series(1, %(posts)s) i, (SELECT %(words)s::text[] AS w, %(syllables)s::text[] AS s) words
+"""
+
+QUERIES = [
+    ("common word", "gra", None),
+    ("common word, system filter", "gra", 2),
+    ("less common word", "czarnoksiężnik", None),
+    ("rare word", "dragorsta", None),
+    ("rare word, system filter", "dragorsta", 2),
+    ("two words", "smok lochy", None),
+    ("prefix (inflection)", "smok", None),
+    ("no match", "xyzzy", None),
+]
+
+
+def seed(conn, posts):
+    with conn.cursor() as cur:
+        cur.execute(SEED_SQL, {"posts": posts, "words": WORDS, "n": len(WORDS),
+                               "syllables": SYLLABLES, "s": len(SYLLABLES)})
+        cur.execute("ANALYZE games_posts")
+    conn.commit()
+    print(f"Inserted {posts} posts")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--posts", type=int, default=1000000, help="posts to insert first (0 to skip)")
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    conn = connect(**connect_kwargs())
+    if args.posts:
+        seed(conn, args.posts)
+    with conn.cursor() as cur:
+        cur.execute("SELECT count(*) FROM games_posts")
+        print(f"{cur.fetchone()[0]} posts")
+        for label, text, system_id in QUERIES:
+            cur.execute("SELECT count(*) FROM games_posts, to_tsquery(%s::regconfig, %s) q WHERE search_vector @@ q",
+                        (queries.SEARCH_CONFIG, queries.search_query_text(text)))
+            matches = cur.fetchone()[0]
+            strategy = queries.search_strategy(cur, queries.search_words(text))
+            result = summarize(timed(lambda: queries.search_games(cur, text, system_id=system_id), args.repeat))
+            print(f"{label:28} {matches:8} matches  {strategy:6}  "
+                  f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms")
+    conn.close()
@@ -0,0 +1,131 @@
+"""
+Load comparison of the two serving modes on one machine.
+
+Starts the Flask app under gunicorn (threaded workers, psycopg2 pool) and asgi.py
+under uvicorn (asyncio pool) with the same number of worker processes and database
+connections per worker, then drives the async routes (game board, game data, chat
+history and profile) as a logged-in user with many concurrent keep-alive clients.
+Needs gunicorn, uvicorn and a database with games, e.g. after
+`python -m db.explain_queries --seed`.
+
+    python -m benchmarks.serving_modes --concurrency 500 --duration 20 --workers 2
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import argparse
+import subprocess
+import http.client
+from urllib.parse import urlencode
+from benchmarks.common import summarize
+from benchmarks.load import run_load
+
+HOST = "127.0.0.1"
+USER = "bench_serving"
+PASSWORD = "bench_serving_password"
+
+
+def server_command(mode, port, workers, connections):
+    if mode == "wsgi":
+        return [sys.executable, "-m", "gunicorn", "app:app", "-b", f"{HOST}:{port}", "-w", str(workers),
+                "-k", "gthread", "--threads", str(connections), "--backlog", "4096", "--log-level", "warning"]
+    return [sys.executable, "-m", "uvicorn", "asgi:asgi_app", "--host", HOST, "--port", str(port),
+            "--workers", str(workers), "--backlog", "4096", "--log-level", "warning", "--no-access-log"]
+
+
+def wait_for_port(port, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection((HOST, port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise SystemExit(f"Server on port {port} didn't start")
+
+
+def request(port, method, path, body=None, headers=None):
+    conn = http.client.HTTPConnection(HOST, port, timeout=30)
+    conn.request(method, path, body=body, headers=headers or {})
+    response = conn.getresponse()
+    data = response.read()
+    conn.close()
+    return response, data
+
+
+def log_in(port):
+    """
+    Register the benchmark user if needed and log in.
+    Returns:
+        str: The Cookie header value of the logged-in session.
+    """
+
+    form = {"Content-Type": "application/x-www-form-urlencoded"}
+    request(port, "POST", "/register", urlencode({"username": USER, "email": f"{USER}@example.com",
+                                                  "password": PASSWORD, "confirmation": PASSWORD}), form)
+    response, _ = request(port, "POST", "/login", urlencode({"user": USER, "password": PASSWORD}), form)
+    cookie = response.getheader("Set-Cookie")
+    if not cookie:
+        raise SystemExit("Login failed")
+    return cookie.split(";", 1)[0]
+
+
+def benchmark_paths(port, cookie):
+    _, data = request(port, "GET", "/api/games?limit=20")
+    games = json.loads(data)
+    ids = [game["id"] for game in games["games"]]
+    if not ids:
+        raise SystemExit("No games in the database; seed it first")
+    paths = ["/", f"/?before={games['next_cursor'] or ids[-1]}", "/profile"]
+    for game_id in ids[:5]:
+        paths += [f"/game_data/{game_id}", f"/game_chat/{game_id}"]
+    return paths
+
+
+def run_mode(mode, args, port):
+    env = dict(os.environ, DB_POOL_MAX=str(args.connections), ASYNC_DB_POOL_MAX=str(args.connections))
+    server = subprocess.Popen(server_command(mode, port, args.workers, args.connections), env=env)
+    try:
+        wait_for_port(port)
+        cookie = log_in(port)
+        paths = benchmark_paths(port, cookie)
+        headers = {"Cookie": cookie}
+        asyncio.run(run_load(HOST, port, paths, args.concurrency, args.warmup, headers))
+        result = asyncio.run(run_load(HOST, port, paths, args.concurrency, args.duration, headers))
+    finally:
+        server.terminate()
+        server.wait()
+    all_samples = [s for samples in result["samples"].values() for s in samples]
+    return {
+        "throughput_rps": result["requests"] / result["elapsed"],
+        "statuses": result["statuses"],
+        "overall": summarize(all_samples),
+        "routes": {path: summarize(samples) for path, samples in sorted(result["samples"].items())},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, default=500, help="concurrent keep-alive clients")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of measured load per mode")
+    parser.add_argument("--warmup", type=float, default=3, help="seconds of unmeasured load per mode")
+    parser.add_argument("--workers", type=int, default=2, help="server worker processes")
+    parser.add_argument("--connections", type=int, default=16,
+                        help="database connections (and gunicorn threads) per worker")
+    parser.add_argument("--modes", default="wsgi,asgi", help="comma separated: wsgi, asgi")
+    parser.add_argument("--port", type=int, default=5070, help="first port to use")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    results = {}
+    for i, mode in enumerate(args.modes.split(",")):
+        results[mode] = run_mode(mode, args, args.port + i)
+        overall = results[mode]["overall"]
+        print(f"{mode:5} {results[mode]['throughput_rps']:8.0f} req/s  p50 {overall['p50_ms']:7.1f} ms  "
+              f"p95 {overall['p95_ms']:7.1f} ms  p99 {overall['p99_ms']:7.1f} ms  {results[mode]['statuses']}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
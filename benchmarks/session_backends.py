@@ -0,0 +1,126 @@
+"""
+Per-request session overhead of the session backends.
+
+Runs a minimal Flask app with each backend (no session, signed cookie,
+Flask-Session filesystem, Postgres) through the test client: one request that
+only reads session["user"] and one that also writes to the session. Requires
+the sessions table (db/migrations/add_sessions181026.sql) for the Postgres run.
+
+--concurrent then sends more requests than the pool has connections at once to a
+route that holds a request connection (like extensions.get_db) and writes the
+Postgres session; saving the session must not need a second connection.
+
+    python -m benchmarks.session_backends --repeat 2000 --concurrent 30 --pool-max 10
+"""
+import time
+import argparse
+import tempfile
+import threading
+from flask import Flask, session, g
+from db.pool import ConnectionPool
+from sessions import PostgresSessionInterface
+from benchmarks.common import connect_kwargs, summarize, timed
+
+
+def make_app(backend, pool):
+    app = Flask(__name__)
+    app.config["SECRET_KEY"] = "benchmark"
+    if backend == "postgres":
+        app.session_interface = PostgresSessionInterface(pool)
+    elif backend == "filesystem":
+        from flask_session import Session
+        app.config["SESSION_TYPE"] = "filesystem"
+        app.config["SESSION_FILE_DIR"] = tempfile.mkdtemp(prefix="bench_sessions_")
+        Session(app)
+
+    @app.route("/login")
+    def login():
+        if backend != "none":
+            session["user"] = {"id": 1, "name": "bench", "gm": False}
+        return "ok"
+
+    @app.route("/read")
+    def read():
+        user = session.get("user") if backend != "none" else None
+        return "ok" if user or backend == "none" else "missing"
+
+    @app.route("/write")
+    def write():
+        if backend != "none":
+            session["counter"] = session.get("counter", 0) + 1
+        return "ok"
+
+    @app.route("/write_with_db")
+    def write_with_db():
+        g.db_conn = pool.getconn()
+        with g.db_conn.cursor() as cur:
+            cur.execute("SELECT pg_sleep(0.05)")
+        session["counter"] = session.get("counter", 0) + 1
+        return "ok"
+
+    @app.teardown_appcontext
+    def release_db(exception):
+        conn = g.pop("db_conn", None)
+        if conn is not None:
+            pool.putconn(conn)
+
+    return app
+
+
+def concurrent_writes(requests, pool_max):
+    """
+    Send `requests` session-writing requests at once through a pool of pool_max connections.
+    Returns:
+        tuple: Status codes of the requests and the seconds it took.
+    """
+
+    pool = ConnectionPool(connect_kwargs(), minconn=1, maxconn=pool_max, timeout=5)
+    app = make_app("postgres", pool)
+    clients = [app.test_client() for _ in range(requests)]
+    for client in clients:
+        client.get("/login")
+    start_line = threading.Barrier(requests)
+    statuses = []
+
+    def send(client):
+        start_line.wait()
+        statuses.append(client.get("/write_with_db").status_code)
+
+    threads = [threading.Thread(target=send, args=(client,)) for client in clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    pool.closeall()
+    return statuses, elapsed
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=2000)
+    parser.add_argument("--backends", default="none,cookie,filesystem,postgres")
+    parser.add_argument("--concurrent", type=int, default=30, help="session writes sent at once (0 skips)")
+    parser.add_argument("--pool-max", type=int, default=10)
+    args = parser.parse_args()
+    pool = ConnectionPool(connect_kwargs(), minconn=1, maxconn=2)
+    baseline = None
+    for backend in args.backends.split(","):
+        client = make_app(backend, pool).test_client()
+        client.get("/login")
+        for route in ("/read", "/write"):
+            stats = summarize(timed(lambda: client.get(route), args.repeat))
+            if backend == "none" and route == "/read":
+                baseline = stats["mean_ms"]
+            overhead = stats["mean_ms"] - baseline if baseline is not None else 0.0
+            print(f"{backend:10} {route:6} mean={stats['mean_ms']:.3f}ms p95={stats['p95_ms']:.3f}ms "
+                  f"overhead={overhead:+.3f}ms")
+    pool.closeall()
+    if args.concurrent:
+        statuses, elapsed = concurrent_writes(args.concurrent, args.pool_max)
+        failed = sum(status != 200 for status in statuses)
+        print(f"concurrent {args.concurrent} session writes, pool of {args.pool_max}: "
+              f"{len(statuses) - failed} ok, {failed} failed in {elapsed:.2f}s")
+        if failed:
+            raise SystemExit(1)
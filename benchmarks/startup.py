@@ -0,0 +1,127 @@
+"""
+Cold start of the app: interpreter start, import, create_app() and the first request.
+
+Every sample runs in a fresh interpreter, like a new autoscaled worker. Importing
+and creating the app don't touch the database, so only the first request pays for
+the pool's connections. --server times a gunicorn start (with --preload and the
+given workers) until the first answered request. --importtime lists the modules
+that cost the most to import. With --budget-ms the exit status is 1 when the median
+import + create_app() time exceeds the budget, so CI can keep cold start in check.
+
+    python -m benchmarks.startup --repeat 10 --server 2 --budget-ms 500
+"""
+import sys
+import json
+import time
+import argparse
+import subprocess
+import http.client
+from benchmarks.common import summarize
+from benchmarks.serving_modes import HOST, wait_for_port
+
+# Uruchamiany w osobnym interpreterze dla każdej próbki
+CHILD = """
+import json, time
+start = time.perf_counter()
+import app
+created = time.perf_counter()
+client = app.app.test_client()
+response = client.get({path!r})
+done = time.perf_counter()
+print(json.dumps({{"import": app.IMPORT_END - start, "create_app": created - app.IMPORT_END,
+                  "first_request": done - created, "status": response.status_code}}))
+"""
+
+PHASES = ("process", "import", "create_app", "first_request")
+
+
+def sample(path):
+    """
+    Start a fresh interpreter, import the app and serve one request.
+    Returns:
+        dict: Seconds per phase; "process" is the whole interpreter run.
+    """
+
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-c", CHILD.format(path=path)], capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise SystemExit(f"App failed to start:\n{result.stderr}")
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    if timings.pop("status") != 200:
+        raise SystemExit(f"First request to {path} failed")
+    timings["process"] = elapsed
+    return timings
+
+
+def import_costs(top):
+    """
+    Modules with the highest own import time, from python -X importtime.
+    Returns:
+        list: (microseconds, module) pairs, most expensive first.
+    """
+
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], capture_output=True, text=True)
+    costs = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, module = line[len("import time:"):].split("|")
+        if own.strip().isdigit():
+            costs.append((int(own), module.strip()))
+    return sorted(costs, reverse=True)[:top]
+
+
+def server_start(workers, port, path):
+    """
+    Start gunicorn with --preload and time it until the first request is answered.
+    Returns:
+        float: Seconds from spawning the server to the first 200 response.
+    """
+
+    start = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "app:app", "--preload", "-b", f"{HOST}:{port}", "-w", str(workers),
+         "-k", "gthread", "--log-level", "warning"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(port)
+        while True:
+            conn = http.client.HTTPConnection(HOST, port, timeout=30)
+            conn.request("GET", path)
+            status = conn.getresponse().status
+            conn.close()
+            if status == 200:
+                return time.perf_counter() - start
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--path", default="/api/games?limit=5", help="first request")
+    parser.add_argument("--server", type=int, metavar="WORKERS", help="also time a gunicorn start")
+    parser.add_argument("--port", type=int, default=5070)
+    parser.add_argument("--importtime", type=int, default=0, metavar="N", help="list the N slowest imports")
+    parser.add_argument("--budget-ms", type=float, help="fail when median import + create_app exceeds it")
+    args = parser.parse_args()
+
+    samples = [sample(args.path) for _ in range(args.repeat)]
+    for phase in PHASES:
+        result = summarize([s[phase] for s in samples])
+        print(f"{phase:16} p50 {result['p50_ms']:8.1f} ms  p95 {result['p95_ms']:8.1f} ms")
+    if args.server:
+        seconds = server_start(args.server, args.port, args.path)
+        print(f"{'gunicorn start':16} {seconds * 1000:12.1f} ms to the first response ({args.server} workers)")
+    if args.importtime:
+        print("Slowest imports (own time):")
+        for micros, module in import_costs(args.importtime):
+            print(f"    {micros / 1000:8.1f} ms  {module}")
+    if args.budget_ms is not None:
+        ready = summarize([s["import"] + s["create_app"] for s in samples])["p50_ms"]
+        if ready > args.budget_ms:
+            raise SystemExit(f"Startup {ready:.1f} ms exceeds the budget of {args.budget_ms:.1f} ms")
+        print(f"Startup {ready:.1f} ms within the budget of {args.budget_ms:.1f} ms")
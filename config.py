@@ -15,26 +15,91 @@ class Config:
     STATIC_FOLDER = 'static'
     TEMPLATES_FOLDER = 'templates'
     SESSION_PERMANENT = False
+    # Baza danych; połączenia otwierane są dopiero przy pierwszym żądaniu
+    DBNAME = environ.get('DBNAME')
+    DBUSER = environ.get('DBUSER')
+    DBPASS = environ.get('DBPASS')
+    DBHOST = environ.get('DBHOST')
+    DBPORT = int(environ.get('DBPORT') or 5432)
+    # Sesje: "cookie" (podpisane ciasteczko Flaska), "postgres" (tabela sessions) lub "filesystem" (Flask-Session)
+    SESSION_BACKEND = environ.get('SESSION_BACKEND', 'cookie')
     SESSION_TYPE = "filesystem"
+    SESSION_SWEEP_INTERVAL = 300
+    # Pula połączeń z bazą danych
+    DB_POOL_MIN = int(environ.get('DB_POOL_MIN', 1))
+    DB_POOL_MAX = int(environ.get('DB_POOL_MAX', 10))
+    DB_POOL_TIMEOUT = float(environ.get('DB_POOL_TIMEOUT', 5))
+    DB_POOL_CHECK_AFTER = float(environ.get('DB_POOL_CHECK_AFTER', 30))
+    # Pula asyncio dla tras asynchronicznych (asgi.py)
+    ASYNC_DB_POOL_MIN = int(environ.get('ASYNC_DB_POOL_MIN', 1))
+    ASYNC_DB_POOL_MAX = int(environ.get('ASYNC_DB_POOL_MAX', 20))
+    # Stronicowanie tablicy gier
+    GAMES_PAGE_SIZE = 24
+    GAMES_PAGE_MAX = 100
+    # Wyszukiwarka gier (offset poniżej queries.SEARCH_CANDIDATES)
+    SEARCH_PAGE_SIZE = 24
+    SEARCH_MAX_OFFSET = 480
+    # Czat: stronicowanie historii i strumień SSE
+    CHAT_PAGE_SIZE = 50
+    CHAT_PAGE_MAX = 200
+    CHAT_KEEPALIVE = 15
+    # Partycje chat_messages: zakładane z wyprzedzeniem, starsze niż retencja archiwizowane do plików
+    CHAT_PARTITIONS_AHEAD = int(environ.get('CHAT_PARTITIONS_AHEAD', 3))
+    CHAT_PARTITIONS_CHECK_INTERVAL = 86400
+    CHAT_RETENTION_MONTHS = int(environ.get('CHAT_RETENTION_MONTHS', 12))
+    CHAT_ARCHIVE_DIR = environ.get('CHAT_ARCHIVE_DIR', 'archive/chat')
+    # Eksport historii czatu i list gier: kursor nazwany czytany partiami, strumieniowo
+    EXPORT_BATCH_SIZE = int(environ.get('EXPORT_BATCH_SIZE', 1000))
+    EXPORT_MAX_CONCURRENT = int(environ.get('EXPORT_MAX_CONCURRENT', 2))
+    EXPORT_DEADLINE = int(environ.get('EXPORT_DEADLINE', 300))
+    EXPORT_IDLE_TIMEOUT = 30
+    # Dostęp do /metrics i /*_stats: adresy z listy albo nagłówek "Authorization: Bearer <MONITORING_TOKEN>";
+    # bez żadnego z nich trasy monitoringu zwracają 403
+    MONITORING_ALLOWED_IPS = [ip.strip() for ip in environ.get('MONITORING_ALLOWED_IPS', '').split(',') if ip.strip()]
+    MONITORING_TOKEN = environ.get('MONITORING_TOKEN')
+    # Liczba zaufanych reverse proxy przed aplikacją: adres klienta (limity po IP) brany jest
+    # wtedy z X-Forwarded-For (werkzeug ProxyFix); 0 = adres połączenia
+    PROXY_FIX_X_FOR = int(environ.get('PROXY_FIX_X_FOR', 0))
+    # Limity żądań (token bucket) tras z @rate_limited: nazwa -> (żądań na minutę, pojemność kubełka).
+    # Osobne kubełki dla IP i zalogowanego użytkownika; "postgres" dzieli je między węzłami
+    RATE_LIMIT_ENABLED = environ.get('RATE_LIMIT_ENABLED', '1') == '1'
+    RATE_LIMIT_BACKEND = environ.get('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_MAX_KEYS = 10000
+    RATE_LIMIT_SWEEP_INTERVAL = 300
+    # Backend "postgres": tyle sekund sprawdzenie czeka na połączenie z puli, potem liczy lokalnie
+    RATE_LIMIT_POOL_TIMEOUT = 0.05
+    RATE_LIMITS = {
+        "login": (10, 5),
+        "register": (5, 3),
+        "apply_for_game": (10, 5),
+    }
+    # Haszowanie haseł (bcrypt) w puli wątków
+    BCRYPT_LOG_ROUNDS = int(environ.get('BCRYPT_LOG_ROUNDS', 12))
+    PASSWORD_HASH_WORKERS = int(environ.get('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE = int(environ.get('PASSWORD_HASH_QUEUE', 16))
+    PASSWORD_HASH_TIMEOUT = 10
+    # Zbiorczy zapis ostatniego logowania
+    LAST_LOGIN_FLUSH_INTERVAL = float(environ.get('LAST_LOGIN_FLUSH_INTERVAL', 5))
+    LAST_LOGIN_MAX_PENDING = 500
+    # Cache zapytań (systemy gier, szczegóły gier)
+    CACHE_MAX_ENTRIES = int(environ.get('CACHE_MAX_ENTRIES', 2048))
+    CACHE_DEFAULT_TTL = 60
+    CACHE_SHARED_INVALIDATION = environ.get('CACHE_SHARED_INVALIDATION', '1') == '1'
+    SYSTEMS_CACHE_TTL = 3600
+    GAME_CACHE_TTL = 300
+    GAME_DATA_BATCH_MAX = 100
+    # Cache wyrenderowanych kart gier i tablicy (limit pamięci w bajtach)
+    FRAGMENT_CACHE_MAX_BYTES = int(environ.get('FRAGMENT_CACHE_MAX_BYTES', 16 * 1024 * 1024))
+    BOARD_FRAGMENT_TTL = 60
 
 
 class ProdConfig(Config):
     FLASK_ENV = 'production'
     FLASK_DEBUG = False
-    DBNAME=environ.get('DBNAME')
-    DBUSER=environ.get('DBUSER')
-    DBPASS=environ.get('DBPASS')
-    DBHOST=environ.get('DBHOST')   
-    DBPORT=int(environ.get("DBPORT"))
-   
 
 
 class DevConfig(Config):
     """Konfiguracja developerska."""
     FLASK_ENV = 'development'
     FLASK_DEBUG = True
-    DBNAME=environ.get('DBNAME')
-    DBUSER=environ.get('DBUSER')
-    DBPASS=environ.get('DBPASS')
-    DBHOST=environ.get('DBHOST')   
-    DBPORT=int(environ.get("DBPORT"))
\ No newline at end of file
+    MONITORING_ALLOWED_IPS = Config.MONITORING_ALLOWED_IPS or ["127.0.0.1", "::1"]
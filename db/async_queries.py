@@ -0,0 +1,68 @@
+"""
+Asyncio versions of the read queries served by the ASGI entry point (asgi.py).
+
+The SQL and the row types come from db/queries.py, so both serving modes run the
+same statements and db/explain_queries.py covers them. Cursors are psycopg 3 async
+cursors with the default row factory: rows arrive as tuples and are turned into the
+row types of db/view_models.py like in the psycopg2 versions.
+"""
+from db import queries
+from db.view_models import Game, System, ChatRoom, ChatMessage, UserName
+
+
+async def get_games_page(cur, before_id=None, limit=24, system_id=None, gm_id=None, open_seats=False):
+    """Async queries.get_games_page."""
+    await cur.execute(*queries.games_page_query(before_id, limit, system_id, gm_id, open_seats))
+    return queries.games_page_result(await cur.fetchall(), limit)
+
+
+async def get_systems(cur):
+    """Async queries.get_systems."""
+    await cur.execute(queries.SYSTEMS_SQL)
+    return list(map(System._make, await cur.fetchall()))
+
+
+async def get_game_by_id(cur, id):
+    """Async queries.get_game_by_id."""
+    await cur.execute(queries.GAME_BY_ID_SQL, (id,))
+    game = await cur.fetchone()
+    if game:
+        return Game._make(game)
+    return None
+
+
+async def get_games_by_ids(cur, ids):
+    """Async queries.get_games_by_ids."""
+    await cur.execute(queries.GAMES_BY_IDS_SQL, (list(ids),))
+    return list(map(Game._make, await cur.fetchall()))
+
+
+async def fetch_chat(cur, game_id):
+    """Async queries.fetch_chat."""
+    await cur.execute(queries.CHAT_BY_GAME_SQL, (game_id,))
+    chat = await cur.fetchone()
+    if chat:
+        return ChatRoom._make(chat)
+    return None
+
+
+async def fetch_messages(cur, chatroom_id, before_id=None, limit=50):
+    """Async queries.fetch_messages."""
+    if before_id is None:
+        await cur.execute(queries.MESSAGES_SQL, (chatroom_id, limit))
+    else:
+        await cur.execute(queries.MESSAGES_BEFORE_SQL, {"chatroom_id": chatroom_id, "before_id": before_id,
+                                                        "limit": limit})
+    return list(map(ChatMessage._make, await cur.fetchall()))
+
+
+async def fetch_waiting_players(cur, chatroom_id):
+    """Async queries.fetch_waiting_players."""
+    await cur.execute(queries.WAITING_PLAYERS_SQL, (chatroom_id,))
+    return list(map(UserName._make, await cur.fetchall()))
+
+
+async def get_profile_view(cur, user_id):
+    """Async queries.get_profile_view."""
+    await cur.execute(queries.PROFILE_VIEW_SQL, (user_id,))
+    return queries.profile_view_from_row(await cur.fetchone())
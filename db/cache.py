@@ -0,0 +1,172 @@
+import json
+import time
+import threading
+from collections import OrderedDict
+
+# Kanał NOTIFY do unieważniania cache w innych procesach
+INVALIDATION_CHANNEL = "cache_invalidate"
+INVALIDATE_ALL = "*"
+
+_MISSING = object()
+
+
+class QueryCache:
+    """
+    In-process cache for query results with per-key TTL and LRU eviction.
+
+    Keys are tuples whose first element names the kind of data, e.g. ("systems",)
+    or ("game", 12). Writers call invalidate() after changing the data; when
+    `shared` is set and a cursor is passed, the invalidation is also sent to other
+    worker processes with pg_notify, delivered when the writer's transaction commits.
+    Args:
+        max_entries (int): Maximum number of cached keys before the least recently used is evicted.
+        default_ttl (float): Seconds a value stays valid when set() gets no ttl.
+        shared (bool): Broadcast invalidations to other processes through Postgres NOTIFY.
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=60.0, shared=False):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.shared = shared
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "invalidations": 0,
+        }
+
+    def get(self, key, default=None):
+        """
+        Return a cached value.
+        Args:
+            key (tuple): The cache key.
+            default: Returned when the key is missing or expired.
+        Returns:
+            The cached value or `default`.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            expires_at, value = entry
+            if expires_at <= now:
+                del self._entries[key]
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, ttl=None):
+        """
+        Store a value, evicting the least recently used keys above max_entries.
+        Args:
+            key (tuple): The cache key.
+            value: The value to cache.
+            ttl (float, optional): Seconds the value stays valid.
+        Returns:
+            None
+        """
+
+        expires_at = time.monotonic() + (self.default_ttl if ttl is None else ttl)
+        with self._lock:
+            self._entries[key] = (expires_at, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get_or_load(self, key, loader, ttl=None):
+        """
+        Return the cached value or load and cache it. None results are not cached.
+        Args:
+            key (tuple): The cache key.
+            loader (callable): Called without arguments on a miss.
+            ttl (float, optional): Seconds the loaded value stays valid.
+        Returns:
+            The cached or freshly loaded value.
+        """
+
+        value = self.get(key, _MISSING)
+        if value is _MISSING:
+            value = loader()
+            if value is not None:
+                self.set(key, value, ttl)
+        return value
+
+    def invalidate(self, *keys, cur=None):
+        """
+        Drop keys from the cache. A key with a single element, e.g. ("game",),
+        drops every key of that kind.
+        Args:
+            *keys (tuple): Keys or kinds to drop.
+            cur (cursor, optional): Cursor of the writing transaction, used to notify other processes.
+        Returns:
+            None
+        """
+
+        self._drop(keys)
+        if self.shared and cur is not None:
+            cur.execute("SELECT pg_notify(%s, %s)", (INVALIDATION_CHANNEL, json.dumps([list(key) for key in keys])))
+
+    def clear(self, cur=None):
+        """
+        Drop every key.
+        Args:
+            cur (cursor, optional): Cursor of the writing transaction, used to notify other processes.
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self._stats["invalidations"] += len(self._entries)
+            self._entries.clear()
+        if self.shared and cur is not None:
+            cur.execute("SELECT pg_notify(%s, %s)", (INVALIDATION_CHANNEL, INVALIDATE_ALL))
+
+    def _drop(self, keys):
+        with self._lock:
+            for key in keys:
+                key = tuple(key)
+                if len(key) == 1:
+                    matching = [k for k in self._entries if k[0] == key[0]]
+                else:
+                    matching = [key] if key in self._entries else []
+                for k in matching:
+                    del self._entries[k]
+                self._stats["invalidations"] += len(matching)
+
+    def handle_notification(self, payload):
+        """
+        NotificationListener callback applying invalidations sent by other processes.
+        After a listener reconnect (payload None) everything is dropped, since messages may have been missed.
+        Args:
+            payload (str or None): JSON list of keys, "*" or None.
+        Returns:
+            None
+        """
+
+        if payload is None or payload == INVALIDATE_ALL:
+            self.clear()
+            return
+        self._drop(json.loads(payload))
+
+    def stats(self):
+        """
+        Snapshot of cache counters.
+        Returns:
+            dict: Size, hits, misses, evictions, expirations and invalidations.
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["max_entries"] = self.max_entries
+        return stats
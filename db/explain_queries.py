@@ -0,0 +1,234 @@
+"""
+Query plan regression check for db/queries.py.
+
+Runs EXPLAIN for every query function in db/queries.py against the configured
+database and fails if any plan falls back to a sequential scan on one of the
+large tables. Use a throwaway database: with --seed it is filled with synthetic
+users, games, chat rooms and messages first, so the planner sees realistic
+table sizes.
+
+    python -m db.explain_queries --seed --scale 1
+"""
+import sys
+import inspect
+import argparse
+from datetime import datetime
+import db.queries as queries
+from db.migrations.apply_migrations import connect_db
+
+# Tabele, dla których skan sekwencyjny jest w porządku (kilka wierszy słownikowych)
+SMALL_TABLES = {"systems", "migrations"}
+
+# Reprezentatywne wywołania każdej funkcji z db/queries.py: lista (args, kwargs)
+CASES = {
+    "check_user_exist": [(("seed_user_10",), {})],
+    "get_user_for_login": [(("name", "seed_user_10"), {}),
+                           (("email", "seed_user_10@example.com"), {})],
+    "update_user_hash": [((10, "hash"), {})],
+    "add_user": [(("explain_user", "explain@example.com", "hash"), {})],
+    "add_player": [((10,), {})],
+    "add_gm": [((10,), {})],
+    "update_preferences_questionary": [((10,), {})],
+    "get_user_profile": [((10,), {})],
+    "get_user_player_status": [((10,), {})],
+    "get_user_gm_status": [((10,), {})],
+    "add_game": [((10, "Gra", 4, 1, "Opis"), {})],
+    "get_games_page": [((), {}),
+                       ((), {"before_id": 100}),
+                       ((), {"system_id": 2}),
+                       ((), {"gm_id": 10}),
+                       ((), {"open_seats": True, "before_id": 100}),
+                       ((), {"open_seats": True, "system_id": 2})],
+    "search_games": [(("smok",), {}),
+                     (("kampania grozy",), {"system_id": 2}),
+                     (("smok",), {"strategy": "newest"}),
+                     (("smok",), {"strategy": "newest", "system_id": 2, "offset": 48})],
+    "search_strategy": [((["smok", "lochy"],), {})],
+    "bulk_update_last_login": [(([(10, datetime(2026, 1, 1)), (11, datetime(2026, 1, 1))],), {})],
+    "get_systems": [((), {})],
+    "get_game_by_id": [((10,), {})],
+    "get_games_by_ids": [(([10, 11, 12, 500],), {})],
+    "get_game_title_and_gm": [((10,), {})],
+    "fetch_chat": [((10,), {})],
+    "apply_to_game": [((10, 20, "Chcę dołączyć"), {})],
+    "accept_player": [((10, 100, 20), {})],
+    "fetch_waiting_players": [((10,), {})],
+    "send_message": [((10, 10, "Wiadomość"), {})],
+    "add_user_to_chat": [((10, 10), {})],
+    "fetch_all_gm_games": [((10,), {})],
+    "fetch_all_players_games": [((10,), {})],
+    "get_profile_view": [((10,), {})],
+    "fetch_messages": [((10,), {}), ((10,), {"before_id": 1000})],
+    "fetch_messages_since": [((10, 1000), {}), ((10, 1000), {"since_timestamp": datetime.now()})],
+    "export_chat_messages": [((10,), {})],
+    "export_gm_games": [((10,), {})],
+}
+
+SEED_SQL = [
+    """
+    INSERT INTO users (name, email, hash, filled_preferences)
+    SELECT 'seed_user_' || i, 'seed_user_' || i || '@example.com', 'x', true
+    FROM generate_series(1, %(users)s) i
+    """,
+    "INSERT INTO players (user_id) SELECT id FROM users WHERE id %% 2 = 0",
+    "INSERT INTO gms (user_id) SELECT id FROM users WHERE id %% 10 = 0",
+    """
+    INSERT INTO games_posts (title, system_id, max_players, description, gm_id)
+    SELECT 'Seed game ' || i, (SELECT min(id) FROM systems) + i %% 7, 4 + i %% 3,
+           repeat('Opis gry. ', 50), (SELECT min(id) FROM users) + (i * 10) %% %(users)s
+    FROM generate_series(1, %(games)s) i
+    """,
+    "INSERT INTO chat_rooms (game_id) SELECT id FROM games_posts",
+    "SELECT create_chat_partitions(localtimestamp - make_interval(secs => %(messages)s), localtimestamp)",
+    """
+    INSERT INTO users_in_chat (chatroom_id, user_id)
+    SELECT r.id, (SELECT min(id) FROM users) + (r.id * 7 + n * 13) %% %(users)s
+    FROM chat_rooms r JOIN games_posts g ON g.id = r.game_id, generate_series(1, g.max_players - r.id %% 2) n
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO waiting_for_accept (chatroom_id, user_id)
+    SELECT r.id, (SELECT min(id) FROM users) + (r.id * 11 + n * 17) %% %(users)s
+    FROM chat_rooms r, generate_series(1, 2) n
+    ON CONFLICT DO NOTHING
+    """,
+    """
+    INSERT INTO chat_messages (chatroom_id, user_id, message, timestamp)
+    SELECT (SELECT min(id) FROM chat_rooms) + i %% %(games)s, (SELECT min(id) FROM users) + i %% %(users)s,
+           'Wiadomość ' || i, localtimestamp - ((%(messages)s - i) || ' seconds')::interval
+    FROM generate_series(1, %(messages)s) i
+    """,
+]
+
+
+class ExplainCursor:
+    """
+    Cursor stand-in that EXPLAINs every statement instead of running it.
+    Fetch methods return no rows, so query functions run their normal code path
+    without touching data.
+    """
+
+    def __init__(self, cur):
+        self._cur = cur
+        self.plans = []
+
+    def execute(self, sql, params=None):
+        prefix = "EXPLAIN (FORMAT JSON) "
+        # execute_values przekazuje gotowe zapytanie jako bytes
+        self._cur.execute((prefix.encode() if isinstance(sql, bytes) else prefix) + sql, params)
+        self.plans.append(self._cur.fetchone()[0][0]["Plan"])
+
+    def fetchone(self):
+        return None
+
+    def fetchall(self):
+        return []
+
+    def fetchmany(self, size=None):
+        return []
+
+    def __iter__(self):
+        return iter(())
+
+    def __getattr__(self, name):
+        return getattr(self._cur, name)
+
+
+def seq_scans(plan, ignored=SMALL_TABLES):
+    """
+    Find sequential scans on large tables in a plan tree.
+    Args:
+        plan (dict): A plan node from EXPLAIN (FORMAT JSON).
+        ignored (set): Tables whose sequential scans are fine.
+    Returns:
+        list: Names of the relations scanned sequentially.
+    """
+
+    found = []
+    relation = plan.get("Relation Name") or ""
+    # Katalogi systemowe (np. pg_stats w search_strategy) są małe
+    if plan.get("Node Type") == "Seq Scan" and relation not in ignored and not relation.startswith("pg_"):
+        found.append(relation)
+    for child in plan.get("Plans", []):
+        found.extend(seq_scans(child, ignored))
+    return found
+
+
+def empty_tables(cur):
+    """Tables with no pages after ANALYZE, e.g. chat_messages partitions of the coming months."""
+    cur.execute("""
+        SELECT relname FROM pg_class
+        WHERE relkind = 'r' AND relpages = 0 AND relnamespace = 'public'::regnamespace
+    """)
+    return {name for name, in cur.fetchall()}
+
+
+def seed(conn, scale):
+    with conn.cursor() as cur:
+        cur.execute("SELECT EXISTS (SELECT 1 FROM users)")
+        if cur.fetchone()[0]:
+            raise SystemExit("Seeding requires an empty database")
+        params = {"users": 20000 * scale, "games": 20000 * scale, "messages": 200000 * scale}
+        for sql in SEED_SQL:
+            cur.execute(sql, params)
+    conn.commit()
+    print(f"Seeded {params}")
+
+
+def query_functions():
+    """Query functions of db/queries.py: the ones taking a cursor as the first argument."""
+    return {name: f for name, f in inspect.getmembers(queries, inspect.isfunction)
+            if f.__module__ == queries.__name__ and next(iter(inspect.signature(f).parameters), None) == "cur"}
+
+
+def check_plans(conn):
+    """
+    EXPLAIN every query function and report sequential scans.
+    Args:
+        conn (connection): Connection to the seeded database.
+    Returns:
+        list: Failure messages, empty when every plan uses indexes.
+    """
+
+    failures = []
+    with conn.cursor() as cur:
+        cur.execute("ANALYZE")
+        ignored = SMALL_TABLES | empty_tables(cur)
+    conn.commit()
+    for name, function in sorted(query_functions().items()):
+        if name not in CASES:
+            failures.append(f"{name}: no EXPLAIN case in db/explain_queries.py")
+            continue
+        for args, kwargs in CASES[name]:
+            with conn.cursor() as real_cur:
+                cur = ExplainCursor(real_cur)
+                try:
+                    function(cur, *args, **kwargs)
+                except (TypeError, KeyError, IndexError):
+                    # Funkcja odczytała wynik, którego EXPLAIN nie zwraca; plany są już zebrane
+                    pass
+            scans = [table for plan in cur.plans for table in seq_scans(plan, ignored)]
+            label = f"{name}{args or ''}{kwargs or ''}"
+            if scans:
+                failures.append(f"{label}: Seq Scan on {', '.join(scans)}")
+            print(f"{'SEQ SCAN' if scans else 'ok':9} {label}")
+        conn.rollback()
+    return failures
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", action="store_true", help="fill an empty database with synthetic data first")
+    parser.add_argument("--scale", type=int, default=1, help="seed size multiplier")
+    args = parser.parse_args()
+    conn = connect_db()
+    if args.seed:
+        seed(conn, args.scale)
+    failures = check_plans(conn)
+    conn.close()
+    if failures:
+        print("\nQuery plan regressions:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print("All query plans use indexes")
@@ -0,0 +1,342 @@
+"""
+Synthetic data generator and COPY-based bulk loader.
+
+Generates users, GMs, game posts, chat rooms with their players, waiting
+applicants and chat messages, all referentially consistent (players fit the
+game's seats and accepted_players matches them, applicants aren't players,
+messages are written by the room's members), and streams every table into
+Postgres with COPY FROM STDIN in batches of --batch-size rows.
+
+Rows are produced lazily and each game is rebuilt from its own random seed
+for every table it appears in, so memory stays constant at any size. Secondary
+indexes, unique and foreign key constraints and user triggers (the seat counter)
+of the loaded tables are dropped for the load and rebuilt once at the end, all in
+one transaction. New rows get ids after the existing ones and the id sequences
+are moved past them, so the app can keep inserting afterwards.
+
+Counts per game are drawn from distributions given as NAME:ARGS:
+fixed:N, uniform:LOW:HIGH, exp:MEAN (geometric-like, most rooms quiet) or
+pareto:ALPHA:MIN (a few very busy rooms).
+
+    python -m db.generate_data --users 1000000 --games 300000 --messages-per-room exp:40
+"""
+import time
+import random
+import argparse
+from datetime import datetime, timedelta
+from itertools import islice
+import bcrypt
+from db.migrations.apply_migrations import connect_db
+from db.partitions import create_partitions
+
+LOADED_TABLES = ["users", "players", "gms", "games_posts", "chat_rooms", "users_in_chat",
+                 "waiting_for_accept", "chat_messages"]
+
+WORDS = [
+    "kampania", "przygoda", "sesja", "drużyna", "smok", "lochy", "zamek", "las", "miasto", "magia",
+    "horror", "śledztwo", "kosmos", "statek", "wampir", "kult", "klątwa", "pirat", "rycerz", "intryga",
+    "dwór", "spisek", "zaraza", "pustynia", "góry", "morze", "artefakt", "portal", "labirynt", "wojna",
+]
+PHRASES = [
+    "Hej, kiedy gramy?", "Mogę w czwartek wieczorem", "Dzięki za sesję!", "Postać gotowa",
+    "Czy ktoś ma kości?", "Przesuwamy na przyszły tydzień", "Wrzuciłem notatki z sesji", "Ok, będę",
+]
+
+
+def distribution(spec):
+    """
+    Parse a distribution spec into a sampler.
+    Args:
+        spec (str): fixed:N, uniform:LOW:HIGH, exp:MEAN or pareto:ALPHA:MIN.
+    Returns:
+        callable: Takes a random.Random and returns a non-negative int.
+    """
+
+    name, _, args = spec.partition(":")
+    try:
+        values = [float(value) for value in args.split(":")] if args else []
+        if name == "fixed" and len(values) == 1:
+            return lambda rng: int(values[0])
+        if name == "uniform" and len(values) == 2:
+            return lambda rng: rng.randint(int(values[0]), int(values[1]))
+        if name == "exp" and len(values) == 1:
+            return lambda rng: int(rng.expovariate(1 / values[0])) if values[0] > 0 else 0
+        if name == "pareto" and len(values) == 2:
+            return lambda rng: int(values[1] * rng.paretovariate(values[0]))
+    except ValueError:
+        pass
+    raise argparse.ArgumentTypeError(f"Invalid distribution: {spec}")
+
+
+def copy_field(value):
+    if value is None:
+        return "\\N"
+    if isinstance(value, datetime):
+        return value.isoformat(sep=" ")
+    return str(value).replace("\\", "\\\\").replace("\t", "\\t").replace("\n", "\\n").replace("\r", "\\r")
+
+
+class RowStream:
+    """File-like object serving rows in COPY text format; read() pulls only as many rows as needed."""
+
+    def __init__(self, rows):
+        self._rows = rows
+        self._buffer = b""
+
+    def read(self, size=65536):
+        if size is None or size < 0:
+            size = 65536
+        chunks = [self._buffer]
+        length = len(self._buffer)
+        while length < size:
+            row = next(self._rows, None)
+            if row is None:
+                break
+            line = ("\t".join(copy_field(value) for value in row) + "\n").encode("utf-8")
+            chunks.append(line)
+            length += len(line)
+        data = b"".join(chunks)
+        self._buffer = data[size:]
+        return data[:size]
+
+
+class Generator:
+    """
+    Deterministic description of the dataset; every table is a generator of rows.
+    Ids start after `base` (the current maximum id of each table).
+    """
+
+    def __init__(self, args, base, system_ids, password_hash):
+        self.args = args
+        self.base = base
+        self.system_ids = system_ids
+        self.password_hash = password_hash
+        self.gm_count = max(1, int(args.users * args.gm_share))
+        self.now = datetime.now().replace(microsecond=0)
+
+    def user_id(self, i):
+        return self.base["users"] + 1 + i
+
+    def game(self, i):
+        """
+        The composition of game i, rebuilt identically for every table.
+        Returns:
+            dict: GM, seats, players, applicants, room id (or None) and the game's random generator.
+        """
+
+        args = self.args
+        rng = random.Random(args.seed * 1000003 + i)
+        # Kilku aktywnych GM-ów prowadzi większość gier
+        gm = self.user_id(int(self.gm_count * rng.random() ** 2))
+        max_players = rng.randint(3, 6)
+        players = min(max_players, args.players_per_game(rng), args.users - 1)
+        applicants = min(args.applicants_per_game(rng), args.users - 1 - players)
+        members = set()
+        while len(members) < players + applicants:
+            user = self.user_id(rng.randrange(args.users))
+            if user != gm:
+                members.add(user)
+        members = sorted(members)
+        rng.shuffle(members)
+        room = self.base["chat_rooms"] + 1 + i if players or applicants else None
+        return {
+            "id": self.base["games_posts"] + 1 + i, "gm": gm, "max_players": max_players,
+            "players": members[:players], "applicants": members[players:], "room": room, "rng": rng,
+        }
+
+    def games(self):
+        for i in range(self.args.games):
+            yield self.game(i)
+
+    def users(self):
+        start = self.now - timedelta(days=self.args.days)
+        for i in range(self.args.users):
+            id = self.user_id(i)
+            registered = start + timedelta(seconds=i * self.args.days * 86400 // max(1, self.args.users))
+            yield (id, f"user_{id}", f"user_{id}@example.com", self.password_hash, True, registered, registered)
+
+    def players(self):
+        for i in range(self.args.users):
+            if i >= self.gm_count or i % 2 == 0:
+                yield (self.user_id(i),)
+
+    def gms(self):
+        for i in range(self.gm_count):
+            yield (self.user_id(i),)
+
+    def games_posts(self):
+        for game in self.games():
+            rng = game["rng"]
+            title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).capitalize()
+            description = " ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80)))
+            yield (game["id"], title, rng.choice(self.system_ids), game["max_players"], description,
+                   game["gm"], len(game["players"]))
+
+    def chat_rooms(self):
+        for game in self.games():
+            if game["room"] is not None:
+                yield (game["room"], game["id"])
+
+    def users_in_chat(self):
+        for game in self.games():
+            for user in game["players"]:
+                yield (game["room"], user)
+
+    def waiting_for_accept(self):
+        for game in self.games():
+            for user in game["applicants"]:
+                yield (game["room"], user)
+
+    def chat_messages(self):
+        window = self.args.days * 86400
+        for game in self.games():
+            if game["room"] is None:
+                continue
+            rng = game["rng"]
+            authors = [game["gm"]] + game["players"] + game["applicants"]
+            count = self.args.messages_per_room(rng)
+            started = rng.randrange(window)
+            for n in range(count):
+                # Wiadomości rosnąco w czasie, od założenia pokoju do teraz
+                at = self.now - timedelta(seconds=started - started * n // max(1, count))
+                yield (game["room"], rng.choice(authors), rng.choice(PHRASES), at)
+
+
+COLUMNS = {
+    "users": "id, name, email, hash, filled_preferences, registered_at, last_login",
+    "players": "user_id",
+    "gms": "user_id",
+    "games_posts": "id, title, system_id, max_players, description, gm_id, accepted_players",
+    "chat_rooms": "id, game_id",
+    "users_in_chat": "chatroom_id, user_id",
+    "waiting_for_accept": "chatroom_id, user_id",
+    "chat_messages": "chatroom_id, user_id, message, timestamp",
+}
+
+
+def copy_rows(cur, table, rows, batch_size):
+    """
+    Stream rows into a table with one COPY per batch.
+    Returns:
+        int: Rows loaded.
+    """
+
+    total = 0
+    start = time.monotonic()
+    while True:
+        batch = RowStream(islice(rows, batch_size))
+        cur.copy_expert(f"COPY {table} ({COLUMNS[table]}) FROM STDIN", batch, size=65536)
+        if cur.rowcount <= 0:
+            break
+        total += cur.rowcount
+        print(f"  {table}: {total} rows ({total / max(time.monotonic() - start, 1e-9):.0f}/s)", end="\r")
+        if cur.rowcount < batch_size:
+            break
+    print(f"  {table}: {total} rows in {time.monotonic() - start:.1f}s" + " " * 20)
+    return total
+
+
+def defer_indexes(cur):
+    """
+    Drop secondary indexes, unique and foreign key constraints of the loaded tables
+    and disable their user triggers.
+    Returns:
+        list: Statements that rebuild what was dropped, in order.
+    """
+
+    cur.execute("""
+        SELECT 0, format('DROP INDEX %%s', indexrelid::regclass),
+               -- Indeks tabeli partycjonowanej: ON ONLY utworzyłby go bez indeksów partycji
+               replace(pg_get_indexdef(indexrelid), ' ON ONLY ', ' ON ')
+        FROM pg_index
+        WHERE indrelid = ANY(%(tables)s::regclass[])
+          AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = indexrelid)
+        UNION ALL
+        SELECT CASE contype WHEN 'u' THEN 1 ELSE 2 END,
+               format('ALTER TABLE %%s DROP CONSTRAINT %%I', conrelid::regclass, conname),
+               format('ALTER TABLE %%s ADD CONSTRAINT %%I %%s', conrelid::regclass, conname, pg_get_constraintdef(oid))
+        FROM pg_constraint
+        WHERE conrelid = ANY(%(tables)s::regclass[]) AND contype IN ('u', 'f')
+        ORDER BY 1, 2
+    """, {"tables": LOADED_TABLES})
+    statements = cur.fetchall()
+    # Najpierw klucze obce (zależą od unikalnych), potem unikalne i indeksy
+    for _, drop, _ in reversed(statements):
+        cur.execute(drop)
+    for table in LOADED_TABLES:
+        cur.execute(f"ALTER TABLE {table} DISABLE TRIGGER USER")
+    return [create for _, _, create in statements]
+
+
+def rebuild(cur, statements):
+    for table in LOADED_TABLES:
+        cur.execute(f"ALTER TABLE {table} ENABLE TRIGGER USER")
+    for statement in statements:
+        start = time.monotonic()
+        cur.execute(statement)
+        print(f"  {time.monotonic() - start:6.1f}s  {statement[:100]}")
+
+
+def reset_sequences(cur):
+    cur.execute("""
+        SELECT table_name, pg_get_serial_sequence(table_name, 'id') FROM information_schema.columns
+        WHERE table_schema = 'public' AND column_name = 'id' AND table_name = ANY(%s)
+    """, (LOADED_TABLES,))
+    for table, sequence in cur.fetchall():
+        if sequence is not None:
+            cur.execute(f"SELECT setval(%s, GREATEST((SELECT max(id) FROM {table}), 1))", (sequence,))
+
+
+def generate(conn, args):
+    with conn.cursor() as cur:
+        base = {}
+        for table in ("users", "games_posts", "chat_rooms"):
+            cur.execute(f"SELECT COALESCE(max(id), 0) FROM {table}")
+            base[table] = cur.fetchone()[0]
+        cur.execute("SELECT id FROM systems ORDER BY id")
+        system_ids = [row[0] for row in cur.fetchall()] or [None]
+        password_hash = bcrypt.hashpw(args.password.encode(), bcrypt.gensalt(args.bcrypt_rounds)).decode()
+        generator = Generator(args, base, system_ids, password_hash)
+        # Partycje chat_messages na cały okres generowanych wiadomości
+        create_partitions(cur, generator.now - timedelta(days=args.days), generator.now)
+
+        cur.execute("SET LOCAL maintenance_work_mem = %s", (args.maintenance_work_mem,))
+        statements = defer_indexes(cur)
+        start = time.monotonic()
+        print("Loading")
+        for table in LOADED_TABLES:
+            copy_rows(cur, table, getattr(generator, table)(), args.batch_size)
+        print(f"Rebuilding {len(statements)} indexes and constraints")
+        rebuild(cur, statements)
+        reset_sequences(cur)
+    conn.commit()
+    print(f"Done in {time.monotonic() - start:.1f}s")
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        for table in LOADED_TABLES:
+            cur.execute(f"ANALYZE {table}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100000)
+    parser.add_argument("--games", type=int, default=30000)
+    parser.add_argument("--gm-share", type=float, default=0.1, help="share of users who are GMs")
+    parser.add_argument("--players-per-game", type=distribution, default="uniform:0:4",
+                        help="accepted players per game (capped at its seats)")
+    parser.add_argument("--applicants-per-game", type=distribution, default="exp:1.5",
+                        help="users waiting for the GM's accept per game")
+    parser.add_argument("--messages-per-room", type=distribution, default="exp:40")
+    parser.add_argument("--days", type=int, default=365, help="time span of registrations and messages")
+    parser.add_argument("--password", default="password", help="password of every generated user")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12)
+    parser.add_argument("--batch-size", type=int, default=100000, help="rows per COPY")
+    parser.add_argument("--maintenance-work-mem", default="256MB", help="memory for the index builds")
+    parser.add_argument("--seed", type=int, default=1, help="random seed; the same seed gives the same data")
+    args = parser.parse_args()
+    if args.users < 2:
+        parser.error("--users must be at least 2")
+
+    conn = connect_db()
+    generate(conn, args)
+    conn.close()
@@ -0,0 +1,142 @@
+import time
+import threading
+from datetime import datetime
+import db.queries as queries
+
+
+class LastLoginBuffer:
+    """
+    Write-behind buffer for users.last_login.
+
+    Logins only record a timestamp in memory; repeated logins of the same user are
+    coalesced, and a background thread writes all pending timestamps with one bulk
+    UPDATE every `flush_interval` seconds, or sooner once `max_pending` users are waiting.
+    Call close() on shutdown to write what is left.
+    Args:
+        pool (ConnectionPool): Pool the flushes check a connection out of.
+        flush_interval (float): Maximum seconds between flushes.
+        max_pending (int): Number of buffered users that triggers an early flush.
+    """
+
+    def __init__(self, pool, flush_interval=5.0, max_pending=500):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopped = False
+        self._thread = None
+        self._stats = {
+            "recorded": 0,
+            "flushes": 0,
+            "flushed_rows": 0,
+            "failed_flushes": 0,
+            "last_flush_size": 0,
+            "max_flush_size": 0,
+            "last_flush_lag": 0.0,
+            "max_flush_lag": 0.0,
+        }
+
+    def record(self, user_id, when=None):
+        """
+        Buffer a login timestamp for a user.
+        Args:
+            user_id (int): The user who logged in.
+            when (datetime, optional): Login time, defaults to now.
+        Returns:
+            None
+        """
+
+        when = when or datetime.now()
+        with self._lock:
+            previous = self._pending.get(user_id)
+            if previous is None or previous < when:
+                self._pending[user_id] = when
+            if self._oldest is None:
+                self._oldest = time.monotonic()
+            self._stats["recorded"] += 1
+            pending = len(self._pending)
+            if self._thread is None and not self._stopped:
+                self._thread = threading.Thread(target=self._run, name="last-login-flusher", daemon=True)
+                self._thread.start()
+        if pending >= self.max_pending:
+            self._wake.set()
+
+    def flush(self):
+        """
+        Write all buffered timestamps with a single UPDATE ... FROM (VALUES ...).
+        On failure the batch is put back and retried on the next flush.
+        Returns:
+            int: Number of users written.
+        """
+
+        with self._flush_lock:
+            with self._lock:
+                batch, self._pending = self._pending, {}
+                oldest, self._oldest = self._oldest, None
+            if not batch:
+                return 0
+            try:
+                with self.pool.connection() as conn:
+                    with conn.cursor() as cur:
+                        queries.bulk_update_last_login(cur, batch.items())
+                    conn.commit()
+            except Exception as e:
+                print(f"Błąd zapisu ostatnich logowań: {e}")
+                with self._lock:
+                    for user_id, when in batch.items():
+                        current = self._pending.get(user_id)
+                        if current is None or current < when:
+                            self._pending[user_id] = when
+                    if self._oldest is None or (oldest is not None and oldest < self._oldest):
+                        self._oldest = oldest
+                    self._stats["failed_flushes"] += 1
+                return 0
+            lag = time.monotonic() - oldest if oldest is not None else 0.0
+            with self._lock:
+                self._stats["flushes"] += 1
+                self._stats["flushed_rows"] += len(batch)
+                self._stats["last_flush_size"] = len(batch)
+                self._stats["max_flush_size"] = max(self._stats["max_flush_size"], len(batch))
+                self._stats["last_flush_lag"] = lag
+                self._stats["max_flush_lag"] = max(self._stats["max_flush_lag"], lag)
+            return len(batch)
+
+    def _run(self):
+        while not self._stopped:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def stats(self):
+        """
+        Snapshot of buffer counters.
+        Returns:
+            dict: Pending users, flush counts, flush sizes and lag (seconds from first buffered login to its write).
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats["pending"] = len(self._pending)
+            stats["pending_age"] = time.monotonic() - self._oldest if self._oldest is not None else 0.0
+        return stats
+
+    def after_fork(self):
+        """Reset the buffer in a forked child; logins buffered by the parent are written by the parent."""
+        self._pending = {}
+        self._oldest = None
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+
+    def close(self):
+        """Stop the background thread and write everything still buffered."""
+        self._stopped = True
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.flush_interval)
+        self.flush()
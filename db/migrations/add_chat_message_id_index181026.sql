@@ -0,0 +1,2 @@
+-- Stronicowanie historii czatu po id wiadomości
+CREATE INDEX IF NOT EXISTS chat_messages_chatroom_id_idx ON chat_messages (chatroom_id, id);
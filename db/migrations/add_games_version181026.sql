@@ -0,0 +1,16 @@
+-- Wersja wiersza gry do ETagów (/game_data): rośnie przy każdej zmianie wiersza
+ALTER TABLE games_posts ADD COLUMN IF NOT EXISTS version INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION bump_games_posts_version() RETURNS trigger AS $$
+BEGIN
+    NEW.version := OLD.version + 1;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS games_posts_version ON games_posts;
+CREATE TRIGGER games_posts_version
+    BEFORE UPDATE ON games_posts
+    FOR EACH ROW
+    WHEN (OLD.* IS DISTINCT FROM NEW.*)
+    EXECUTE FUNCTION bump_games_posts_version();
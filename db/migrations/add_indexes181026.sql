@@ -0,0 +1,35 @@
+-- Indeksy dla najczęstszych zapytań.
+-- users.name i users.email mają już indeksy z ograniczeń UNIQUE (logowanie po nazwie lub mailu).
+
+-- Jeden pokój czatu na grę: duplikaty są scalane w najstarszy pokój przed dodaniem unikalnego indeksu
+CREATE TEMP TABLE duplicate_chat_rooms ON COMMIT DROP AS
+SELECT id, keep_id FROM (
+    SELECT id, MIN(id) OVER (PARTITION BY game_id) AS keep_id FROM chat_rooms WHERE game_id IS NOT NULL
+) rooms
+WHERE id <> keep_id;
+
+UPDATE chat_messages SET chatroom_id = d.keep_id FROM duplicate_chat_rooms d WHERE chat_messages.chatroom_id = d.id;
+UPDATE users_in_chat SET chatroom_id = d.keep_id FROM duplicate_chat_rooms d WHERE users_in_chat.chatroom_id = d.id;
+UPDATE waiting_for_accept SET chatroom_id = d.keep_id FROM duplicate_chat_rooms d WHERE waiting_for_accept.chatroom_id = d.id;
+DELETE FROM chat_rooms USING duplicate_chat_rooms d WHERE chat_rooms.id = d.id;
+
+-- Użytkownik jest w pokoju lub czeka na akceptację co najwyżej raz
+DELETE FROM users_in_chat a USING users_in_chat b
+WHERE a.chatroom_id = b.chatroom_id AND a.user_id = b.user_id AND a.id > b.id;
+DELETE FROM waiting_for_accept a USING waiting_for_accept b
+WHERE a.chatroom_id = b.chatroom_id AND a.user_id = b.user_id AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS chat_rooms_game_id_key ON chat_rooms (game_id);
+CREATE UNIQUE INDEX IF NOT EXISTS users_in_chat_chatroom_user_key ON users_in_chat (chatroom_id, user_id);
+CREATE UNIQUE INDEX IF NOT EXISTS waiting_for_accept_chatroom_user_key ON waiting_for_accept (chatroom_id, user_id);
+
+-- Gry gracza (profil) i gry GM-a
+CREATE INDEX IF NOT EXISTS users_in_chat_user_id_idx ON users_in_chat (user_id);
+CREATE INDEX IF NOT EXISTS waiting_for_accept_user_id_idx ON waiting_for_accept (user_id);
+CREATE INDEX IF NOT EXISTS games_posts_gm_id_idx ON games_posts (gm_id, id);
+
+-- Filtr systemu na tablicy gier (stronicowanie po id)
+CREATE INDEX IF NOT EXISTS games_posts_system_id_idx ON games_posts (system_id, id);
+
+-- Historia czatu
+CREATE INDEX IF NOT EXISTS chat_messages_chatroom_timestamp_idx ON chat_messages (chatroom_id, timestamp);
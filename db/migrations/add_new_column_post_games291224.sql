@@ -1,2 +1,2 @@
 ALTER TABLE games_posts
-ADD accepted_players INTEGER;
\ No newline at end of file
+ADD COLUMN IF NOT EXISTS accepted_players INTEGER;
\ No newline at end of file
@@ -0,0 +1,42 @@
+-- Kubełki limitów żądań (RATE_LIMIT_BACKEND = "postgres"), wspólne dla wszystkich węzłów.
+-- Tabela jest UNLOGGED jak sessions: po awarii serwera kubełki są pełne, co dla limitów wystarcza.
+CREATE UNLOGGED TABLE IF NOT EXISTS rate_limits (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    -- Od tej chwili kubełek jest pełny i można go usunąć (ratelimit.PostgresRateLimiter.sweep)
+    full_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS rate_limits_full_at_idx ON rate_limits (full_at);
+
+-- Uzupełnia kubełki o rate żetonów na sekundę (najwyżej do burst) i pobiera z każdego żeton.
+-- Zwraca 0, gdy żądanie jest dozwolone, inaczej liczbę sekund do żetonu we wszystkich kubełkach.
+-- Odmowa nie zużywa żetonu.
+CREATE OR REPLACE FUNCTION rate_limit_hit(keys text[], rate double precision, burst double precision)
+RETURNS double precision AS $$
+DECLARE
+    now_ts timestamptz := clock_timestamp();
+    bucket_key text;
+    available double precision;
+    wait double precision := 0;
+BEGIN
+    FOREACH bucket_key IN ARRAY keys LOOP
+        INSERT INTO rate_limits AS b (key, tokens, updated_at, full_at)
+        VALUES (bucket_key, burst, now_ts, now_ts)
+        ON CONFLICT (key) DO UPDATE
+            SET tokens = LEAST(burst, b.tokens + extract(epoch FROM now_ts - b.updated_at) * rate),
+                updated_at = now_ts
+        RETURNING tokens INTO available;
+        IF available >= 1 THEN
+            available := available - 1;
+        ELSE
+            wait := GREATEST(wait, (1 - available) / rate);
+        END IF;
+        UPDATE rate_limits
+        SET tokens = available, full_at = now_ts + make_interval(secs => (burst - available) / rate)
+        WHERE key = bucket_key;
+    END LOOP;
+    RETURN wait;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,42 @@
+-- Wyszukiwanie pełnotekstowe ogłoszeń gier (/search).
+-- Postgres nie ma wbudowanej konfiguracji dla polskiego. Jeśli baza nie ma konfiguracji "polish"
+-- (np. ze słownikiem ispell), tworzymy ją na bazie "simple": bez stemmingu, odmianę obsługuje
+-- wyszukiwanie prefiksowe w queries.search_games. Z rozszerzeniem unaccent polskie znaki są pomijane.
+DO $$
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_ts_config WHERE cfgname = 'polish') THEN
+        CREATE TEXT SEARCH CONFIGURATION polish (COPY = simple);
+        IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'unaccent') THEN
+            CREATE EXTENSION IF NOT EXISTS unaccent;
+            ALTER TEXT SEARCH CONFIGURATION polish
+                ALTER MAPPING FOR hword, hword_part, word WITH unaccent, simple;
+        END IF;
+    END IF;
+END
+$$;
+
+-- Warunek WHEN wyzwalacza BEFORE nie może odwoływać się do całego wiersza NEW, gdy tabela ma
+-- kolumny generowane (nie są jeszcze wyliczone), więc wersja jest porównywana w funkcji, bez search_vector
+CREATE OR REPLACE FUNCTION bump_games_posts_version() RETURNS trigger AS $$
+BEGIN
+    IF to_jsonb(NEW) - 'search_vector' IS DISTINCT FROM to_jsonb(OLD) - 'search_vector' THEN
+        NEW.version := OLD.version + 1;
+    END IF;
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS games_posts_version ON games_posts;
+CREATE TRIGGER games_posts_version
+    BEFORE UPDATE ON games_posts
+    FOR EACH ROW
+    EXECUTE FUNCTION bump_games_posts_version();
+
+-- Tytuł waży więcej niż opis przy sortowaniu po ts_rank
+ALTER TABLE games_posts ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('polish', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('polish', coalesce(description, '')), 'B')
+    ) STORED;
+
+CREATE INDEX IF NOT EXISTS games_posts_search_idx ON games_posts USING GIN (search_vector);
@@ -0,0 +1,45 @@
+-- Licznik zajętych miejsc w grze (games_posts.accepted_players) utrzymywany przez wyzwalacz
+-- na users_in_chat. GM siedzi w pokoju czatu swojej gry, ale nie zajmuje miejsca gracza.
+
+UPDATE games_posts g SET accepted_players = counted.players
+FROM (
+    SELECT g2.id, count(u.id) AS players
+    FROM games_posts g2
+    LEFT JOIN chat_rooms r ON r.game_id = g2.id
+    LEFT JOIN users_in_chat u ON u.chatroom_id = r.id AND u.user_id IS DISTINCT FROM g2.gm_id
+    GROUP BY g2.id
+) counted
+WHERE g.id = counted.id AND g.accepted_players IS DISTINCT FROM counted.players;
+
+ALTER TABLE games_posts ALTER COLUMN accepted_players SET DEFAULT 0;
+ALTER TABLE games_posts ALTER COLUMN accepted_players SET NOT NULL;
+
+-- Nowe zapisy nie mogą przekroczyć limitu miejsc; NOT VALID, bo starsze gry mogą już być przepełnione
+ALTER TABLE games_posts DROP CONSTRAINT IF EXISTS games_posts_seats_check;
+ALTER TABLE games_posts ADD CONSTRAINT games_posts_seats_check
+    CHECK (accepted_players >= 0 AND accepted_players <= max_players) NOT VALID;
+
+CREATE OR REPLACE FUNCTION sync_accepted_players() RETURNS trigger AS $$
+BEGIN
+    IF TG_OP IN ('DELETE', 'UPDATE') THEN
+        UPDATE games_posts g SET accepted_players = g.accepted_players - 1
+        FROM chat_rooms r
+        WHERE r.id = OLD.chatroom_id AND g.id = r.game_id AND g.gm_id IS DISTINCT FROM OLD.user_id;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        UPDATE games_posts g SET accepted_players = g.accepted_players + 1
+        FROM chat_rooms r
+        WHERE r.id = NEW.chatroom_id AND g.id = r.game_id AND g.gm_id IS DISTINCT FROM NEW.user_id;
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS users_in_chat_seats ON users_in_chat;
+CREATE TRIGGER users_in_chat_seats
+    AFTER INSERT OR DELETE OR UPDATE OF chatroom_id, user_id ON users_in_chat
+    FOR EACH ROW
+    EXECUTE FUNCTION sync_accepted_players();
+
+-- Tablica gier z filtrem "wolne miejsca" (queries.get_games_page)
+CREATE INDEX IF NOT EXISTS games_posts_open_idx ON games_posts (id) WHERE accepted_players < max_players;
@@ -0,0 +1,10 @@
+-- Sesje użytkowników (SESSION_BACKEND = "postgres").
+-- Tabela jest UNLOGGED: zapisy nie trafiają do WAL, a po awarii serwera tabela jest pusta
+-- i użytkownicy logują się ponownie. Trwałe sesje: ALTER TABLE sessions SET LOGGED;
+CREATE UNLOGGED TABLE IF NOT EXISTS sessions (
+    id VARCHAR(64) PRIMARY KEY,
+    data TEXT NOT NULL,
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS sessions_expires_at_idx ON sessions (expires_at);
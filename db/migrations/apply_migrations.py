@@ -1,6 +1,46 @@
+"""
+Migration runner.
+
+Applies the .sql files of this directory in name order and records them in the
+`migrations` table with a checksum. Safe to start on several app nodes at once:
+runners take a Postgres advisory lock, so one applies the pending migrations
+and the others wait and find nothing left to do. A migration whose file changed
+after it was applied stops the runner (--update-checksums records the new
+checksums after a deliberate edit).
+
+Each migration runs in one transaction with its record, under lock_timeout: a
+statement that can't get its table lock in time (e.g. ALTER TABLE behind a long
+query) fails fast instead of queueing live traffic behind it, and the migration
+is retried. Header lines at the top of a file change that:
+
+    -- migrate: no-transaction       statements run one by one in autocommit, e.g.
+                                     CREATE INDEX CONCURRENTLY; a failed run starts
+                                     over, so every statement must be safe to rerun
+    -- migrate: lock_timeout=30s     per-migration lock timeout (0 disables it)
+
+A failed or cancelled CREATE INDEX CONCURRENTLY leaves an INVALID index behind,
+which IF NOT EXISTS would skip on the rerun. The runner drops the INVALID indexes
+a no-transaction migration creates before running it, and doesn't record it while
+any of them is still INVALID. Such indexes must be named explicitly.
+
+--dry-run applies the pending transactional migrations in one transaction that is
+rolled back, timing every statement; no-transaction migrations are only listed.
+
+After migrating, the runner creates the chat_messages partitions of the coming
+months (see db/partitions.py).
+
+    python -m db.migrations.apply_migrations [--dry-run] [--lock-timeout 5s]
+"""
 import os
+import re
+import time
+import hashlib
+import argparse
 from psycopg2 import connect, OperationalError
+from psycopg2.errors import LockNotAvailable
 from config import ProdConfig, DevConfig
+from db.cache import INVALIDATION_CHANNEL, INVALIDATE_ALL
+from db.partitions import create_partitions_ahead
 from os import environ
 
 # Wybór konfiguracji
@@ -11,6 +51,19 @@ if env == 'production':
 else:  # Domyślnie development
     config = DevConfig
 
+MIGRATION_DIR = os.path.dirname(os.path.abspath(__file__))
+# Klucz blokady doradczej (pg_advisory_lock) wspólny dla wszystkich instancji
+ADVISORY_LOCK_KEY = 7_181_026
+LOCK_TIMEOUT = "5s"
+RETRIES = 5
+CONCURRENT_INDEX = re.compile(r"CREATE\s+(?:UNIQUE\s+)?INDEX\s+CONCURRENTLY\s+(?:IF\s+NOT\s+EXISTS\s+)?(\S+)",
+                              re.IGNORECASE)
+
+
+class MigrationError(Exception):
+    """Raised when migrations can't be applied, e.g. an applied file was edited."""
+
+
 def connect_db():
     try:
         conn = connect(
@@ -26,38 +79,310 @@ def connect_db():
         print(f"Błąd połączenia z bazą danych: {e}")
         raise
 
-def apply_migrations(conn):
+
+def split_statements(sql):
+    """
+    Split a script into statements on top-level semicolons.
+    Semicolons inside quoted strings and identifiers, dollar-quoted bodies
+    ($$ ... $$, $fn$ ... $fn$) and comments don't split.
+    Args:
+        sql (str): The script.
+    Returns:
+        list: The statements without the trailing semicolons, comments kept.
+    """
+
+    statements = []
+    start = 0
+    i = 0
+    length = len(sql)
+    while i < length:
+        c = sql[i]
+        if c == "-" and sql.startswith("--", i):
+            end = sql.find("\n", i)
+            i = length if end == -1 else end + 1
+        elif c == "/" and sql.startswith("/*", i):
+            depth = 0
+            while i < length:
+                if sql.startswith("/*", i):
+                    depth += 1
+                    i += 2
+                elif sql.startswith("*/", i):
+                    depth -= 1
+                    i += 2
+                    if depth == 0:
+                        break
+                else:
+                    i += 1
+        elif c in ("'", '"'):
+            # '' i "" wewnątrz to escapowany cudzysłów - pętla po prostu czyta dalej
+            end = sql.find(c, i + 1)
+            i = length if end == -1 else end + 1
+        elif c == "$":
+            match = re.match(r"\$([A-Za-z_][A-Za-z_0-9]*)?\$", sql[i:])
+            if match:
+                end = sql.find(match.group(0), i + len(match.group(0)))
+                i = length if end == -1 else end + len(match.group(0))
+            else:
+                i += 1
+        elif c == ";":
+            statements.append(sql[start:i])
+            i += 1
+            start = i
+        else:
+            i += 1
+    statements.append(sql[start:])
+    return [s.strip() for s in statements if strip_comments(s).strip()]
+
+
+def strip_comments(sql):
+    return re.sub(r"--[^\n]*", "", sql)
+
+
+def read_migration(filename):
+    """
+    Read a migration file.
+    Returns:
+        dict: Filename, SQL, sha256 checksum and header options (transaction, lock_timeout).
+    """
+
+    with open(os.path.join(MIGRATION_DIR, filename), 'r') as f:
+        sql = f.read()
+    options = {"transaction": True, "lock_timeout": None}
+    for line in sql.splitlines():
+        if not line.startswith("--"):
+            break
+        match = re.match(r"--\s*migrate:\s*(.*)", line)
+        if not match:
+            continue
+        for option in match.group(1).split():
+            if option == "no-transaction":
+                options["transaction"] = False
+            elif option.startswith("lock_timeout="):
+                options["lock_timeout"] = option.partition("=")[2]
+            else:
+                raise MigrationError(f"{filename}: unknown option {option!r}")
+    return dict(options, filename=filename, sql=sql, checksum=hashlib.sha256(sql.encode("utf-8")).hexdigest())
+
+
+def ensure_migrations_table(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS migrations (
+            id SERIAL PRIMARY KEY,
+            filename VARCHAR(255) UNIQUE NOT NULL
+        );
+        ALTER TABLE migrations ADD COLUMN IF NOT EXISTS checksum CHAR(64);
+        ALTER TABLE migrations ADD COLUMN IF NOT EXISTS applied_at TIMESTAMPTZ DEFAULT now();
+        ALTER TABLE migrations ADD COLUMN IF NOT EXISTS duration_ms INTEGER;
+    """)
+
+
+def check_applied(cur, migrations, update_checksums=False):
+    """
+    Compare applied migrations with their files. Migrations applied before checksums
+    were recorded get the current file's checksum.
+    Returns:
+        set: Filenames already applied.
+    Raises:
+        MigrationError: If an applied file changed and update_checksums is not set.
+    """
+
+    cur.execute("SELECT filename, checksum FROM migrations")
+    applied = dict(cur.fetchall())
+    changed = []
+    for migration in migrations:
+        stored = applied.get(migration["filename"], False)
+        if stored is False or stored == migration["checksum"]:
+            continue
+        if stored is None or update_checksums:
+            cur.execute("UPDATE migrations SET checksum = %s WHERE filename = %s",
+                        (migration["checksum"], migration["filename"]))
+        else:
+            changed.append(migration["filename"])
+    if changed:
+        raise MigrationError(f"Applied migrations changed since they were applied: {', '.join(changed)}. "
+                             "Add a new migration instead, or rerun with --update-checksums.")
+    return set(applied)
+
+
+def run_statements(cur, migration, timings=None):
+    for statement in split_statements(migration["sql"]):
+        start = time.monotonic()
+        cur.execute(statement)
+        if timings is not None:
+            timings.append((time.monotonic() - start, statement))
+
+
+def record(cur, migration, duration):
+    cur.execute("INSERT INTO migrations (filename, checksum, duration_ms) VALUES (%s, %s, %s)",
+                (migration["filename"], migration["checksum"], int(duration * 1000)))
+    # Migracje mogą zmienić dane słownikowe - unieważnij cache aplikacji
+    cur.execute("SELECT pg_notify(%s, %s);", (INVALIDATION_CHANNEL, INVALIDATE_ALL))
+
+
+def apply_in_transaction(cur, migration, lock_timeout, retries):
+    """Apply a migration in one transaction, retrying when a table lock isn't granted in time."""
+    for attempt in range(retries + 1):
+        start = time.monotonic()
+        cur.execute("BEGIN")
+        try:
+            cur.execute("SET LOCAL lock_timeout = %s", (migration["lock_timeout"] or lock_timeout,))
+            run_statements(cur, migration)
+            record(cur, migration, time.monotonic() - start)
+            cur.execute("COMMIT")
+            return
+        except LockNotAvailable:
+            cur.execute("ROLLBACK")
+            if attempt == retries:
+                raise
+            delay = min(2 ** attempt, 30)
+            print(f"Lock timeout in {migration['filename']}, retrying in {delay}s")
+            time.sleep(delay)
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+
+def concurrent_indexes(migration):
+    """
+    Names of the indexes a migration builds with CREATE INDEX CONCURRENTLY.
+    Raises:
+        MigrationError: If such an index isn't named, so its leftovers can't be found.
+    """
+
+    names = []
+    for statement in split_statements(migration["sql"]):
+        match = CONCURRENT_INDEX.search(strip_comments(statement))
+        if not match:
+            continue
+        if match.group(1).upper() == "ON":
+            raise MigrationError(f"{migration['filename']}: name the index built with CREATE INDEX CONCURRENTLY")
+        names.append(match.group(1))
+    return names
+
+
+def invalid_indexes(cur, names):
+    """
+    Indexes among `names` left INVALID (pg_index.indisvalid) by an interrupted concurrent build.
+    Returns:
+        list: Their names, schema-qualified where needed.
+    """
+
+    if not names:
+        return []
+    cur.execute("""
+        SELECT indexrelid::regclass::text FROM pg_index
+        WHERE indexrelid = ANY(ARRAY(SELECT to_regclass(name) FROM unnest(%s::text[]) AS name)) AND NOT indisvalid
+    """, (names,))
+    return [row[0] for row in cur.fetchall()]
+
+
+def apply_without_transaction(cur, migration, lock_timeout):
+    """
+    Apply a no-transaction migration statement by statement in autocommit.
+    INVALID leftovers of its concurrent index builds are dropped first, so IF NOT EXISTS
+    doesn't skip them.
+    Raises:
+        MigrationError: If one of its indexes is still INVALID afterwards; the migration isn't recorded.
+    """
+
+    indexes = concurrent_indexes(migration)
+    start = time.monotonic()
+    cur.execute("SET lock_timeout = %s", (migration["lock_timeout"] or lock_timeout,))
+    try:
+        for index in invalid_indexes(cur, indexes):
+            print(f"Usuwanie nieprawidłowego indeksu {index} po przerwanej migracji")
+            cur.execute(f"DROP INDEX CONCURRENTLY IF EXISTS {index}")
+        run_statements(cur, migration)
+    finally:
+        cur.execute("RESET lock_timeout")
+    invalid = invalid_indexes(cur, indexes)
+    if invalid:
+        raise MigrationError(f"{migration['filename']}: indexes left INVALID: {', '.join(invalid)}; "
+                             "the migration was not recorded")
+    record(cur, migration, time.monotonic() - start)
+
+
+def dry_run(cur, pending, lock_timeout):
+    """Apply the pending migrations in one transaction that is rolled back, printing statement times."""
+    cur.execute("BEGIN")
+    try:
+        cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+        for migration in pending:
+            if not migration["transaction"]:
+                print(f"{migration['filename']}: no-transaction, not run in a dry run")
+                for statement in split_statements(migration["sql"]):
+                    print(f"    {' '.join(strip_comments(statement).split())[:100]}")
+                continue
+            timings = []
+            if migration["lock_timeout"]:
+                cur.execute("SET LOCAL lock_timeout = %s", (migration["lock_timeout"],))
+            run_statements(cur, migration, timings)
+            cur.execute("SET LOCAL lock_timeout = %s", (lock_timeout,))
+            print(f"{migration['filename']}: {sum(t for t, _ in timings) * 1000:.1f} ms")
+            for duration, statement in timings:
+                print(f"    {duration * 1000:9.1f} ms  {' '.join(strip_comments(statement).split())[:100]}")
+    finally:
+        cur.execute("ROLLBACK")
+
+
+def apply_migrations(conn, dry=False, lock_timeout=LOCK_TIMEOUT, retries=RETRIES, update_checksums=False):
+    """
+    Apply the pending migrations, holding the runner's advisory lock.
+    Args:
+        conn (connection): Connection to migrate; switched to autocommit.
+        dry (bool): Time the pending migrations and roll them back.
+        lock_timeout (str): Default lock_timeout of the migrations, e.g. "5s".
+        retries (int): Retries of a transactional migration that hit the lock timeout.
+        update_checksums (bool): Accept edited applied migrations and store their new checksums.
+    Returns:
+        list: Filenames applied (or timed, in a dry run).
+    """
+
+    conn.autocommit = True
     with conn.cursor() as cur:
-        # Keep track of applied migrations
-        cur.execute("""
-            CREATE TABLE IF NOT EXISTS migrations (
-                id SERIAL PRIMARY KEY,
-                filename VARCHAR(255) UNIQUE NOT NULL
-            );
-        """)
-        conn.commit()
-
-        # Get list of applied migrations
-        cur.execute("SELECT filename FROM migrations;")
-        applied_migrations = {row[0] for row in cur.fetchall()}
-
-        # Apply new migrations
-        migration_dir = os.path.dirname(os.path.abspath(__file__))
-        migration_files = sorted(f for f in os.listdir(migration_dir) if f.endswith('.sql'))
-        print(f"Found migration files: {migration_files}")
-        for filename in migration_files:
-            if filename not in applied_migrations:
-                print(f"Applying migration: {filename}")
-                with open(os.path.join(migration_dir, filename), 'r') as f:
-                    sql = f.read()
-                    cur.execute(sql)
-                    cur.execute("INSERT INTO migrations (filename) VALUES (%s);", (filename,))
-                    conn.commit()
-                    print(f"Applied migration: {filename}")
-  
+        cur.execute("SELECT pg_try_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        if not cur.fetchone()[0]:
+            print("Another migration runner is active, waiting for it")
+            cur.execute("SELECT pg_advisory_lock(%s)", (ADVISORY_LOCK_KEY,))
+        try:
+            ensure_migrations_table(cur)
+            files = sorted(f for f in os.listdir(MIGRATION_DIR) if f.endswith('.sql'))
+            migrations = [read_migration(f) for f in files]
+            applied = check_applied(cur, migrations, update_checksums)
+            pending = [m for m in migrations if m["filename"] not in applied]
+            print(f"Found migration files: {files}")
+            if dry:
+                dry_run(cur, pending, lock_timeout)
+                return [m["filename"] for m in pending]
+            for migration in pending:
+                print(f"Applying migration: {migration['filename']}")
+                start = time.monotonic()
+                if migration["transaction"]:
+                    apply_in_transaction(cur, migration, lock_timeout, retries)
+                else:
+                    apply_without_transaction(cur, migration, lock_timeout)
+                print(f"Applied migration: {migration['filename']} ({time.monotonic() - start:.2f}s)")
+            created = create_partitions_ahead(cur)
+            if created:
+                print(f"Created {created} chat_messages partitions")
+            return [m["filename"] for m in pending]
+        finally:
+            cur.execute("SELECT pg_advisory_unlock(%s)", (ADVISORY_LOCK_KEY,))
+
 
 if __name__ == '__main__':
-    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="time the pending migrations and roll them back")
+    parser.add_argument("--lock-timeout", default=LOCK_TIMEOUT, help="default lock_timeout, e.g. 5s (0 disables)")
+    parser.add_argument("--retries", type=int, default=RETRIES, help="retries after a lock timeout")
+    parser.add_argument("--update-checksums", action="store_true",
+                        help="store the checksums of edited applied migrations instead of failing")
+    args = parser.parse_args()
     conn = connect_db()
-    apply_migrations(conn)
-    conn.close()
\ No newline at end of file
+    try:
+        apply_migrations(conn, dry=args.dry_run, lock_timeout=args.lock_timeout, retries=args.retries,
+                         update_checksums=args.update_checksums)
+    except MigrationError as e:
+        raise SystemExit(f"Błąd migracji: {e}")
+    finally:
+        conn.close()
@@ -0,0 +1,5 @@
+-- migrate: no-transaction
+-- Tablica gier z filtrami systemu i "wolne miejsca" naraz (queries.get_games_page).
+-- CONCURRENTLY nie blokuje zapisów do games_posts; nie działa w transakcji, stąd no-transaction.
+CREATE INDEX CONCURRENTLY IF NOT EXISTS games_posts_system_open_idx ON games_posts (system_id, id)
+    WHERE accepted_players < max_players;
@@ -0,0 +1,59 @@
+-- migrate: lock_timeout=30s
+-- Wiadomości czatu partycjonowane miesięcznie po "timestamp" (chat_messages_pRRRR_MM).
+-- Partycje na kolejne miesiące zakłada runner migracji i `python -m db.partitions maintain`;
+-- celowo bez partycji DEFAULT - przy niej planer nie czyta partycji po kolei (ordered Append).
+-- Tabela jest przepisywana raz, w transakcji migracji.
+
+CREATE OR REPLACE FUNCTION create_chat_partitions(from_ts timestamp, to_ts timestamp) RETURNS integer AS $$
+DECLARE
+    month timestamp := date_trunc('month', from_ts);
+    partition text;
+    created integer := 0;
+BEGIN
+    -- Równoległe wywołania (runner, cron) czekają na siebie do końca transakcji
+    PERFORM pg_advisory_xact_lock(hashtext('create_chat_partitions'));
+    WHILE month <= to_ts LOOP
+        partition := 'chat_messages_p' || to_char(month, 'YYYY_MM');
+        IF to_regclass(partition) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I PARTITION OF chat_messages FOR VALUES FROM (%L) TO (%L)',
+                           partition, month, month + interval '1 month');
+            created := created + 1;
+        END IF;
+        month := month + interval '1 month';
+    END LOOP;
+    RETURN created;
+END
+$$ LANGUAGE plpgsql;
+
+ALTER TABLE chat_messages RENAME TO chat_messages_unpartitioned;
+ALTER INDEX chat_messages_pkey RENAME TO chat_messages_unpartitioned_pkey;
+ALTER TABLE chat_messages_unpartitioned
+    DROP CONSTRAINT IF EXISTS chat_messages_chatroom_id_fkey,
+    DROP CONSTRAINT IF EXISTS chat_messages_user_id_fkey;
+DROP INDEX IF EXISTS chat_messages_chatroom_id_idx;
+DROP INDEX IF EXISTS chat_messages_chatroom_timestamp_idx;
+ALTER SEQUENCE chat_messages_id_seq OWNED BY NONE;
+
+-- Klucz partycjonowania musi być częścią klucza głównego
+CREATE TABLE chat_messages (
+    id INTEGER NOT NULL DEFAULT nextval('chat_messages_id_seq'),
+    chatroom_id INTEGER REFERENCES chat_rooms(id),
+    user_id INTEGER REFERENCES users(id),
+    message VARCHAR(2000) NOT NULL,
+    "timestamp" TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id, "timestamp")
+) PARTITION BY RANGE ("timestamp");
+ALTER SEQUENCE chat_messages_id_seq OWNED BY chat_messages.id;
+
+-- Kursor po id (since, wyszukanie wiadomości) i historia pokoju od najnowszych
+CREATE INDEX chat_messages_chatroom_id_idx ON chat_messages (chatroom_id, id);
+CREATE INDEX chat_messages_chatroom_timestamp_id_idx ON chat_messages (chatroom_id, "timestamp", id);
+
+SELECT create_chat_partitions(COALESCE(min("timestamp"), localtimestamp), localtimestamp + interval '3 months')
+FROM chat_messages_unpartitioned;
+
+INSERT INTO chat_messages (id, chatroom_id, user_id, message, "timestamp")
+SELECT id, chatroom_id, user_id, message, COALESCE("timestamp", localtimestamp)
+FROM chat_messages_unpartitioned;
+
+DROP TABLE chat_messages_unpartitioned;
@@ -0,0 +1,31 @@
+-- rate_limit_hit() z add_rate_limits181026.sql pobierał żeton z każdego kubełka, który go miał,
+-- także przy odmowie: odrzucone żądania spoza wyczerpanego kubełka IP opróżniały kubełek użytkownika.
+-- Teraz najpierw uzupełnia (i blokuje) wszystkie kubełki, a żeton pobiera tylko, gdy każdy go ma.
+-- Zwraca 0, gdy żądanie jest dozwolone, inaczej liczbę sekund do żetonu we wszystkich kubełkach.
+CREATE OR REPLACE FUNCTION rate_limit_hit(keys text[], rate double precision, burst double precision)
+RETURNS double precision AS $$
+DECLARE
+    now_ts timestamptz := clock_timestamp();
+    bucket_key text;
+    available double precision;
+    lowest double precision := burst;
+BEGIN
+    FOREACH bucket_key IN ARRAY keys LOOP
+        -- Uzupełnienie nie zmienia chwili, w której kubełek będzie pełny (full_at)
+        INSERT INTO rate_limits AS b (key, tokens, updated_at, full_at)
+        VALUES (bucket_key, burst, now_ts, now_ts)
+        ON CONFLICT (key) DO UPDATE
+            SET tokens = LEAST(burst, b.tokens + extract(epoch FROM now_ts - b.updated_at) * rate),
+                updated_at = now_ts
+        RETURNING tokens INTO available;
+        lowest := LEAST(lowest, available);
+    END LOOP;
+    IF lowest < 1 THEN
+        RETURN (1 - lowest) / rate;
+    END IF;
+    UPDATE rate_limits
+    SET tokens = tokens - 1, full_at = now_ts + make_interval(secs => (burst - tokens + 1) / rate)
+    WHERE key = ANY(keys);
+    RETURN 0;
+END;
+$$ LANGUAGE plpgsql;
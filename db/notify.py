@@ -0,0 +1,163 @@
+import json
+import queue
+import select
+import threading
+import time
+from psycopg2 import connect, OperationalError, InterfaceError
+
+
+class NotificationListener:
+    """
+    Background thread receiving Postgres NOTIFY messages on one dedicated connection.
+
+    Callbacks are registered per channel and called from the listener thread with
+    the notification payload (a string). After the connection is lost and
+    re-established, notifications sent in between are gone, so every callback is
+    called once with None to let subscribers resynchronise.
+    Args:
+        connect_kwargs (dict): Keyword arguments passed to psycopg2.connect.
+        poll_interval (float): Seconds between checks for newly subscribed channels.
+        reconnect_delay (float): Seconds to wait before reconnecting after an error.
+    """
+
+    def __init__(self, connect_kwargs, poll_interval=1.0, reconnect_delay=1.0):
+        self.connect_kwargs = connect_kwargs
+        self.poll_interval = poll_interval
+        self.reconnect_delay = reconnect_delay
+        self._callbacks = {}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def subscribe(self, channel, callback):
+        """
+        Register a callback for a channel. The channel is LISTENed to on the next poll.
+        Args:
+            channel (str): The NOTIFY channel name.
+            callback (callable): Called with the payload string, or None after a reconnect.
+        Returns:
+            None
+        """
+
+        with self._lock:
+            self._callbacks.setdefault(channel, []).append(callback)
+
+    def start(self):
+        """Start the listener thread if it isn't running yet."""
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="pg-notify-listener", daemon=True)
+                self._thread.start()
+
+    def after_fork(self):
+        """Forget the parent's listener thread in a forked child; start() runs a new one."""
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def _dispatch(self, channel, payload):
+        with self._lock:
+            callbacks = list(self._callbacks.get(channel, []))
+        for callback in callbacks:
+            try:
+                callback(payload)
+            except Exception as e:
+                print(f"Błąd obsługi powiadomienia {channel}: {e}")
+
+    def _run(self):
+        conn = None
+        listening = set()
+        reconnected = False
+        while True:
+            try:
+                if conn is None or conn.closed:
+                    conn = connect(**self.connect_kwargs)
+                    conn.autocommit = True
+                    listening = set()
+                with self._lock:
+                    channels = set(self._callbacks)
+                with conn.cursor() as cur:
+                    for channel in channels - listening:
+                        cur.execute(f'LISTEN "{channel}"')
+                        listening.add(channel)
+                if reconnected:
+                    reconnected = False
+                    for channel in listening:
+                        self._dispatch(channel, None)
+                if select.select([conn], [], [], self.poll_interval) != ([], [], []):
+                    conn.poll()
+                    while conn.notifies:
+                        notify = conn.notifies.pop(0)
+                        self._dispatch(notify.channel, notify.payload)
+            except (OperationalError, InterfaceError) as e:
+                print(f"Utracono połączenie nasłuchujące: {e}")
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                conn = None
+                reconnected = True
+                time.sleep(self.reconnect_delay)
+
+
+class Broadcaster:
+    """
+    Fan-out of wake-up signals to per-key subscriber queues (e.g. one key per chat room).
+    Each queue holds at most one pending signal; subscribers re-read the database
+    after waking, so coalescing several signals into one loses nothing.
+    """
+
+    def __init__(self):
+        self._subscribers = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, key):
+        """
+        Create a queue that is signalled whenever `key` is published.
+        Args:
+            key: The subscription key.
+        Returns:
+            queue.Queue: The subscriber's queue.
+        """
+
+        q = queue.Queue(maxsize=1)
+        with self._lock:
+            self._subscribers.setdefault(key, set()).add(q)
+        return q
+
+    def unsubscribe(self, key, q):
+        with self._lock:
+            subscribers = self._subscribers.get(key)
+            if subscribers is not None:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self._subscribers[key]
+
+    def publish(self, key):
+        with self._lock:
+            subscribers = list(self._subscribers.get(key, ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(True)
+            except queue.Full:
+                pass
+
+    def publish_all(self):
+        with self._lock:
+            keys = list(self._subscribers)
+        for key in keys:
+            self.publish(key)
+
+    def publish_json(self, payload, field):
+        """
+        Listener callback: publish to the key found in a JSON payload, or to everyone on None.
+        Args:
+            payload (str or None): The NOTIFY payload.
+            field (str): Name of the payload field holding the key.
+        Returns:
+            None
+        """
+
+        if payload is None:
+            self.publish_all()
+            return
+        self.publish(json.loads(payload)[field])
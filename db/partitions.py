@@ -0,0 +1,386 @@
+"""
+Monthly partitions of chat_messages: creation ahead of time, retention with a
+cold archive on disk, and restore.
+
+Partitions are named chat_messages_pYYYY_MM and hold one calendar month of
+"timestamp". There is no default partition (it would stop the planner from reading
+the partitions newest first), so a message can only be stored once its month's
+partition exists: the migration runner creates the partitions for the coming
+CHAT_PARTITIONS_AHEAD months on every run, every app process does the same once a day
+(PartitionKeeper, started with the app's services) and so does `maintain`. /metrics
+reports how many days of partitions are left (chat_partitions_horizon_days), so a
+keeper that keeps failing can raise an alert before inserts do.
+
+`maintain` also applies the retention policy: partitions whose month ended more than
+CHAT_RETENTION_MONTHS months ago are detached (CONCURRENTLY, chat queries keep
+running), streamed with COPY into <archive dir>/chat_messages_pYYYY_MM.<time>.copy.gz
+next to a .json manifest (rows, columns, sha256), and dropped once the file is on
+disk with every row. `restore` loads an archive back into its month's partition.
+
+    python -m db.partitions list
+    python -m db.partitions maintain [--retention-months 12] [--archive-dir archive/chat] [--dry-run]
+    python -m db.partitions restore archive/chat/chat_messages_p2025_01.20261018T120000.copy.gz
+"""
+import os
+import re
+import gzip
+import json
+import hashlib
+import time
+import argparse
+import threading
+from datetime import date, datetime
+from psycopg2 import sql
+from config import ProdConfig, DevConfig
+from os import environ
+
+# Wybór konfiguracji
+env = environ.get('FLASK_ENV', 'development')
+
+if env == 'production':
+    config = ProdConfig
+else:  # Domyślnie development
+    config = DevConfig
+
+PARTITION_RE = re.compile(r"^chat_messages_p(\d{4})_(\d{2})$")
+ARCHIVE_COLUMNS = ("id", "chatroom_id", "user_id", "message", "timestamp")
+# Rozmiar bloku strumienia COPY
+COPY_BUFFER = 65536
+
+
+class ArchiveError(Exception):
+    """Raised when a partition can't be archived or an archive can't be restored."""
+
+
+def partition_month(name):
+    """
+    Month of a partition from its name.
+    Returns:
+        date or None: First day of the month, or None for other table names.
+    """
+
+    match = PARTITION_RE.match(name)
+    return date(int(match.group(1)), int(match.group(2)), 1) if match else None
+
+
+def add_months(month, months):
+    index = month.year * 12 + month.month - 1 + months
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def create_partitions(cur, from_month, to_month):
+    """
+    Create the missing partitions for the months from from_month to to_month.
+    Returns:
+        int: Number of partitions created.
+    """
+
+    cur.execute("SELECT create_chat_partitions(%s, %s)", (from_month, to_month))
+    return cur.fetchone()[0]
+
+
+def create_partitions_ahead(cur, months_ahead=config.CHAT_PARTITIONS_AHEAD):
+    """
+    Create the partitions of this month and the next months_ahead months.
+    Does nothing before the migration that partitions chat_messages.
+    Returns:
+        int: Number of partitions created.
+    """
+
+    cur.execute("SELECT to_regproc('create_chat_partitions') IS NOT NULL")
+    if not cur.fetchone()[0]:
+        return 0
+    cur.execute("SELECT create_chat_partitions(localtimestamp, localtimestamp + make_interval(months => %s))",
+                (months_ahead,))
+    return cur.fetchone()[0]
+
+
+def partition_horizon(cur, today=None):
+    """
+    End of the attached partitions that follow on from this month: the first day a
+    message can't be stored.
+    Returns:
+        date: First day of the first month from this one without a partition.
+    """
+
+    today = today or date.today()
+    months = {p["month"] for p in list_partitions(cur) if p["attached"]}
+    month = date(today.year, today.month, 1)
+    while month in months:
+        month = add_months(month, 1)
+    return month
+
+
+class PartitionKeeper:
+    """
+    Creates the chat_messages partitions of the coming months from the running app.
+
+    A background thread calls create_partitions_ahead when the app starts and then
+    every `interval` seconds, so inserts don't depend on the migration runner or cron
+    having run lately. Every process runs its own keeper; create_chat_partitions()
+    serialises them with an advisory lock and skips existing partitions.
+    Args:
+        pool (ConnectionPool): Pool to check connections out of.
+        months_ahead (int): Months after the current one that need a partition.
+        interval (float): Seconds between runs.
+    """
+
+    def __init__(self, pool, months_ahead=config.CHAT_PARTITIONS_AHEAD, interval=86400.0):
+        self.pool = pool
+        self.months_ahead = months_ahead
+        self.interval = interval
+        self.horizon = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Start the background thread; later calls do nothing."""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run_forever, name="partition-keeper", daemon=True)
+                self._thread.start()
+
+    def after_fork(self):
+        """Forget the parent's thread in a forked child."""
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _run_forever(self):
+        while True:
+            try:
+                self.run()
+            except Exception as e:
+                print(f"Błąd zakładania partycji chat_messages: {e}")
+            time.sleep(self.interval)
+
+    def run(self):
+        """
+        Create the missing partitions and record the horizon.
+        Returns:
+            int: Number of partitions created.
+        """
+
+        with self.pool.connection() as conn:
+            with conn.cursor() as cur:
+                created = create_partitions_ahead(cur, self.months_ahead)
+                self.horizon = partition_horizon(cur)
+            conn.commit()
+        if created:
+            print(f"Utworzono partycje chat_messages: {created}")
+        return created
+
+    def horizon_days(self, today=None):
+        """
+        Days until the first month without a partition, as of the last run.
+        Returns:
+            int or None: The days, or None before the first successful run.
+        """
+
+        if self.horizon is None:
+            return None
+        return (self.horizon - (today or date.today())).days
+
+
+def list_partitions(cur):
+    """
+    List the monthly tables of chat_messages, including ones detached by an interrupted archive.
+    Returns:
+        list: Dicts with name, month, attached, detach_pending and rows_estimate, oldest first.
+    """
+
+    cur.execute("""
+        SELECT c.relname, i.inhrelid IS NOT NULL, COALESCE(i.inhdetachpending, false), c.reltuples::bigint
+        FROM pg_class c
+        LEFT JOIN pg_inherits i ON i.inhrelid = c.oid AND i.inhparent = 'chat_messages'::regclass
+        WHERE c.relkind = 'r' AND c.relnamespace = 'public'::regnamespace
+          AND c.relname ~ '^chat_messages_p[0-9]{4}_[0-9]{2}$'
+        ORDER BY c.relname
+    """)
+    return [{"name": name, "month": partition_month(name), "attached": attached, "detach_pending": pending,
+             "rows_estimate": max(rows, 0)} for name, attached, pending, rows in cur.fetchall()]
+
+
+def expired_partitions(partitions, retention_months, today=None):
+    """
+    Partitions to archive: months that ended more than retention_months months ago,
+    and tables left detached by an interrupted archive.
+    Args:
+        partitions (list): Result of list_partitions.
+        retention_months (int): Full months kept besides the current one.
+        today (date, optional): Defaults to today.
+    Returns:
+        list: The partitions to archive, oldest first.
+    """
+
+    today = today or date.today()
+    cutoff = add_months(date(today.year, today.month, 1), -retention_months)
+    return [p for p in partitions if add_months(p["month"], 1) <= cutoff or not p["attached"]]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(COPY_BUFFER), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def write_atomically(path, write):
+    """Write a file through a temporary one, fsynced and renamed, so a crash never leaves half a file."""
+    with open(path + ".tmp", "wb") as f:
+        write(f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+def archive_partition(conn, partition, archive_dir):
+    """
+    Detach a partition, stream it into a gzip file with a manifest and drop it.
+    A partition whose archive fails stays detached (invisible to the app, data kept)
+    and is picked up again by the next maintain run.
+    Args:
+        conn (connection): Connection in autocommit mode (DETACH CONCURRENTLY needs it).
+        partition (dict): Entry of list_partitions.
+        archive_dir (str): Directory of the archives.
+    Returns:
+        tuple: The archive path and the number of rows.
+    Raises:
+        ArchiveError: If the archive doesn't hold every row of the partition.
+    """
+
+    name = partition["name"]
+    table = sql.Identifier(name)
+    with conn.cursor() as cur:
+        if partition["detach_pending"]:
+            cur.execute(sql.SQL("ALTER TABLE chat_messages DETACH PARTITION {} FINALIZE").format(table))
+        elif partition["attached"]:
+            # CONCURRENTLY: zapytania czatu nie czekają na blokadę całej tabeli
+            cur.execute(sql.SQL("ALTER TABLE chat_messages DETACH PARTITION {} CONCURRENTLY").format(table))
+        cur.execute(sql.SQL("SELECT count(*) FROM {}").format(table))
+        rows = cur.fetchone()[0]
+
+        os.makedirs(archive_dir, exist_ok=True)
+        path = os.path.join(archive_dir, f"{name}.{datetime.now():%Y%m%dT%H%M%S}.copy.gz")
+        copy = sql.SQL("COPY {} ({}) TO STDOUT").format(table, sql.SQL(", ").join(map(sql.Identifier, ARCHIVE_COLUMNS)))
+
+        def export(f):
+            with gzip.GzipFile(fileobj=f, mode="wb") as archive:
+                cur.copy_expert(copy, archive, size=COPY_BUFFER)
+        write_atomically(path, export)
+        if cur.rowcount != rows:
+            os.remove(path)
+            raise ArchiveError(f"{name}: exported {cur.rowcount} of {rows} rows")
+
+        manifest = {
+            "table": "chat_messages",
+            "partition": name,
+            "month": partition["month"].isoformat(),
+            "columns": list(ARCHIVE_COLUMNS),
+            "rows": rows,
+            "sha256": file_sha256(path),
+            "archived_at": datetime.now().isoformat(timespec="seconds"),
+        }
+        write_atomically(manifest_path(path), lambda f: f.write(json.dumps(manifest, indent=2).encode("utf-8")))
+        cur.execute(sql.SQL("DROP TABLE {}").format(table))
+    return path, rows
+
+
+def manifest_path(path):
+    return re.sub(r"\.copy\.gz$", "", path) + ".json"
+
+
+def restore_archive(conn, path):
+    """
+    Load an archive back into its month's partition, in one transaction.
+    Restoring a month older than the retention makes the next maintain archive it again.
+    Args:
+        conn (connection): Connection to the database.
+        path (str): The .copy.gz file written by archive_partition.
+    Returns:
+        int: Rows restored.
+    Raises:
+        ArchiveError: If the file doesn't match its manifest or the month already holds messages.
+    """
+
+    with open(manifest_path(path)) as f:
+        manifest = json.load(f)
+    if file_sha256(path) != manifest["sha256"]:
+        raise ArchiveError(f"{path}: checksum doesn't match the manifest")
+    name = manifest["partition"]
+    table = sql.Identifier(name)
+    month = partition_month(name)
+    with conn.cursor() as cur:
+        existing = {p["name"]: p for p in list_partitions(cur)}.get(name)
+        if existing is not None and not existing["attached"]:
+            raise ArchiveError(f"{name} exists but isn't attached; run maintain to finish its archive first")
+        create_partitions(cur, month, month)
+        cur.execute(sql.SQL("SELECT EXISTS (SELECT 1 FROM {})").format(table))
+        if cur.fetchone()[0]:
+            raise ArchiveError(f"{name} already holds messages")
+        copy = sql.SQL("COPY {} ({}) FROM STDIN").format(
+            table, sql.SQL(", ").join(map(sql.Identifier, manifest["columns"])))
+        with gzip.open(path, "rb") as archive:
+            cur.copy_expert(copy, archive, size=COPY_BUFFER)
+        if cur.rowcount != manifest["rows"]:
+            raise ArchiveError(f"{path}: restored {cur.rowcount} of {manifest['rows']} rows")
+        restored = cur.rowcount
+    conn.commit()
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("ANALYZE {}").format(table))
+    conn.commit()
+    return restored
+
+
+def maintain(conn, retention_months, archive_dir, months_ahead=config.CHAT_PARTITIONS_AHEAD, dry=False):
+    """
+    Create the coming months' partitions and archive the expired ones.
+    Returns:
+        list: Names of the partitions archived (or to archive, in a dry run).
+    """
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        if not dry:
+            created = create_partitions_ahead(cur, months_ahead)
+            print(f"Created {created} partitions")
+        expired = expired_partitions(list_partitions(cur), retention_months)
+    for partition in expired:
+        if dry:
+            print(f"Would archive {partition['name']} (~{partition['rows_estimate']} rows)")
+            continue
+        path, rows = archive_partition(conn, partition, archive_dir)
+        print(f"Archived {partition['name']}: {rows} rows to {path}")
+    return [p["name"] for p in expired]
+
+
+if __name__ == '__main__':
+    from db.migrations.apply_migrations import connect_db
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("list", help="list the partitions")
+    maintain_parser = commands.add_parser("maintain", help="create partitions ahead and archive expired ones")
+    maintain_parser.add_argument("--retention-months", type=int, default=config.CHAT_RETENTION_MONTHS)
+    maintain_parser.add_argument("--archive-dir", default=config.CHAT_ARCHIVE_DIR)
+    maintain_parser.add_argument("--months-ahead", type=int, default=config.CHAT_PARTITIONS_AHEAD)
+    maintain_parser.add_argument("--dry-run", action="store_true", help="only list what would be archived")
+    restore_parser = commands.add_parser("restore", help="load an archive back")
+    restore_parser.add_argument("path")
+    args = parser.parse_args()
+
+    conn = connect_db()
+    try:
+        if args.command == "list":
+            with conn.cursor() as cur:
+                for p in list_partitions(cur):
+                    state = "attached" if p["attached"] else "DETACHED"
+                    print(f"{p['name']:28} {state:9} ~{p['rows_estimate']} rows")
+        elif args.command == "maintain":
+            maintain(conn, args.retention_months, args.archive_dir, args.months_ahead, args.dry_run)
+        else:
+            print(f"Restored {restore_archive(conn, args.path)} rows")
+    except ArchiveError as e:
+        raise SystemExit(f"Błąd archiwizacji: {e}")
+    finally:
+        conn.close()
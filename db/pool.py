@@ -0,0 +1,272 @@
+import time
+import threading
+from contextlib import contextmanager
+from psycopg2 import connect, OperationalError, InterfaceError
+from psycopg2.extensions import TRANSACTION_STATUS_IDLE, TRANSACTION_STATUS_UNKNOWN
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection could be checked out before the timeout."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe, bounded pool of psycopg2 connections.
+
+    Connections are opened lazily up to `maxconn`, the first `minconn` together
+    on the first checkout, so creating the pool never touches the database;
+    callers that find the pool exhausted wait up to `timeout` seconds for a
+    connection to be returned.
+    A connection that sat idle for longer than `check_after` seconds is pinged
+    before it is handed out and transparently replaced if the server went away
+    (e.g. after a Postgres restart). Connections returned with an open or
+    failed transaction are rolled back, so one broken request can't poison
+    the connection for the next one.
+
+    A forked child (gunicorn --preload) must call after_fork() before using the
+    pool: connections opened by the parent share its sockets and are abandoned.
+    Args:
+        connect_kwargs (dict): Keyword arguments passed to psycopg2.connect.
+        minconn (int): Number of connections opened on the first checkout.
+        maxconn (int): Upper bound of open connections.
+        timeout (float): Seconds to wait for a free connection.
+        check_after (float): Idle seconds after which a connection is pinged.
+        connection_factory (type, optional): psycopg2 connection class, e.g. metrics.timed_connection_factory.
+        on_checkout (callable, optional): Called with the seconds each checkout waited.
+    """
+
+    def __init__(self, connect_kwargs, minconn=1, maxconn=10, timeout=5.0, check_after=30.0,
+                 connection_factory=None, on_checkout=None):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError("Invalid pool size")
+        self.connect_kwargs = connect_kwargs
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.check_after = check_after
+        self.connection_factory = connection_factory
+        self.on_checkout = on_checkout
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._closed = False
+        self._filled = False
+        self._inherited = []
+        self._stats = {
+            "checkouts": 0,
+            "timeouts": 0,
+            "reconnects": 0,
+            "discarded": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+        }
+
+    def _connect(self):
+        if self.connection_factory is not None:
+            return connect(connection_factory=self.connection_factory, **self.connect_kwargs)
+        return connect(**self.connect_kwargs)
+
+    def _is_alive(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except (OperationalError, InterfaceError):
+            return False
+
+    def _close_quietly(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _fill(self):
+        # Pierwsze pobranie w procesie otwiera od razu minconn połączeń
+        with self._cond:
+            if self._filled:
+                return
+            self._filled = True
+            missing = max(0, self.minconn - self._size)
+            self._size += missing
+        opened = []
+        try:
+            for _ in range(missing):
+                opened.append((self._connect(), time.monotonic()))
+        finally:
+            with self._cond:
+                self._size -= missing - len(opened)
+                self._idle.extend(opened)
+                self._cond.notify_all()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    def getconn(self, timeout=None):
+        """
+        Check out a connection, waiting for one to be returned if necessary.
+        Args:
+            timeout (float, optional): Seconds to wait instead of the pool's timeout; 0 doesn't wait.
+        Returns:
+            connection: A live psycopg2 connection with no open transaction.
+        Raises:
+            PoolTimeout: If no connection became available within the timeout.
+        """
+
+        timeout = self.timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+        if not self._filled:
+            self._fill()
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    if self._closed:
+                        raise PoolTimeout("Connection pool is closed")
+                    if self._idle:
+                        conn, last_used = self._idle.pop()
+                        break
+                    if self._size < self.maxconn:
+                        self._size += 1
+                        conn, last_used = None, None
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeout(f"No free connection after {timeout}s")
+                    self._cond.wait(remaining)
+            finally:
+                self._waiting -= 1
+
+        try:
+            if conn is None:
+                conn = self._connect()
+            elif not self._is_alive(conn, last_used):
+                self._close_quietly(conn)
+                conn = self._connect()
+                with self._cond:
+                    self._stats["reconnects"] += 1
+        except Exception:
+            self._release_slot()
+            raise
+
+        waited = time.monotonic() - start
+        with self._cond:
+            self._in_use += 1
+            self._stats["checkouts"] += 1
+            self._stats["wait_time_total"] += waited
+            self._stats["wait_time_max"] = max(self._stats["wait_time_max"], waited)
+        if self.on_checkout is not None:
+            self.on_checkout(waited)
+        return conn
+
+    def putconn(self, conn, discard=False):
+        """
+        Return a connection to the pool.
+        Any transaction left open is rolled back. Broken connections, or ones
+        returned with discard=True, are closed and their slot is freed.
+        Args:
+            conn (connection): The connection obtained from getconn.
+            discard (bool): Close the connection instead of reusing it.
+        Returns:
+            None
+        """
+
+        if not conn.closed and not discard:
+            status = conn.info.transaction_status
+            if status == TRANSACTION_STATUS_UNKNOWN:
+                discard = True
+            elif status != TRANSACTION_STATUS_IDLE:
+                try:
+                    conn.rollback()
+                except (OperationalError, InterfaceError):
+                    discard = True
+
+        with self._cond:
+            self._in_use -= 1
+            if discard or conn.closed or self._closed:
+                self._size -= 1
+                self._stats["discarded"] += 1
+                self._cond.notify()
+                reuse = False
+            else:
+                self._idle.append((conn, time.monotonic()))
+                self._cond.notify()
+                reuse = True
+        if not reuse:
+            self._close_quietly(conn)
+
+    @contextmanager
+    def connection(self, timeout=None):
+        """
+        Context manager checking out a connection and always returning it.
+        Uncommitted work is rolled back when the block exits.
+        Args:
+            timeout (float, optional): Seconds to wait for it, as in getconn.
+        """
+
+        conn = self.getconn(timeout)
+        try:
+            yield conn
+        finally:
+            self.putconn(conn)
+
+    def stats(self):
+        """
+        Snapshot of pool usage counters.
+        Returns:
+            dict: Pool size, idle/in-use/waiting counts and checkout wait times in seconds.
+        """
+
+        with self._cond:
+            stats = dict(self._stats)
+            stats.update({
+                "size": self._size,
+                "max_size": self.maxconn,
+                "idle": len(self._idle),
+                "in_use": self._in_use,
+                "waiting": self._waiting,
+            })
+        stats["wait_time_avg"] = stats["wait_time_total"] / stats["checkouts"] if stats["checkouts"] else 0.0
+        return stats
+
+    def after_fork(self):
+        """
+        Reset the pool in a forked child process.
+        The parent's connections are kept referenced but never used or closed:
+        closing them here would end the parent's sessions on the shared sockets.
+        Returns:
+            None
+        """
+
+        self._inherited.extend(conn for conn, _ in self._idle)
+        self._cond = threading.Condition()
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._waiting = 0
+        self._filled = False
+
+    def closeall(self):
+        """
+        Close all idle connections and refuse further checkouts.
+        Returns:
+            None
+        """
+
+        with self._cond:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._cond.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
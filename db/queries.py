@@ -1,9 +1,29 @@
-import psycopg2
-from psycopg2.extras import DictCursor
-from flask import Flask, render_template, request, flash
-from flask_bcrypt import generate_password_hash, check_password_hash
-from datetime import datetime
-
+import re
+from psycopg2.extras import execute_values
+from datetime import datetime, timedelta
+from db.view_models import (ProfileView, GameLink, Game, GameSearchResult, GameHeader, System, UserLogin,
+                            UserProfile, UserName, ChatRoom, ChatMessage, ExportedMessage, ExportedGame)
+
+DESCRIPTION_PREVIEW_LENGTH = 300
+# Konfiguracja wyszukiwania pełnotekstowego (migracja add_search181026.sql)
+SEARCH_CONFIG = "polish"
+SEARCH_MAX_WORDS = 8
+# Ranking obejmuje tylko tyle najnowszych trafień - częste słowa pasują do większości ogłoszeń
+SEARCH_CANDIDATES = 1000
+CHAT_CHANNEL = "chat_messages"
+
+# Wyniki apply_to_game
+APPLY_APPLIED = "applied"
+APPLY_GAME_NOT_FOUND = "game_not_found"
+APPLY_OWN_GAME = "own_game"
+APPLY_ALREADY_APPLIED = "already_applied"
+
+# Wyniki accept_player
+ACCEPT_ACCEPTED = "accepted"
+ACCEPT_GAME_NOT_FOUND = "game_not_found"
+ACCEPT_NOT_GM = "not_gm"
+ACCEPT_NO_SEATS = "no_seats"
+ACCEPT_NOT_WAITING = "not_waiting"
 
 
 def check_user_exist(cur, username):
@@ -13,31 +33,49 @@ def check_user_exist(cur, username):
         cur (cursor): The database cursor to execute the query.
         username (str): The username to check for existence.
     Returns:
-        tuple or None: Returns the user record as a tuple if the user exists, otherwise returns None.
+        bool: True if a user with this name exists.
     """
 
-    cur.execute("SELECT * FROM users WHERE name = %s", (username,))
+    cur.execute("SELECT EXISTS (SELECT 1 FROM users WHERE name = %s)", (username,))
+    return cur.fetchone()[0]
+
+def get_user_for_login(cur, column, user):
+    """
+    Fetch everything the login flow needs in one lookup: the stored hash,
+    the preferences flag and both role flags.
+    Args:
+        cur (cursor): The database cursor to execute the query.
+        column (str): The column to search by, "name" or "email".
+        user (str): The user name or email.
+    Returns:
+        UserLogin or None: The user (id, name, hash, filled_preferences, player, gm), or None if not found.
+    """
+
+    if column not in ("name", "email"):
+        raise ValueError(f"Unsupported login column: {column}")
+    cur.execute(f"""
+        SELECT u.id, u.name, u.hash, u.filled_preferences,
+            EXISTS (SELECT 1 FROM players WHERE players.user_id = u.id) AS player,
+            EXISTS (SELECT 1 FROM gms WHERE gms.user_id = u.id) AS gm
+        FROM users u WHERE u.{column} = %s
+    """, (user,))
     user = cur.fetchone()
     if user:
-        return user
+        return UserLogin._make(user)
     return None
 
-def check_user_password(cur, column, user, hash):
+def update_user_hash(cur, user_id, hash):
     """
-    Check if the provided user and hash match a record in the database.
+    Replaces a user's password hash, e.g. after the bcrypt cost factor changed.
     Args:
         cur (cursor): The database cursor to execute the query.
-        column (str): The column name to search for the user.
-        user (str): The user identifier to search for.
-        hash (str): The hash to verify against the stored hash.
+        user_id (int): The ID of the user.
+        hash (str): The new password hash.
     Returns:
-        dict or None: The user record if the hash matches, otherwise None.
+        None
     """
-    cur.execute(f"SELECT * FROM users WHERE {column} = %s", (user,))
-    user = cur.fetchone()
-    if user and check_password_hash(user["hash"], hash):
-        return user
-    return None
+
+    cur.execute("UPDATE users SET hash = %s WHERE id = %s", (hash, user_id))
 
 def add_user(cur, username, email, hash):
     """
@@ -107,13 +145,13 @@ def get_user_profile(cur, user):
         cur (cursor): The database cursor to execute the query.
         user (int): The ID of the user whose profile is to be retrieved.
     Returns:
-        tuple: A tuple containing the user's id, name, and email if the user is found.
+        UserProfile: The user's id, name, and email if the user is found.
         None: If the user is not found in the database.
     """
     cur.execute("SELECT id, name, email FROM users WHERE id = %s", (user,))
     user= cur.fetchone()
     if user:
-        return user
+        return UserProfile._make(user)
     return None
 
 def get_user_player_status(cur, user):
@@ -126,10 +164,8 @@ def get_user_player_status(cur, user):
         bool: True if the user exists in the players table, False otherwise.
     """
 
-    cur.execute("SELECT * FROM players WHERE user_id = %s", (user,))
-    if cur.fetchone():
-        return True
-    return False
+    cur.execute("SELECT EXISTS (SELECT 1 FROM players WHERE user_id = %s)", (user,))
+    return cur.fetchone()[0]
 
 def get_user_gm_status(cur, user):
     """
@@ -142,10 +178,8 @@ def get_user_gm_status(cur, user):
     """
     
 
-    cur.execute("SELECT * FROM gms WHERE user_id = %s", (user,))
-    if cur.fetchone():
-        return True
-    return False
+    cur.execute("SELECT EXISTS (SELECT 1 FROM gms WHERE user_id = %s)", (user,))
+    return cur.fetchone()[0]
 
 def add_game(cur, user, title, max_players, game_system, description):
     """
@@ -158,116 +192,620 @@ def add_game(cur, user, title, max_players, game_system, description):
     system _id (int): The game system id.
     description (str): A brief description of the game.
     Returns:
-    None
+    int: The id of the new game post.
     """
 
     cur.execute("INSERT INTO games_posts (title, system_id, max_players, description, gm_id, accepted_players) "
-                "VALUES (%s, %s, %s, %s, %s, %s)", (title, game_system, max_players, description, user, 0))
+                "VALUES (%s, %s, %s, %s, %s, %s) RETURNING id", (title, game_system, max_players, description, user, 0))
+    return cur.fetchone()[0]
                     
-def get_games(cur):
+def get_games_page(cur, before_id=None, limit=24, system_id=None, gm_id=None, open_seats=False):
     """
-    Fetches all records from the 'games_posts' table.
+    Fetches one page of game posts using keyset pagination, newest first.
+    Only a preview of each description is selected, so the page size doesn't depend on
+    how long the posts are.
     Args:
         cur: The database cursor to execute the query.
+        before_id (int, optional): Cursor - only games with an id lower than this are returned.
+        limit (int): Maximum number of games on the page.
+        system_id (int, optional): Only games using this game system.
+        gm_id (int, optional): Only games run by this game master.
+        open_seats (bool): Only games that still have free player seats.
     Returns:
-        list: A list of tuples containing all records from the 'games_posts' table.
+        tuple: A list of Game rows and the cursor for the next page (None on the last page).
     """
 
-    cur.execute("SELECT * FROM games_posts")
-    return cur.fetchall()
+    cur.execute(*games_page_query(before_id, limit, system_id, gm_id, open_seats))
+    return games_page_result(cur.fetchall(), limit)
 
-def update_last_login(cur, user_id):
+def games_page_query(before_id, limit, system_id, gm_id, open_seats):
+    """
+    Builds the SQL of get_games_page; shared with db/async_queries.py.
+    Returns:
+        tuple: The SQL string and its parameters.
+    """
+
+    conditions = []
+    params = [DESCRIPTION_PREVIEW_LENGTH]
+    if before_id is not None:
+        conditions.append("id < %s")
+        params.append(before_id)
+    if system_id is not None:
+        conditions.append("system_id = %s")
+        params.append(system_id)
+    if gm_id is not None:
+        conditions.append("gm_id = %s")
+        params.append(gm_id)
+    if open_seats:
+        # Ten sam warunek co w indeksie częściowym games_posts_open_idx
+        conditions.append("accepted_players < max_players")
+    where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+    params.append(limit + 1)
+    return f"""
+        SELECT id, title, system_id, max_players, LEFT(description, %s) AS description, gm_id, accepted_players, version
+        FROM games_posts {where}
+        ORDER BY id DESC
+        LIMIT %s
+    """, params
+
+def games_page_result(games, limit):
+    """
+    Splits the limit + 1 rows fetched by games_page_query into the page and the next cursor.
+    Args:
+        games (list): The fetched rows, as tuples.
+        limit (int): The page size.
+    Returns:
+        tuple: A list of Game rows and the cursor for the next page (None on the last page).
+    """
+
+    next_cursor = None
+    if len(games) > limit:
+        games = games[:limit]
+        next_cursor = games[-1][0]
+    return list(map(Game._make, games)), next_cursor
+
+def search_words(text):
+    """
+    Splits the user's search text into words. Only letters and digits are kept, so the
+    input can't inject tsquery operators.
+    Args:
+        text (str): The search text.
+    Returns:
+        list: At most SEARCH_MAX_WORDS words.
+    """
+
+    return re.findall(r"[^\W_]+", text or "")[:SEARCH_MAX_WORDS]
+
+def search_query_text(text):
+    """
+    Turns the user's search text into a to_tsquery string in which every word must match
+    the beginning of a word in the post, so "smok" also finds "smoka" and "smokiem".
+    Args:
+        text (str): The search text.
+    Returns:
+        str or None: The tsquery text, or None when the input has no words.
+    """
+
+    words = search_words(text)
+    if not words:
+        return None
+    return " & ".join(f"{word}:*" for word in words)
+
+# Szacunek z pg_stats: odsetek ogłoszeń zawierających najrzadsze ze słów (jako prefiks)
+# i liczba ogłoszeń. Planer przyjmuje dla zapytań prefiksowych stałe 2%, więc wybór
+# planu w search_games opiera się na tym szacunku.
+SEARCH_STATS_SQL = """
+    SELECT (SELECT reltuples FROM pg_class WHERE oid = 'games_posts'::regclass), min(frequency)
+    FROM (
+        SELECT COALESCE(sum(stats.frequency), 0) AS frequency
+        FROM unnest(%s::text[]) word
+        CROSS JOIN LATERAL (SELECT (tsvector_to_array(to_tsvector(%s::regconfig, word)))[1] AS lexeme) normalized
+        LEFT JOIN (
+            SELECT unnest(most_common_elems::text::text[]) AS element, unnest(most_common_elem_freqs) AS frequency
+            FROM pg_stats
+            WHERE schemaname = current_schema() AND tablename = 'games_posts' AND attname = 'search_vector'
+        ) stats ON starts_with(stats.element, normalized.lexeme)
+        GROUP BY word
+    ) words
+"""
+
+# Kandydaci do rankingu: najnowsze trafienia. "newest" idzie po kluczu głównym od końca
+# (ts_match_vq zamiast @@, żeby planer nie sięgnął po indeks GIN), "index" zbiera trafienia
+# z indeksu GIN (OFFSET 0 nie pozwala planerowi zamienić tego na przejście po kluczu; filtr systemu
+# jest poza podzapytaniem, bo łączenie z indeksem systemu kosztuje więcej niż kilka rzadkich trafień).
+SEARCH_CANDIDATES_SQL = {
+    "newest": """
+        SELECT id, title, system_id, max_players, LEFT(description, %s) AS description, gm_id, accepted_players,
+               version, search_vector, query
+        FROM games_posts, to_tsquery(%s::regconfig, %s) query
+        WHERE ts_match_vq(search_vector, query) {system_and}
+        ORDER BY id DESC
+        LIMIT %s
+    """,
+    "index": """
+        SELECT * FROM (
+            SELECT id, title, system_id, max_players, LEFT(description, %s) AS description, gm_id,
+                   accepted_players, version, search_vector, query
+            FROM games_posts, to_tsquery(%s::regconfig, %s) query
+            WHERE search_vector @@ query
+            OFFSET 0
+        ) matches
+        {system_where}
+        ORDER BY id DESC
+        LIMIT %s
+    """,
+}
+
+def search_strategy(cur, words):
     """
-    Updates the last login timestamp for a user in the database.
+    Chooses how search_games collects candidates. Walking posts newest first reads about
+    SEARCH_CANDIDATES / frequency rows, collecting matches from the GIN index reads about
+    frequency * rows, so the walk wins for words more frequent than sqrt(SEARCH_CANDIDATES / rows).
     Args:
         cur: The database cursor to execute the query.
-        user_id: The ID of the user whose last login timestamp is to be updated.
+        words (list): The search words.
+    Returns:
+        str: "newest" or "index".
+    """
+
+    cur.execute(SEARCH_STATS_SQL, (words, SEARCH_CONFIG))
+    row = cur.fetchone()
+    if not row or not row[0] or not row[1] or row[0] <= 0:
+        return "index"
+    return "newest" if row[1] > (SEARCH_CANDIDATES / row[0]) ** 0.5 else "index"
+
+def search_games(cur, text, system_id=None, limit=24, offset=0, strategy=None):
+    """
+    Full-text search over game titles and descriptions, best matches first.
+    Only the SEARCH_CANDIDATES newest matching posts are ranked, so common words stay as cheap
+    as rare ones. Title matches rank above description matches.
+    Args:
+        cur: The database cursor to execute the query.
+        text (str): The search text.
+        system_id (int, optional): Only games using this game system.
+        limit (int): Maximum number of games on the page.
+        offset (int): Number of better ranked games to skip.
+        strategy (str, optional): "newest" or "index"; chosen by search_strategy when omitted.
+    Returns:
+        tuple: A list of GameSearchResult rows and the offset of the next page (None on the last page).
+    """
+
+    query = search_query_text(text)
+    if query is None:
+        return [], None
+    if strategy is None:
+        strategy = search_strategy(cur, search_words(text))
+    system_and = system_where = ""
+    params = [DESCRIPTION_PREVIEW_LENGTH, SEARCH_CONFIG, query]
+    if system_id is not None:
+        system_and = "AND system_id = %s"
+        system_where = "WHERE system_id = %s"
+        params.append(system_id)
+    params += [SEARCH_CANDIDATES, limit + 1, offset]
+    candidates = SEARCH_CANDIDATES_SQL[strategy].format(system_and=system_and, system_where=system_where)
+    cur.execute(f"""
+        SELECT id, title, system_id, max_players, description, gm_id, accepted_players, version,
+               ts_rank(search_vector, query) AS rank
+        FROM ({candidates}) candidates
+        ORDER BY rank DESC, id DESC
+        LIMIT %s OFFSET %s
+    """, params)
+    games = list(map(GameSearchResult._make, cur.fetchall()))
+    if len(games) > limit:
+        return games[:limit], offset + limit
+    return games, None
+
+def bulk_update_last_login(cur, logins):
+    """
+    Updates the last login timestamps of many users with one statement.
+    A timestamp never moves backwards, so out-of-order flushes are harmless.
+    Args:
+        cur: The database cursor to execute the query.
+        logins (iterable): Pairs of (user_id, last_login datetime).
     Returns:
         None
     """
 
-    cur.execute("UPDATE users SET last_login = %s WHERE id = %s", 
-                (datetime.now(), user_id))
+    execute_values(cur, """
+        UPDATE users SET last_login = v.last_login
+        FROM (VALUES %s) AS v(id, last_login)
+        WHERE users.id = v.id AND (users.last_login IS NULL OR users.last_login < v.last_login)
+    """, list(logins), template="(%s, %s::timestamp)", page_size=1000)
+
+SYSTEMS_SQL = "SELECT id, title FROM systems ORDER BY id"
 
 def get_systems(cur):
     """
-    Retrieve all records from the 'systems' table.
+    Retrieve all game systems.
     Args:
         cur: The database cursor to execute the query.
     Returns:
-        list: A list of tuples containing all records from the 'systems' table.
+        list: System rows (id, title).
     """
-    cur.execute("SELECT * FROM systems")
-    return cur.fetchall()
+    cur.execute(SYSTEMS_SQL)
+    return list(map(System._make, cur.fetchall()))
+
+# Kolumny gry bez search_vector (wyliczany tsvector bywa dłuższy niż sam opis)
+GAME_COLUMNS = "id, title, system_id, max_players, description, gm_id, accepted_players, version"
+GAME_BY_ID_SQL = f"SELECT {GAME_COLUMNS} FROM games_posts WHERE id = %s"
 
 def get_game_by_id(cur, id):
-    cur.execute("SELECT * FROM games_posts WHERE id = %s", (id,))
+    """
+    Fetches a game post with its whole description.
+    Args:
+        cur: The database cursor to execute the query.
+        id (int): The id of the game post.
+    Returns:
+        Game or None: The game, or None if it doesn't exist.
+    """
+
+    cur.execute(GAME_BY_ID_SQL, (id,))
     game= cur.fetchone()
     if game:
-        columns = [desc[0] for desc in cur.description]
-        game_dict = dict(zip(columns, game))
-        return game_dict
+        return Game._make(game)
     return None
 
+GAMES_BY_IDS_SQL = f"SELECT {GAME_COLUMNS} FROM games_posts WHERE id = ANY(%s)"
+
+def get_games_by_ids(cur, ids):
+    """
+    Fetches many game posts in one query.
+    Args:
+        cur: The database cursor to execute the query.
+        ids (list): The ids of the game posts.
+    Returns:
+        list: Game rows, in no particular order; unknown ids are skipped.
+    """
+
+    cur.execute(GAMES_BY_IDS_SQL, (list(ids),))
+    return list(map(Game._make, cur.fetchall()))
+
 def get_game_title_and_gm(cur, id):
     cur.execute("SELECT title, gm_id FROM games_posts WHERE id = %s", (id,))
     game = cur.fetchone()
     if game:
-        return game
+        return GameHeader._make(game)
     return None
 
-def create_chatroom(cur, game_id):
-    cur.execute("INSERT INTO chat_rooms (game_id) VALUES (%s)", (game_id,))
-    
+CHAT_BY_GAME_SQL = "SELECT id FROM chat_rooms WHERE game_id = %s"
+
 def fetch_chat(cur, game_id):
-    cur.execute("SELECT * FROM chat_rooms WHERE game_id = %s", (game_id,))
+    cur.execute(CHAT_BY_GAME_SQL, (game_id,))
     chat = cur.fetchone()
     if chat:
-        return chat
+        return ChatRoom._make(chat)
     return None
 
-def apply_message(cur, chatroom_id, user_id):
-    cur.execute("INSERT INTO waiting_for_accept (chatroom_id, user_id) VALUES (%s, %s)", (chatroom_id, user_id,))
+def apply_to_game(cur, game_id, user_id, message):
+    """
+    Applies a user to a game in a single statement: creates the game's chat room if needed,
+    puts the user on the waiting list and posts their application message.
+    Unique indexes on chat_rooms(game_id) and waiting_for_accept(chatroom_id, user_id) with
+    ON CONFLICT make concurrent applications safe - there is always one room per game and
+    one waiting entry per user.
+    Args:
+        cur: The database cursor to execute the query.
+        game_id (int): The game to apply to.
+        user_id (int): The applying user.
+        message (str): The application message.
+    Returns:
+        str: APPLY_APPLIED, APPLY_GAME_NOT_FOUND, APPLY_OWN_GAME or APPLY_ALREADY_APPLIED.
+    """
+
+    cur.execute("""
+        WITH game AS (
+            SELECT id, gm_id FROM games_posts WHERE id = %(game_id)s
+        ),
+        room AS (
+            INSERT INTO chat_rooms (game_id)
+            SELECT id FROM game WHERE gm_id IS DISTINCT FROM %(user_id)s
+            ON CONFLICT (game_id) DO UPDATE SET game_id = EXCLUDED.game_id
+            RETURNING id
+        ),
+        waiting AS (
+            INSERT INTO waiting_for_accept (chatroom_id, user_id)
+            SELECT room.id, %(user_id)s FROM room
+            WHERE NOT EXISTS (
+                SELECT 1 FROM users_in_chat WHERE chatroom_id = room.id AND user_id = %(user_id)s
+            )
+            ON CONFLICT (chatroom_id, user_id) DO NOTHING
+            RETURNING chatroom_id
+        ),
+        message AS (
+            INSERT INTO chat_messages (chatroom_id, user_id, message, timestamp)
+            SELECT chatroom_id, %(user_id)s, %(message)s, %(timestamp)s FROM waiting
+            RETURNING id, chatroom_id
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM game) AS game_exists,
+            (SELECT gm_id FROM game) AS gm_id,
+            (SELECT pg_notify(%(channel)s, json_build_object('chatroom_id', chatroom_id, 'id', id)::text)
+             FROM message) IS NOT NULL AS applied
+    """, {"game_id": game_id, "user_id": user_id, "message": message, "timestamp": datetime.now(),
+          "channel": CHAT_CHANNEL})
+    game_exists, gm_id, applied = cur.fetchone()
+    if not game_exists:
+        return APPLY_GAME_NOT_FOUND
+    if gm_id == user_id:
+        return APPLY_OWN_GAME
+    if not applied:
+        return APPLY_ALREADY_APPLIED
+    return APPLY_APPLIED
+
+def accept_player(cur, game_id, gm_id, user_id):
+    """
+    Moves a user from the game's waiting list into its chat room in a single statement,
+    but only if the caller is the game's GM and a seat is free. The game row is locked
+    first, so two concurrent accepts for the last seat can't both succeed; the seat counter
+    itself is updated by the users_in_chat trigger (add_seat_counters181026.sql).
+    Args:
+        cur: The database cursor to execute the query.
+        game_id (int): The game.
+        gm_id (int): The user accepting, who must be the game's GM.
+        user_id (int): The waiting user to accept.
+    Returns:
+        str: ACCEPT_ACCEPTED, ACCEPT_GAME_NOT_FOUND, ACCEPT_NOT_GM, ACCEPT_NO_SEATS or ACCEPT_NOT_WAITING.
+    """
 
-def send_message(cur, chatroom_id, user_id, message):
-    timestamp = datetime.now()
-    cur.execute("INSERT INTO chat_messages (chatroom_id, user_id, message, timestamp) VALUES (%s, %s, %s, %s)", (chatroom_id, user_id, message, timestamp))
+    cur.execute("""
+        WITH game AS (
+            SELECT id, gm_id, accepted_players < max_players AS has_seat
+            FROM games_posts WHERE id = %(game_id)s
+            FOR UPDATE
+        ),
+        accepted AS (
+            DELETE FROM waiting_for_accept w
+            USING chat_rooms r, game
+            WHERE r.game_id = game.id AND w.chatroom_id = r.id AND w.user_id = %(user_id)s
+              AND game.gm_id = %(gm_id)s AND game.has_seat
+            RETURNING w.chatroom_id
+        ),
+        joined AS (
+            INSERT INTO users_in_chat (chatroom_id, user_id)
+            SELECT chatroom_id, %(user_id)s FROM accepted
+            ON CONFLICT (chatroom_id, user_id) DO NOTHING
+            RETURNING chatroom_id
+        )
+        SELECT
+            EXISTS (SELECT 1 FROM game) AS game_exists,
+            (SELECT gm_id FROM game) AS game_gm_id,
+            (SELECT has_seat FROM game) AS has_seat,
+            EXISTS (SELECT 1 FROM accepted) AS accepted
+    """, {"game_id": game_id, "gm_id": gm_id, "user_id": user_id})
+    game_exists, game_gm_id, has_seat, accepted = cur.fetchone()
+    if not game_exists:
+        return ACCEPT_GAME_NOT_FOUND
+    if game_gm_id != gm_id:
+        return ACCEPT_NOT_GM
+    if not has_seat:
+        return ACCEPT_NO_SEATS
+    if not accepted:
+        return ACCEPT_NOT_WAITING
+    return ACCEPT_ACCEPTED
+
+WAITING_PLAYERS_SQL = """
+    SELECT u.id, u.name FROM waiting_for_accept w
+    JOIN users u ON u.id = w.user_id
+    WHERE w.chatroom_id = %s
+    ORDER BY w.id
+"""
+
+def fetch_waiting_players(cur, chatroom_id):
+    """
+    Fetches the users waiting for the GM to accept them into a chat room, oldest application first.
+    Args:
+        cur: The database cursor to execute the query.
+        chatroom_id (int): The game's chat room.
+    Returns:
+        list: UserName rows (id, name).
+    """
 
-def check_if_user_wait_for_accept(cur, user_id, chatroom_id):
-    cur.execute("SELECT * FROM waiting_for_accept WHERE user_id=%s AND chatroom_id=%s", (user_id, chatroom_id))
-    user = cur.fetchone()
-    if user is None:
-        return None
-    return user
+    cur.execute(WAITING_PLAYERS_SQL, (chatroom_id,))
+    return list(map(UserName._make, cur.fetchall()))
 
-def check_if_user_in_chat(cur, user_id, chatroom_id):
-    cur.execute("SELECT * FROM users_in_chat WHERE user_id=%s AND chatroom_id=%s", (user_id,chatroom_id))
-    user = cur.fetchone()
-    if user is None:
-        return None
-    return user
+def send_message(cur, chatroom_id, user_id, message):
+    """
+    Inserts a chat message and notifies listeners on CHAT_CHANNEL.
+    The notification is delivered when the transaction commits.
+    Args:
+        cur: The database cursor to execute the query.
+        chatroom_id (int): The chat room the message is posted to.
+        user_id (int): The author of the message.
+        message (str): The message text.
+    Returns:
+        int: The id of the new message.
+    """
+
+    timestamp = datetime.now()
+    cur.execute("""
+        WITH message AS (
+            INSERT INTO chat_messages (chatroom_id, user_id, message, timestamp) VALUES (%s, %s, %s, %s)
+            RETURNING id, chatroom_id
+        )
+        SELECT id, pg_notify(%s, json_build_object('chatroom_id', chatroom_id, 'id', id)::text) FROM message
+    """, (chatroom_id, user_id, message, timestamp, CHAT_CHANNEL))
+    return cur.fetchone()[0]
 
 def add_user_to_chat(cur, user_id, chatroom_id):
     cur.execute("INSERT INTO users_in_chat (chatroom_id, user_id) VALUES (%s, %s)", (chatroom_id, user_id,))
 
 def fetch_all_gm_games(cur, user_id):
-    cur.execute("SELECT * FROM games_posts WHERE gm_id=%s", (user_id,))
-    gm_games = cur.fetchall()
+    cur.execute("SELECT id, title FROM games_posts WHERE gm_id=%s", (user_id,))
+    gm_games = list(map(GameLink._make, cur.fetchall()))
     return gm_games
 
 def fetch_all_players_games(cur, user_id):
     cur.execute("""
-        SELECT * FROM games_posts 
-        FULL JOIN chat_rooms ON games_posts.id=chat_rooms.game_id 
-        FULL JOIN users_in_chat ON chat_rooms.id=users_in_chat.chatroom_id 
+        SELECT games_posts.id, games_posts.title FROM games_posts
+        JOIN chat_rooms ON games_posts.id=chat_rooms.game_id
+        JOIN users_in_chat ON chat_rooms.id=users_in_chat.chatroom_id
         WHERE users_in_chat.user_id=%s AND games_posts.gm_id != %s
     """, (user_id, user_id))
-    player_games = cur.fetchall()
+    player_games = list(map(GameLink._make, cur.fetchall()))
     return player_games
 
-def fetch_all_messages(cur, game_id):
-    cur.execute("""
-    SELECT * FROM chat_messages FULL JOIN chat_rooms ON chat_messages.chatroom_id = chat_rooms.id WHERE chat_rooms.game_id = %s ORDER BY chat_messages.timestamp DESC""", (game_id,))
-    return cur.fetchall()
+PROFILE_VIEW_SQL = """
+    SELECT u.id, u.name, u.email,
+        EXISTS (SELECT 1 FROM players WHERE players.user_id = u.id) AS player,
+        EXISTS (SELECT 1 FROM gms WHERE gms.user_id = u.id) AS gm,
+        COALESCE((
+            SELECT json_agg(json_build_object('id', g.id, 'title', g.title) ORDER BY g.id)
+            FROM users_in_chat c
+            JOIN chat_rooms r ON r.id = c.chatroom_id
+            JOIN games_posts g ON g.id = r.game_id
+            WHERE c.user_id = u.id AND g.gm_id != u.id
+        ), '[]') AS player_games,
+        COALESCE((
+            SELECT json_agg(json_build_object('id', g.id, 'title', g.title) ORDER BY g.id)
+            FROM games_posts g WHERE g.gm_id = u.id
+        ), '[]') AS gm_games
+    FROM users u WHERE u.id = %s
+"""
+
+def get_profile_view(cur, user_id):
+    """
+    Loads the profile page data in a single round trip: the user, both role flags
+    and the games they play in and run as GM.
+    Args:
+        cur: The database cursor to execute the query.
+        user_id (int): The ID of the user.
+    Returns:
+        ProfileView or None: The profile view model, or None if the user doesn't exist.
+    """
+
+    cur.execute(PROFILE_VIEW_SQL, (user_id,))
+    return profile_view_from_row(cur.fetchone())
+
+def profile_view_from_row(row):
+    """
+    Builds the ProfileView from a PROFILE_VIEW_SQL row; shared with db/async_queries.py.
+    Returns:
+        ProfileView or None: The profile view model, or None for a missing row.
+    """
+
+    if row is None:
+        return None
+    return ProfileView(
+        id=row[0], name=row[1], email=row[2], player=row[3], gm=row[4],
+        player_games=[GameLink(**game) for game in row[5]],
+        gm_games=[GameLink(**game) for game in row[6]],
+    )
+
+# chat_messages jest partycjonowane miesięcznie po timestamp (db/partitions.py). Historia idzie
+# po (timestamp, id) malejąco, więc planer czyta partycje od najnowszej i kończy po LIMIT;
+# w obrębie pokoju większe id nie jest starsze (wiadomości dostają czas przy zapisie).
+MESSAGES_SQL = """
+    SELECT id, user_id, message, timestamp FROM chat_messages
+    WHERE chatroom_id = %s ORDER BY timestamp DESC, id DESC LIMIT %s
+"""
+MESSAGES_BEFORE_SQL = """
+    WITH cursor AS (
+        SELECT timestamp FROM chat_messages WHERE chatroom_id = %(chatroom_id)s AND id = %(before_id)s
+    )
+    SELECT id, user_id, message, timestamp FROM chat_messages
+    WHERE chatroom_id = %(chatroom_id)s
+      AND timestamp <= (SELECT timestamp FROM cursor)
+      AND (timestamp, id) < ((SELECT timestamp FROM cursor), %(before_id)s)
+    ORDER BY timestamp DESC, id DESC LIMIT %(limit)s
+"""
+# Zapas na wiadomości zapisane w innej kolejności niż ich id (równoległe transakcje, zegary)
+MESSAGES_SINCE_SLACK = timedelta(minutes=5)
+
+def fetch_messages(cur, chatroom_id, before_id=None, limit=50):
+    """
+    Fetches one page of a chat room's history, newest first.
+    Args:
+        cur: The database cursor to execute the query.
+        chatroom_id (int): The chat room to read.
+        before_id (int, optional): Cursor - only messages with an id lower than this are returned.
+        limit (int): Maximum number of messages.
+    Returns:
+        list: ChatMessage rows (id, user_id, message, timestamp).
+    """
+
+    if before_id is None:
+        cur.execute(MESSAGES_SQL, (chatroom_id, limit))
+    else:
+        cur.execute(MESSAGES_BEFORE_SQL, {"chatroom_id": chatroom_id, "before_id": before_id, "limit": limit})
+    return list(map(ChatMessage._make, cur.fetchall()))
+
+def fetch_messages_since(cur, chatroom_id, since_id, limit=200, since_timestamp=None):
+    """
+    Fetches messages posted to a chat room after a given message, oldest first.
+    With the timestamp of that message only the partitions from its month on are read.
+    Args:
+        cur: The database cursor to execute the query.
+        chatroom_id (int): The chat room to read.
+        since_id (int): Only messages with an id greater than this are returned.
+        limit (int): Maximum number of messages.
+        since_timestamp (datetime, optional): Timestamp of the since_id message, if known.
+    Returns:
+        list: ChatMessage rows (id, user_id, message, timestamp).
+    """
+
+    if since_timestamp is None:
+        cur.execute("""
+            SELECT id, user_id, message, timestamp FROM chat_messages
+            WHERE chatroom_id = %s AND id > %s ORDER BY id LIMIT %s
+        """, (chatroom_id, since_id, limit))
+    else:
+        cur.execute("""
+            SELECT id, user_id, message, timestamp FROM chat_messages
+            WHERE chatroom_id = %s AND id > %s AND timestamp >= %s ORDER BY id LIMIT %s
+        """, (chatroom_id, since_id, since_timestamp - MESSAGES_SINCE_SLACK, limit))
+    return list(map(ChatMessage._make, cur.fetchall()))
+
+# Eksporty czytają kursorem nazwanym (po stronie serwera) partiami, więc pamięć nie rośnie
+# z rozmiarem pokoju; kolejność chronologiczna, jak w pliku z logiem.
+CHAT_EXPORT_SQL = """
+    SELECT m.id, m.user_id, u.name, m.message, m.timestamp
+    FROM chat_messages m LEFT JOIN users u ON u.id = m.user_id
+    WHERE m.chatroom_id = %s ORDER BY m.timestamp, m.id
+"""
+GM_GAMES_EXPORT_SQL = """
+    SELECT g.id, g.title, s.title, g.max_players, g.accepted_players,
+        (SELECT string_agg(u.name, ', ' ORDER BY u.name)
+         FROM chat_rooms r
+         JOIN users_in_chat c ON c.chatroom_id = r.id
+         JOIN users u ON u.id = c.user_id
+         WHERE r.game_id = g.id AND c.user_id != g.gm_id) AS players,
+        g.description
+    FROM games_posts g LEFT JOIN systems s ON s.id = g.system_id
+    WHERE g.gm_id = %s ORDER BY g.id
+"""
+
+def export_chat_messages(cur, chatroom_id, batch_size=1000):
+    """
+    Streams a chat room's whole history, oldest first, for export.
+    Args:
+        cur: A named (server-side) cursor; a client-side one would fetch the whole room at once.
+        chatroom_id (int): The chat room to export.
+        batch_size (int): Rows fetched per round trip.
+    Returns:
+        generator: Lists of up to batch_size ExportedMessage rows.
+    """
+
+    cur.execute(CHAT_EXPORT_SQL, (chatroom_id,))
+    return fetch_batches(cur, ExportedMessage, batch_size)
+
+def export_gm_games(cur, gm_id, batch_size=1000):
+    """
+    Streams the games run by a GM with their accepted players, for export.
+    Args:
+        cur: A named (server-side) cursor.
+        gm_id (int): The GM's user id.
+        batch_size (int): Rows fetched per round trip.
+    Returns:
+        generator: Lists of up to batch_size ExportedGame rows.
+    """
 
+    cur.execute(GM_GAMES_EXPORT_SQL, (gm_id,))
+    return fetch_batches(cur, ExportedGame, batch_size)
 
+def fetch_batches(cursor, row_type, batch_size):
+    """Yields the remaining rows of an executed cursor as lists of row_type, batch_size rows at a time."""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield list(map(row_type._make, rows))
@@ -0,0 +1,127 @@
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import NamedTuple, Optional
+
+# Wiersze zapytań z db/queries.py: krotki z nazwanymi polami (bez __dict__ na wiersz),
+# budowane z krotek zwykłego kursora przez _make. Do JSON przez _asdict().
+
+
+class GameLink(NamedTuple):
+    """A game listed on a profile page."""
+    id: int
+    title: str
+
+
+class Game(NamedTuple):
+    """A game post; on the board and in search results the description is only a preview."""
+    id: int
+    title: str
+    system_id: Optional[int]
+    max_players: int
+    description: Optional[str]
+    gm_id: Optional[int]
+    accepted_players: int
+    version: int
+
+
+class GameSearchResult(NamedTuple):
+    """A game post found by queries.search_games, with its rank."""
+    id: int
+    title: str
+    system_id: Optional[int]
+    max_players: int
+    description: Optional[str]
+    gm_id: Optional[int]
+    accepted_players: int
+    version: int
+    rank: float
+
+
+class GameHeader(NamedTuple):
+    """Title and game master of a game, for the application form."""
+    title: str
+    gm_id: Optional[int]
+
+
+class System(NamedTuple):
+    """A game system."""
+    id: int
+    title: str
+
+
+class UserLogin(NamedTuple):
+    """What the login flow needs about a user."""
+    id: int
+    name: str
+    hash: str
+    filled_preferences: bool
+    player: bool
+    gm: bool
+
+
+class UserProfile(NamedTuple):
+    """A user's name and email."""
+    id: int
+    name: str
+    email: str
+
+
+class UserName(NamedTuple):
+    """A user listed by name, e.g. waiting for the GM to accept them."""
+    id: int
+    name: str
+
+
+class ChatRoom(NamedTuple):
+    """The chat room of a game."""
+    id: int
+
+
+class ChatMessage(NamedTuple):
+    """A chat message; the room is known to the caller."""
+    id: int
+    user_id: Optional[int]
+    message: str
+    timestamp: datetime
+
+
+class ExportedMessage(NamedTuple):
+    """A chat message in a chat log export, with its author's name."""
+    id: int
+    user_id: Optional[int]
+    user_name: Optional[str]
+    message: str
+    timestamp: datetime
+
+
+class ExportedGame(NamedTuple):
+    """A game in a GM's game list export."""
+    id: int
+    title: str
+    system: Optional[str]
+    max_players: int
+    accepted_players: int
+    players: Optional[str]
+    description: Optional[str]
+
+
+@dataclass
+class ProfileView:
+    """
+    Everything the profile page shows, loaded in one query by queries.get_profile_view.
+    Attributes:
+        id (int): The user's id.
+        name (str): The user's name.
+        email (str): The user's email.
+        player (bool): Whether the user chose the player role.
+        gm (bool): Whether the user chose the game master role.
+        player_games (list): Games the user plays in (excluding ones they run).
+        gm_games (list): Games the user runs as GM.
+    """
+    id: int
+    name: str
+    email: str
+    player: bool
+    gm: bool
+    player_games: list = field(default_factory=list)
+    gm_games: list = field(default_factory=list)
@@ -0,0 +1,273 @@
+"""
+Services of the app: the connection pool, query cache, background workers and metrics.
+
+create_app() builds one Services object per app and keeps it in app.extensions.
+Building it opens no connection and starts no thread: the pool connects on the first
+checkout and the listener starts on the first request, so both happen in the worker
+process that uses them, after any fork. The module-level names below are proxies to
+the current app's services, so views import them like globals.
+"""
+import json
+import threading
+from flask import current_app, g
+from werkzeug.local import LocalProxy
+import db.queries as queries
+from db.pool import ConnectionPool
+from db.notify import NotificationListener, Broadcaster
+from db.last_login import LastLoginBuffer
+from db.cache import QueryCache, INVALIDATION_CHANNEL, INVALIDATE_ALL
+from db.partitions import PartitionKeeper
+from fragments import FragmentCache
+from passwords import PasswordHasher
+from ratelimit import TokenBucketLimiter, PostgresRateLimiter
+from metrics import Metrics, timed_connection_factory, QUERY_BUCKETS, POOL_WAIT_BUCKETS
+
+
+class Services:
+    """
+    Per-app pool, cache, password hasher, last-login buffer, NOTIFY listener, rate limiter,
+    partition keeper, export slots and metrics.
+    Args:
+        config (Config): The app's configuration.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        # Metryki procesu (/metrics)
+        self.metrics = Metrics()
+        self.request_duration = self.metrics.histogram(
+            "http_request_duration_seconds", "Time to the response headers by endpoint, method and status.",
+            ("endpoint", "method", "status"))
+        self.requests_in_flight = self.metrics.gauge("http_requests_in_flight", "Requests being handled.")
+        self.query_duration = self.metrics.histogram(
+            "db_query_duration_seconds", "Statement execution time by the function that ran it.",
+            ("query",), QUERY_BUCKETS)
+        self.query_rows = self.metrics.counter(
+            "db_query_rows_total", "Rows returned by the function that ran the statement.", ("query",))
+        self.pool_wait = self.metrics.histogram(
+            "db_pool_wait_seconds", "Time spent checking out a pooled connection.", buckets=POOL_WAIT_BUCKETS)
+        self.rate_limited = self.metrics.counter(
+            "http_rate_limited_total", "Requests rejected with 429 by the rate limit they exceeded.", ("limit",))
+        self.startup = self.metrics.gauge(
+            "app_startup_seconds", "Time spent importing the app and in create_app().", ("phase",))
+        self.metrics.collector(self.pool_and_cache_metrics)
+
+        # Pula połączeń z bazą danych, otwierana przy pierwszym żądaniu
+        self.pool = ConnectionPool(
+            connect_kwargs=dict(
+                dbname=config["DBNAME"],
+                user=config["DBUSER"],
+                password=config["DBPASS"],
+                host=config["DBHOST"],
+                port=config["DBPORT"],
+            ),
+            minconn=config["DB_POOL_MIN"],
+            maxconn=config["DB_POOL_MAX"],
+            timeout=config["DB_POOL_TIMEOUT"],
+            check_after=config["DB_POOL_CHECK_AFTER"],
+            connection_factory=timed_connection_factory(self.observe_query),
+            on_checkout=self.pool_wait.observe,
+        )
+
+        # Partycje chat_messages na kolejne miesiące, zakładane raz dziennie
+        self.partitions = PartitionKeeper(self.pool, months_ahead=config["CHAT_PARTITIONS_AHEAD"],
+                                          interval=config["CHAT_PARTITIONS_CHECK_INTERVAL"])
+
+        # Limity żądań drogich tras (bcrypt, zapisy)
+        if config["RATE_LIMIT_BACKEND"] == "postgres":
+            self.rate_limiter = PostgresRateLimiter(
+                self.pool,
+                sweep_interval=config["RATE_LIMIT_SWEEP_INTERVAL"],
+                checkout_timeout=config["RATE_LIMIT_POOL_TIMEOUT"],
+                fallback=TokenBucketLimiter(max_keys=config["RATE_LIMIT_MAX_KEYS"]),
+            )
+        else:
+            self.rate_limiter = TokenBucketLimiter(max_keys=config["RATE_LIMIT_MAX_KEYS"])
+
+        # Eksporty trzymają połączenie z puli przez cały transfer, więc jest ich najwyżej kilka naraz
+        self.export_slots = threading.BoundedSemaphore(config["EXPORT_MAX_CONCURRENT"])
+
+        # Cache danych słownikowych i szczegółów gier
+        self.cache = QueryCache(
+            max_entries=config["CACHE_MAX_ENTRIES"],
+            default_ttl=config["CACHE_DEFAULT_TTL"],
+            shared=config["CACHE_SHARED_INVALIDATION"],
+        )
+        # Cache wyrenderowanych fragmentów HTML (karty gier, tablica)
+        self.fragments = FragmentCache(max_bytes=config["FRAGMENT_CACHE_MAX_BYTES"])
+
+        # Zapis ostatniego logowania w tle, zbiorczo
+        self.last_logins = LastLoginBuffer(
+            self.pool,
+            flush_interval=config["LAST_LOGIN_FLUSH_INTERVAL"],
+            max_pending=config["LAST_LOGIN_MAX_PENDING"],
+        )
+
+        # Haszowanie haseł poza wątkiem żądania
+        self.hasher = PasswordHasher(
+            rounds=config["BCRYPT_LOG_ROUNDS"],
+            workers=config["PASSWORD_HASH_WORKERS"],
+            max_queue=config["PASSWORD_HASH_QUEUE"],
+            timeout=config["PASSWORD_HASH_TIMEOUT"],
+        )
+
+        # Powiadomienia Postgres (LISTEN/NOTIFY) na jednym dedykowanym połączeniu
+        self.listener = NotificationListener(self.pool.connect_kwargs)
+        self.chat_subscribers = Broadcaster()
+        if self.cache.shared:
+            self.listener.subscribe(INVALIDATION_CHANNEL, self.on_cache_notification)
+        self.listener.subscribe(queries.CHAT_CHANNEL, self.on_chat_notification)
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def observe_query(self, name, seconds, rows):
+        self.query_duration.observe(seconds, name)
+        if rows:
+            self.query_rows.inc(name, amount=rows)
+
+    def on_cache_notification(self, payload):
+        """Apply another process's invalidation; a changed game also outdates the rendered board."""
+        self.cache.handle_notification(payload)
+        if payload is None or payload == INVALIDATE_ALL or any(key[0] == "game" for key in json.loads(payload)):
+            self.fragments.bump("games")
+
+    def on_chat_notification(self, payload):
+        self.chat_subscribers.publish_json(payload, "chatroom_id")
+
+    def start(self):
+        """Start the background work of this process; called before every request, runs once."""
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            if self.cache.shared:
+                self.listener.start()
+            self.partitions.start()
+            self._started = True
+
+    def after_fork(self):
+        """Reset the pool and background threads in a forked child (gunicorn --preload)."""
+        self.pool.after_fork()
+        self.listener.after_fork()
+        self.last_logins.after_fork()
+        self.hasher.after_fork()
+        self.rate_limiter.after_fork()
+        self.partitions.after_fork()
+        self.export_slots = threading.BoundedSemaphore(self.config["EXPORT_MAX_CONCURRENT"])
+        self._started = False
+        self._start_lock = threading.Lock()
+
+    def close(self):
+        """Write buffered logins and close the pool's idle connections."""
+        self.last_logins.close()
+        self.pool.closeall()
+
+    def pool_and_cache_metrics(self):
+        stats = self.pool.stats()
+        cache_counts = self.cache.stats()
+        fragment_counts = self.fragments.stats()
+        logins = self.last_logins.stats()
+        metrics = [
+            ("db_pool_size", "gauge", "Open pooled connections.", stats["size"]),
+            ("db_pool_in_use", "gauge", "Pooled connections checked out.", stats["in_use"]),
+            ("db_pool_waiting", "gauge", "Threads waiting for a pooled connection.", stats["waiting"]),
+            ("db_pool_timeouts_total", "counter", "Checkouts that timed out.", stats["timeouts"]),
+            ("db_pool_reconnects_total", "counter", "Dead pooled connections replaced.", stats["reconnects"]),
+            ("cache_hits_total", "counter", "Query cache hits.", cache_counts["hits"]),
+            ("cache_misses_total", "counter", "Query cache misses.", cache_counts["misses"]),
+            ("fragment_cache_hits_total", "counter", "Rendered fragment cache hits.", fragment_counts["hits"]),
+            ("fragment_cache_misses_total", "counter", "Rendered fragment cache misses.", fragment_counts["misses"]),
+            ("fragment_cache_bytes", "gauge", "Memory taken by cached fragments.", fragment_counts["bytes"]),
+            # Opóźnienie zapisu last_login: alert, gdy pending_age rośnie ponad kilka LAST_LOGIN_FLUSH_INTERVAL
+            ("last_login_pending", "gauge", "Users with a buffered last_login not written yet.", logins["pending"]),
+            ("last_login_pending_age_seconds", "gauge", "Age of the oldest buffered last_login.",
+             logins["pending_age"]),
+            ("last_login_recorded_total", "counter", "Logins buffered.", logins["recorded"]),
+            ("last_login_flushes_total", "counter", "Successful last_login flushes.", logins["flushes"]),
+            ("last_login_flushed_rows_total", "counter", "Users written by last_login flushes.",
+             logins["flushed_rows"]),
+            ("last_login_failed_flushes_total", "counter", "last_login flushes that failed and were retried.",
+             logins["failed_flushes"]),
+            ("last_login_last_flush_size", "gauge", "Users written by the last flush.", logins["last_flush_size"]),
+            ("last_login_last_flush_lag_seconds", "gauge",
+             "Seconds from the first buffered login to its write, in the last flush.", logins["last_flush_lag"]),
+            ("last_login_max_flush_lag_seconds", "gauge", "Largest flush lag since the process started.",
+             logins["max_flush_lag"]),
+        ]
+        horizon_days = self.partitions.horizon_days()
+        if horizon_days is not None:
+            # Alert, gdy spada poniżej ~30 dni: zapisy czatu przestaną działać po jego upływie
+            metrics.append(("chat_partitions_horizon_days", "gauge",
+                            "Days until the first month without a chat_messages partition.", horizon_days))
+        return metrics
+
+
+def get_services(app=None):
+    """
+    Return the services of an app.
+    Args:
+        app (Flask, optional): The app, defaults to the current one.
+    Returns:
+        Services: The app's services.
+    """
+
+    return (app or current_app).extensions["services"]
+
+
+pool = LocalProxy(lambda: get_services().pool)
+cache = LocalProxy(lambda: get_services().cache)
+fragments = LocalProxy(lambda: get_services().fragments)
+hasher = LocalProxy(lambda: get_services().hasher)
+last_logins = LocalProxy(lambda: get_services().last_logins)
+listener = LocalProxy(lambda: get_services().listener)
+chat_subscribers = LocalProxy(lambda: get_services().chat_subscribers)
+metrics = LocalProxy(lambda: get_services().metrics)
+
+
+def get_db():
+    """
+    Return the database connection checked out for the current request.
+    The connection is taken from the pool on first use and returned in teardown.
+    Returns:
+        connection: A psycopg2 connection from the pool.
+    """
+
+    if "db_conn" not in g:
+        g.db_conn = pool.getconn()
+    return g.db_conn
+
+
+def release_db(exception):
+    """Return the request's connection to the pool, rolling back unfinished work."""
+    conn = g.pop("db_conn", None)
+    if conn is not None:
+        pool.putconn(conn)
+
+
+def cached_systems():
+    """
+    Return the game systems, loading them from the database at most once per SYSTEMS_CACHE_TTL.
+    Returns:
+        list: System rows.
+    """
+
+    def load():
+        with get_db().cursor() as cur:
+            return queries.get_systems(cur)
+    return cache.get_or_load(("systems",), load, ttl=current_app.config["SYSTEMS_CACHE_TTL"])
+
+
+def cached_game(game_id):
+    """
+    Return a game post by id through the cache.
+    Args:
+        game_id (int): The id of the game post.
+    Returns:
+        Game or None: The game, or None if it doesn't exist.
+    """
+
+    def load():
+        with get_db().cursor() as cur:
+            return queries.get_game_by_id(cur, game_id)
+    return cache.get_or_load(("game", game_id), load, ttl=current_app.config["GAME_CACHE_TTL"])
@@ -0,0 +1,177 @@
+import sys
+import time
+import threading
+from collections import OrderedDict
+from markupsafe import Markup
+from flask import current_app, g
+
+
+class FragmentCache:
+    """
+    In-process cache of rendered HTML fragments, bounded by their size in memory.
+
+    Keys are tuples like the query cache's. Fragments that can go stale are keyed on a
+    version counter (version()/bump()) instead of being invalidated: a write bumps the
+    counter after its commit, new requests miss and render under the new version, and
+    the old fragments are evicted as the least recently used once the cache is full.
+    Fragments are shared by every user and request, so they are rendered without the
+    request context (no session, no CSP nonce) - see render_fragment().
+    Args:
+        max_bytes (int): Total size of the cached fragments before the least recently used are evicted.
+    """
+
+    def __init__(self, max_bytes=8 * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._versions = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "evictions": 0,
+            "expirations": 0,
+        }
+
+    def version(self, name):
+        """Current value of a version counter, e.g. version("games")."""
+        return self._versions.get(name, 0)
+
+    def bump(self, name):
+        """
+        Increment a version counter, so fragments keyed on its old value are no longer used.
+        Args:
+            name (str): The counter, e.g. "games".
+        Returns:
+            int: The new value.
+        """
+
+        with self._lock:
+            self._versions[name] = self._versions.get(name, 0) + 1
+            return self._versions[name]
+
+    def get(self, key, default=None):
+        """
+        Return a cached fragment.
+        Args:
+            key (tuple): The cache key.
+            default: Returned when the key is missing or expired.
+        Returns:
+            The cached value or `default`.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._stats["misses"] += 1
+                return default
+            expires_at, size, value = entry
+            if expires_at is not None and expires_at <= now:
+                self._remove(key)
+                self._stats["expirations"] += 1
+                self._stats["misses"] += 1
+                return default
+            self._entries.move_to_end(key)
+            self._stats["hits"] += 1
+            return value
+
+    def set(self, key, value, size, ttl=None):
+        """
+        Store a fragment, evicting the least recently used ones above max_bytes.
+        A fragment larger than max_bytes is not stored.
+        Args:
+            key (tuple): The cache key.
+            value: The fragment, or a tuple holding it.
+            size (int): Memory taken by the value in bytes.
+            ttl (float, optional): Seconds the value stays valid; by default until evicted.
+        Returns:
+            None
+        """
+
+        if size > self.max_bytes:
+            return
+        expires_at = None if ttl is None else time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (expires_at, size, value)
+            self._bytes += size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self._stats["evictions"] += 1
+
+    def _remove(self, key):
+        _, size, _ = self._entries.pop(key)
+        self._bytes -= size
+
+    def clear(self):
+        """Drop every fragment."""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """
+        Snapshot of cache counters.
+        Returns:
+            dict: Size, bytes, hits, misses, evictions, expirations and version counters.
+        """
+
+        with self._lock:
+            stats = dict(self._stats)
+            stats["size"] = len(self._entries)
+            stats["bytes"] = self._bytes
+            stats["max_bytes"] = self.max_bytes
+            stats["versions"] = dict(self._versions)
+        return stats
+
+
+def check_nonce(template_name, html, nonce):
+    if nonce and nonce in html:
+        raise ValueError(f"{template_name}: a cached fragment can't contain the CSP nonce")
+
+
+def render_fragment(template_name, **context):
+    """
+    Render a template for the fragment cache.
+    Unlike render_template, no context processors run, so the fragment can't depend on
+    the session, the request or g (the CSP nonce); a nonce passed in explicitly is
+    caught by check_nonce.
+    Args:
+        template_name (str): The template to render.
+        **context: Variables of the template.
+    Returns:
+        Markup: The rendered HTML.
+    """
+
+    html = current_app.jinja_env.get_template(template_name).render(**context)
+    check_nonce(template_name, html, g.get("nonce"))
+    return Markup(html)
+
+
+def render_macro_fragments(template_name, macro, calls):
+    """
+    Call a macro once per set of arguments, for the fragment cache, like render_fragment.
+    A macro call doesn't set up a template context, which matters for small fragments
+    rendered many times, like the board cards.
+    Args:
+        template_name (str): The template defining the macro.
+        macro (str): Name of the macro.
+        calls (list): Keyword arguments of each call.
+    Returns:
+        list: The rendered HTML of each call, as Markup.
+    """
+
+    render = getattr(current_app.jinja_env.get_template(template_name).module, macro)
+    nonce = g.get("nonce")
+    rendered = []
+    for kwargs in calls:
+        html = render(**kwargs)
+        check_nonce(template_name, html, nonce)
+        rendered.append(html)
+    return rendered
+
+
+def fragment_size(html):
+    return sys.getsizeof(html)
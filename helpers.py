@@ -1,5 +1,7 @@
+import inspect
 from functools import wraps
-from flask import request, redirect, url_for, session, flash
+from flask import current_app, request, redirect, url_for, session, flash, g
+from ratelimit import RateLimited
 
 
 def login_required(f):
@@ -8,6 +10,7 @@ def login_required(f):
 
     This decorator checks if the user is logged in by verifying the presence of a "user" key in the session.
     If the user is not logged in, it redirects them to the login page and passes the original URL as a "next" parameter.
+    Works on coroutine views (asgi.py) as well.
 
     Args:
         f (function): The route function to be decorated.
@@ -15,13 +18,90 @@ def login_required(f):
     Returns:
         function: The decorated function that includes the login check.
     """
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_coroutine(*args, **kwargs):
+            if session.get("user") is None:
+                return redirect(url_for('auth.login', next=request.url))
+            return await f(*args, **kwargs)
+        return decorated_coroutine
+
     @wraps(f)
     def decorated_function(*args, **kwargs):
         if session.get("user") is None:
-            return redirect(url_for('login', next=request.url))
+            return redirect(url_for('auth.login', next=request.url))
         return f(*args, **kwargs)
     return decorated_function
 
+def cache_policy(cache_control, anonymous_only=False, etag=False):
+    """
+    Decorator declaring the HTTP caching policy of a route.
+
+    Routes without a policy are sent with "no-cache, no-store". The policy is applied
+    in after_request, and only to successful responses.
+
+    Args:
+        cache_control (str): The Cache-Control header value, e.g. "public, max-age=60".
+        anonymous_only (bool): Apply the policy only to visitors who aren't logged in;
+            pages rendered for a logged-in user stay uncacheable.
+        etag (bool): Add an ETag computed from the response body and answer matching
+            conditional requests with 304.
+
+    Returns:
+        function: The decorator.
+    """
+    policy = {"cache_control": cache_control, "anonymous_only": anonymous_only, "etag": etag}
+
+    def decorator(f):
+        if inspect.iscoroutinefunction(f):
+            @wraps(f)
+            async def decorated_coroutine(*args, **kwargs):
+                g.cache_policy = policy
+                return await f(*args, **kwargs)
+            return decorated_coroutine
+
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            g.cache_policy = policy
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
+def rate_limited(name, methods=("POST",)):
+    """
+    Decorator applying the token-bucket limit RATE_LIMITS[name] to a route.
+
+    Requests with one of `methods` take a token from the client's IP bucket and, when
+    logged in, from the user's bucket; without one in either, RateLimited is raised
+    and answered with 429 and Retry-After. Routes without the decorator don't pay
+    anything; a name missing from RATE_LIMITS, or RATE_LIMIT_ENABLED off, turns the limit off.
+
+    Args:
+        name (str): The limit, a key of RATE_LIMITS.
+        methods (tuple): HTTP methods that are limited, by default only form submissions.
+
+    Returns:
+        function: The decorator.
+    """
+
+    def decorator(f):
+        @wraps(f)
+        def decorated_function(*args, **kwargs):
+            config = current_app.config
+            limit = config["RATE_LIMITS"].get(name) if config["RATE_LIMIT_ENABLED"] else None
+            if limit is not None and request.method in methods:
+                per_minute, burst = limit
+                keys = [f"{name}:ip:{request.remote_addr}"]
+                user = session.get("user")
+                if user is not None:
+                    keys.append(f"{name}:user:{user['id']}")
+                wait = current_app.extensions["services"].rate_limiter.check(keys, per_minute / 60, burst)
+                if wait > 0:
+                    raise RateLimited(name, wait)
+            return f(*args, **kwargs)
+        return decorated_function
+    return decorator
+
 def check_and_flash_if_none(check, message):
     if check is None:
         flash(message, "error")
@@ -0,0 +1,237 @@
+import sys
+import time
+import threading
+from bisect import bisect_left
+from psycopg2.extensions import connection as BaseConnection, cursor as BaseCursor
+
+# Progi histogramów w sekundach
+REQUEST_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+POOL_WAIT_BUCKETS = (0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 2.5, 5.0)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def escape_label(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names, values, extra=""):
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+class Metric:
+    """Common part of counters, gauges and histograms: name, help text and labelled series."""
+
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(Metric):
+    """Monotonic counter."""
+
+    kind = "counter"
+
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._series[labels] = self._series.get(labels, 0) + amount
+
+    def render(self):
+        with self._lock:
+            series = list(self._series.items())
+        return self.header() + [f"{self.name}{format_labels(self.labels, labels)} {format_value(value)}"
+                                for labels, value in series]
+
+
+class Gauge(Counter):
+    """Value that goes up and down, e.g. requests in flight."""
+
+    kind = "gauge"
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+    def set(self, value, *labels):
+        with self._lock:
+            self._series[labels] = value
+
+
+class Histogram(Metric):
+    """
+    Cumulative histogram with fixed buckets, rendered as _bucket, _sum and _count series.
+    Observing is a bisect and a few additions under a lock, cheap enough to run per query.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                # Liczniki per próg (ostatni to +Inf) i suma
+                series = self._series[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self):
+        with self._lock:
+            series = [(labels, list(counts), total) for labels, (counts, total) in self._series.items()]
+        lines = self.header()
+        for labels, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = f'le="{format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, labels, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{format_labels(self.labels, labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{format_labels(self.labels, labels)} {cumulative}")
+        return lines
+
+
+class Metrics:
+    """
+    Registry of the process' metrics, rendered in the Prometheus text exposition format.
+
+    Every worker process keeps its own registry, so with several workers each scrape
+    sees the process that answered it; scrape workers separately or run one worker per target.
+    Collectors are called at scrape time for values other components already count
+    themselves (pool and cache stats), so those cost nothing per request.
+    """
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def counter(self, name, help, labels=()):
+        return self._add(Counter(name, help, labels))
+
+    def gauge(self, name, help, labels=()):
+        return self._add(Gauge(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=REQUEST_BUCKETS):
+        return self._add(Histogram(name, help, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def collector(self, function):
+        """
+        Register a function called on every scrape.
+        Args:
+            function (callable): Returns (name, kind, help, value) tuples.
+        Returns:
+            callable: The function, so this can be used as a decorator.
+        """
+
+        self._collectors.append(function)
+        return function
+
+    def render(self):
+        """
+        Render every metric.
+        Returns:
+            str: The exposition text.
+        """
+
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        for function in self._collectors:
+            for name, kind, help, value in function():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}", f"{name} {format_value(value)}"]
+        return "\n".join(lines) + "\n"
+
+
+def query_name(frame):
+    """
+    Name a query after the function that executed it, e.g. "queries.get_games_page".
+    Frames of psycopg2 itself (execute_values and other helpers of psycopg2.extras,
+    which call execute for their caller) are skipped.
+    Args:
+        frame (frame): The caller's frame.
+    Returns:
+        str: Module (without package) and function name.
+    """
+
+    module = frame.f_globals.get("__name__", "")
+    while frame.f_back is not None and module.split(".")[0] == "psycopg2":
+        frame = frame.f_back
+        module = frame.f_globals.get("__name__", "")
+    return f"{module.rpartition('.')[2]}.{frame.f_code.co_name}"
+
+
+class TimedCursorMixin:
+    """Cursor mixin reporting each execute to `observe(query, seconds, rows)`."""
+
+    observe = None
+
+    def execute(self, query, vars=None):
+        caller = sys._getframe(1)
+        start = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            self.observe(query_name(caller), time.perf_counter() - start,
+                         max(self.rowcount, 0) if self.description is not None else 0)
+
+    def executemany(self, query, vars_list):
+        caller = sys._getframe(1)
+        start = time.perf_counter()
+        try:
+            return super().executemany(query, vars_list)
+        finally:
+            self.observe(query_name(caller), time.perf_counter() - start, 0)
+
+
+def timed_connection_factory(observe):
+    """
+    psycopg2 connection class whose cursors, whatever their cursor_factory
+    (DictCursor, the default cursor, named cursors), time every execute.
+    Args:
+        observe (callable): Called with the query name, duration in seconds and rows returned.
+    Returns:
+        type: A connection class for psycopg2.connect(connection_factory=...).
+    """
+
+    timed_cursors = {}
+
+    def timed_cursor(factory):
+        cursor_class = timed_cursors.get(factory)
+        if cursor_class is None:
+            cursor_class = timed_cursors[factory] = type(
+                f"Timed{factory.__name__}", (TimedCursorMixin, factory), {"observe": staticmethod(observe)})
+        return cursor_class
+
+    class TimedConnection(BaseConnection):
+        def cursor(self, *args, **kwargs):
+            factory = kwargs.get("cursor_factory") or self.cursor_factory or BaseCursor
+            kwargs["cursor_factory"] = timed_cursor(factory)
+            return super().cursor(*args, **kwargs)
+
+    return TimedConnection
@@ -0,0 +1,115 @@
+import threading
+import bcrypt
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+
+# bcrypt używa tylko pierwszych 72 bajtów hasła; bcrypt >= 5 odrzuca dłuższe ValueError
+MAX_PASSWORD_BYTES = 72
+
+
+class HasherBusy(Exception):
+    """Raised when too many password hashing jobs are already queued, or a job didn't finish in time."""
+
+
+def password_bytes(password):
+    """
+    Encode a password for bcrypt, cut to the MAX_PASSWORD_BYTES it uses.
+    Args:
+        password (str): The plain text password.
+    Returns:
+        bytes: At most MAX_PASSWORD_BYTES bytes of its UTF-8 encoding.
+    """
+
+    return password.encode("utf-8")[:MAX_PASSWORD_BYTES]
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification on a bounded pool of worker threads.
+
+    bcrypt releases the GIL, so a small pool keeps the CPU-heavy work off the request
+    threads' budget: at most `workers` hashes run at once, at most `max_queue` more
+    wait, and anything beyond that is rejected with HasherBusy instead of piling up; a
+    request whose job doesn't finish within `timeout` gets HasherBusy as well.
+
+    Passwords longer than MAX_PASSWORD_BYTES are cut to that length for both hashing and
+    verification, as older bcrypt releases did silently, so hashes made by them still
+    verify; registration rejects such passwords up front.
+    Args:
+        rounds (int): bcrypt cost factor for new hashes.
+        workers (int): Number of hashing threads.
+        max_queue (int): Number of jobs allowed to wait for a free thread.
+        timeout (float): Seconds a request waits for its job to finish.
+    """
+
+    def __init__(self, rounds=12, workers=2, max_queue=16, timeout=10.0):
+        self.rounds = rounds
+        self.timeout = timeout
+        self.workers = workers
+        self.max_queue = max_queue
+        self.after_fork()
+
+    def after_fork(self):
+        """Create the worker pool; called again in a forked child, where the parent's threads don't exist."""
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="bcrypt")
+        self._slots = threading.BoundedSemaphore(self.workers + self.max_queue)
+
+    def _run(self, function, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy("Password hashing queue is full")
+        try:
+            future = self._executor.submit(function, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda f: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeout:
+            # Zadanie dokończy się w tle i wtedy zwolni swoje miejsce w kolejce
+            raise HasherBusy(f"Password hashing didn't finish in {self.timeout}s") from None
+
+    def hash(self, password):
+        """
+        Hash a password with the configured cost factor.
+        Args:
+            password (str): The plain text password.
+        Returns:
+            str: The bcrypt hash.
+        """
+
+        return self._run(self._hash, password)
+
+    def verify(self, password, hashed):
+        """
+        Check a password against a stored bcrypt hash.
+        Args:
+            password (str): The plain text password.
+            hashed (str): The stored hash.
+        Returns:
+            bool: True if the password matches.
+        """
+
+        return self._run(self._verify, password, hashed)
+
+    def needs_rehash(self, hashed):
+        """
+        Check whether a stored hash was made with a different cost factor than configured.
+        Args:
+            hashed (str): The stored hash, e.g. "$2b$12$...".
+        Returns:
+            bool: True if the hash should be replaced on the next successful login.
+        """
+
+        try:
+            return int(hashed.split("$")[2]) != self.rounds
+        except (IndexError, ValueError):
+            return True
+
+    def _hash(self, password):
+        return bcrypt.hashpw(password_bytes(password), bcrypt.gensalt(self.rounds)).decode("utf-8")
+
+    def _verify(self, password, hashed):
+        try:
+            return bcrypt.checkpw(password_bytes(password), hashed.encode("utf-8"))
+        except ValueError:
+            return False
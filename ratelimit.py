@@ -0,0 +1,170 @@
+import time
+import threading
+from collections import OrderedDict
+from psycopg2 import Error as DatabaseError
+from db.pool import PoolTimeout
+
+
+class RateLimited(Exception):
+    """
+    Raised when a client used up its requests to a rate-limited route.
+    Args:
+        name (str): The limit, a key of RATE_LIMITS.
+        retry_after (float): Seconds until the next request is allowed.
+    """
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Rate limit {name} exceeded, retry after {retry_after:.1f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class TokenBucketLimiter:
+    """
+    In-process token buckets, one per key (e.g. "login:ip:10.0.0.1").
+
+    A bucket holds up to `burst` tokens and refills at `rate` tokens per second; a
+    request takes a token from each of its buckets, or from none when one of them is
+    empty, so rejected requests don't drain the client's other buckets. A bucket is two
+    floats updated under a lock on the request, so there is no background thread. Only
+    the `max_keys` most recently used buckets are kept; a dropped bucket starts full again. Limits are per worker process - see
+    PostgresRateLimiter for limits shared by all nodes.
+    Args:
+        max_keys (int): Number of buckets kept in memory.
+    """
+
+    def __init__(self, max_keys=10000):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def check(self, keys, rate, burst):
+        """
+        Take a token from each bucket if every one of them has a token.
+        Args:
+            keys (list): The buckets, e.g. the client's IP and user.
+            rate (float): Tokens added per second.
+            burst (float): Capacity of a bucket.
+        Returns:
+            float: 0 when the request is allowed, otherwise seconds until every bucket has a token.
+        """
+
+        now = time.monotonic()
+        with self._lock:
+            available = []
+            for key in keys:
+                tokens, updated_at = self._buckets.pop(key, (burst, now))
+                available.append(min(burst, tokens + (now - updated_at) * rate))
+            lowest = min(available, default=burst)
+            taken = 1 if lowest >= 1 else 0
+            for key, tokens in zip(keys, available):
+                self._buckets[key] = (tokens - taken, now)
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return 0.0 if taken else (1 - lowest) / rate
+
+    def after_fork(self):
+        """Start with empty buckets and a fresh lock in a forked child."""
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+
+class PostgresRateLimiter:
+    """
+    Token buckets in the `rate_limits` table, shared by every node (RATE_LIMIT_BACKEND = "postgres").
+
+    A check is one call of the rate_limit_hit() function (migration
+    rate_limit_hit_all_or_none181026.sql), which refills the buckets under their row
+    locks and takes a token from each only when all of them have one, like
+    TokenBucketLimiter. A background thread deletes buckets that have refilled
+    completely, which is the same as a missing one.
+
+    The limiter protects the database, so it must not wait for it: a check waits at
+    most `checkout_timeout` for a pooled connection, instead of the pool's timeout, and
+    when the pool is exhausted or the database can't be reached the request is checked
+    against the in-process `fallback` buckets of this worker instead.
+    Args:
+        pool (ConnectionPool): Pool to check connections out of.
+        sweep_interval (float): Seconds between sweeps of full buckets.
+        sweep_batch (int): Rows deleted per sweep statement.
+        checkout_timeout (float): Seconds a check waits for a free connection.
+        fallback (TokenBucketLimiter, optional): Buckets used while the database is unavailable.
+    """
+
+    def __init__(self, pool, sweep_interval=300.0, sweep_batch=1000, checkout_timeout=0.05, fallback=None):
+        self.pool = pool
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self.checkout_timeout = checkout_timeout
+        self.fallback = fallback or TokenBucketLimiter()
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+
+    def check(self, keys, rate, burst):
+        """
+        Take a token from each bucket if every one of them has a token, in one round trip.
+        Args:
+            keys (list): The buckets, e.g. the client's IP and user.
+            rate (float): Tokens added per second.
+            burst (float): Capacity of a bucket.
+        Returns:
+            float: 0 when the request is allowed, otherwise seconds until every bucket has a token.
+        """
+
+        if self._sweeper is None:
+            self._start_sweeper()
+        try:
+            with self.pool.connection(timeout=self.checkout_timeout) as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT rate_limit_hit(%s, %s, %s)", (list(keys), rate, burst))
+                    wait = cur.fetchone()[0]
+                conn.commit()
+            return wait
+        except PoolTimeout:
+            # Pula wyczerpana - baza jest przeciążona, nie dokładaj jej czekania
+            return self.fallback.check(keys, rate, burst)
+        except DatabaseError as e:
+            print(f"Błąd limitu żądań, użyto limitów lokalnych: {e}")
+            return self.fallback.check(keys, rate, burst)
+
+    def _start_sweeper(self):
+        with self._sweeper_lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, name="rate-limit-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def after_fork(self):
+        """Forget the parent's sweeper thread and fallback buckets in a forked child."""
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+        self.fallback.after_fork()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Błąd usuwania pełnych kubełków limitów: {e}")
+
+    def sweep(self):
+        """
+        Delete the buckets that have refilled completely, in batches.
+        Returns:
+            int: Number of deleted buckets.
+        """
+
+        deleted = 0
+        while True:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        DELETE FROM rate_limits WHERE key IN (
+                            SELECT key FROM rate_limits WHERE full_at < now() LIMIT %s
+                        )
+                    """, (self.sweep_batch,))
+                    count = cur.rowcount
+                conn.commit()
+            deleted += count
+            if count < self.sweep_batch:
+                return deleted
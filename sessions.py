@@ -0,0 +1,214 @@
+import secrets
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from flask import g
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SessionInterface, SessionMixin
+from itsdangerous import Signer, BadSignature
+from werkzeug.datastructures import CallbackDict
+
+
+class PostgresSession(CallbackDict, SessionMixin):
+    """
+    Session data stored server-side under a random id.
+    clear() marks the session for a new id, so logging in after session.clear()
+    never reuses the id an attacker might have planted (session fixation).
+    """
+
+    def __init__(self, initial=None, sid=None, new=False):
+        def on_update(self):
+            self.modified = True
+            self.accessed = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.new = new
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+        self.refresh = False
+
+    def __getitem__(self, key):
+        self.accessed = True
+        return super().__getitem__(key)
+
+    def get(self, key, default=None):
+        self.accessed = True
+        return super().get(key, default)
+
+    def clear(self):
+        super().clear()
+        self.rotate = True
+
+
+class PostgresSessionInterface(SessionInterface):
+    """
+    Flask session interface keeping sessions in the `sessions` table.
+
+    The cookie only carries the signed session id. Rows are written only when the
+    session changes (or is about to expire), and a background thread deletes expired
+    rows in small batches, using the index on expires_at. The session is saved before
+    teardown returns the request's connection (extensions.get_db), so the write reuses
+    it: with a second checkout, DB_POOL_MAX requests saving their sessions at once
+    would each hold one connection and wait for another until PoolTimeout.
+    Args:
+        pool (ConnectionPool): Pool to check connections out of.
+        sweep_interval (float): Seconds between expired-session sweeps.
+        sweep_batch (int): Rows deleted per sweep statement.
+    """
+
+    serializer = TaggedJSONSerializer()
+    salt = "postgres-session"
+
+    def __init__(self, pool, sweep_interval=300.0, sweep_batch=1000):
+        self.pool = pool
+        self.sweep_interval = sweep_interval
+        self.sweep_batch = sweep_batch
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+
+    def _signer(self, app):
+        return Signer(app.secret_key, salt=self.salt)
+
+    def _start_sweeper(self):
+        with self._sweeper_lock:
+            if self._sweeper is None:
+                self._sweeper = threading.Thread(target=self._sweep_forever, name="session-sweeper", daemon=True)
+                self._sweeper.start()
+
+    def after_fork(self):
+        """Forget the parent's sweeper thread in a forked child."""
+        self._sweeper = None
+        self._sweeper_lock = threading.Lock()
+
+    def _sweep_forever(self):
+        while True:
+            time.sleep(self.sweep_interval)
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"Błąd usuwania wygasłych sesji: {e}")
+
+    def sweep(self):
+        """
+        Delete expired sessions in batches.
+        Returns:
+            int: Number of deleted sessions.
+        """
+
+        deleted = 0
+        while True:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("""
+                        DELETE FROM sessions WHERE id IN (
+                            SELECT id FROM sessions WHERE expires_at < now() LIMIT %s
+                        )
+                    """, (self.sweep_batch,))
+                    count = cur.rowcount
+                conn.commit()
+            deleted += count
+            if count < self.sweep_batch:
+                return deleted
+
+    @contextmanager
+    def _connection(self):
+        conn = g.get("db_conn")
+        if conn is None:
+            with self.pool.connection() as conn:
+                yield conn
+            return
+        # Niezatwierdzoną pracę widoku i tak wycofałby teardown; commit zapisuje tylko sesję
+        conn.rollback()
+        yield conn
+
+    def open_session(self, app, request):
+        self._start_sweeper()
+        sid = self.session_id(app, request)
+        row = None
+        if sid:
+            with self.pool.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(self.load_sql, (sid,))
+                    row = cur.fetchone()
+        return self.session_from_row(app, sid, row)
+
+    load_sql = "SELECT data, expires_at FROM sessions WHERE id = %s AND expires_at > now()"
+
+    def session_id(self, app, request):
+        """
+        Read the session id from the signed cookie.
+        Returns:
+            str or None: The session id, or None without a cookie or with a bad signature.
+        """
+
+        cookie = request.cookies.get(self.get_cookie_name(app))
+        if not cookie:
+            return None
+        try:
+            return self._signer(app).unsign(cookie).decode("utf-8")
+        except BadSignature:
+            return None
+
+    def session_from_row(self, app, sid, row):
+        """
+        Build the session from a `load_sql` row; a missing row starts a new session.
+        Also used by the ASGI entry point, which loads the row with an async connection.
+        Args:
+            sid (str or None): The session id from the cookie.
+            row (tuple or None): The (data, expires_at) row.
+        Returns:
+            PostgresSession: The session.
+        """
+
+        if row is None:
+            return PostgresSession(sid=secrets.token_urlsafe(32), new=True)
+        session = PostgresSession(self.serializer.loads(row[0]), sid=sid)
+        # Aktywna sesja bliska wygaśnięcia jest przedłużana przy zapisie
+        remaining = row[1] - datetime.now(timezone.utc)
+        session.refresh = remaining < app.permanent_session_lifetime / 2
+        return session
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+
+        if session.rotate and not session.new:
+            with self._connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("DELETE FROM sessions WHERE id = %s", (session.sid,))
+                conn.commit()
+            session.sid = secrets.token_urlsafe(32)
+            session.new = True
+
+        if not session:
+            if session.modified:
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not (session.modified or session.refresh or session.new):
+            return
+
+        expires_at = datetime.now(timezone.utc) + app.permanent_session_lifetime
+        with self._connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    INSERT INTO sessions (id, data, expires_at) VALUES (%s, %s, %s)
+                    ON CONFLICT (id) DO UPDATE SET data = EXCLUDED.data, expires_at = EXCLUDED.expires_at
+                """, (session.sid, self.serializer.dumps(dict(session)), expires_at))
+            conn.commit()
+        if session.new or session.permanent:
+            response.set_cookie(
+                name,
+                self._signer(app).sign(session.sid).decode("utf-8"),
+                expires=self.get_expiration_time(app, session),
+                httponly=self.get_cookie_httponly(app),
+                domain=domain,
+                path=path,
+                secure=self.get_cookie_secure(app),
+                samesite=self.get_cookie_samesite(app),
+            )
+
@@ -17,15 +17,89 @@ document.addEventListener("DOMContentLoaded", function () {
   }
 
   // Add event listeners for buttons
-  document.querySelectorAll('.btn-primary[data-bs-toggle="modal"]').forEach(button => {
+  const detailButtons = document.querySelectorAll('.btn-primary[data-bs-toggle="modal"]');
+  detailButtons.forEach(button => {
     button.addEventListener('click', function () {
       const gameId = this.getAttribute('data-game-id');
       callGameData(gameId);
     });
   });
+  prefetchGameData(Array.from(detailButtons, (button) => button.getAttribute("data-game-id")));
+
+  startChatStream();
 });
 
+function startChatStream() {
+  const chat = document.getElementById("chat");
+  if (!chat || !chat.dataset.streamUrl || typeof EventSource === "undefined") {
+    return;
+  }
+  const url = new URL(chat.dataset.streamUrl, window.location.origin);
+  url.searchParams.set("since", chat.dataset.lastId);
+  const source = new EventSource(url);
+  source.addEventListener("message", (event) => {
+    const message = JSON.parse(event.data);
+    if (!document.getElementById(`message-${message.id}`)) {
+      chat.prepend(renderMessage(message));
+    }
+  });
+}
+
+function renderMessage(message) {
+  const card = document.createElement("div");
+  card.className = "card border-primary mb-3";
+  card.style.maxWidth = "18rem";
+  card.id = `message-${message.id}`;
+  const header = document.createElement("div");
+  header.className = "card-header";
+  header.textContent = message.user_id;
+  const body = document.createElement("div");
+  body.className = "card-body text-primary";
+  const text = document.createElement("p");
+  text.className = "card-text";
+  text.textContent = message.message;
+  body.appendChild(text);
+  const footer = document.createElement("div");
+  footer.className = "card-footer";
+  footer.textContent = message.timestamp;
+  card.append(header, body, footer);
+  return card;
+}
+
+// Game details prefetched for the cards on the page, keyed by game id
+const gameDetails = new Map();
+
+function prefetchGameData(ids) {
+  if (ids.length === 0) {
+    return;
+  }
+  fetch(`/game_data?ids=${ids.join(",")}`)
+    .then((response) => {
+      if (!response.ok) {
+        throw new Error(`HTTP error! status: ${response.status}`);
+      }
+      return response.json();
+    })
+    .then((data) => {
+      data.games.forEach((game) => gameDetails.set(String(game.id), game));
+    })
+    .catch((error) => {
+      console.error("Error:", error);
+    });
+}
+
+function showGameData(data) {
+  document.getElementById("gameModalLabel").innerText = data.title;
+  document.querySelector(".modal-body").innerText = data.description;
+  const form = document.querySelector(".modal-footer form");
+  form.action = `/apply_for_game/${data.id}`;
+}
+
 function callGameData(id) {
+  if (gameDetails.has(String(id))) {
+    showGameData(gameDetails.get(String(id)));
+    return;
+  }
   fetch(`/game_data/${id}`)
     .then((response) => {
       if (!response.ok) {
@@ -34,15 +108,12 @@ function callGameData(id) {
       return response.json();
     })
     .then((data) => {
-      console.log(data);
-      document.getElementById("gameModalLabel").innerText = data.title;
-      document.querySelector(".modal-body").innerText = data.description;
-      const form = document.querySelector(".modal-footer form");
-      form.action = `/apply_for_game/${data.id}`;
+      gameDetails.set(String(data.id), data);
+      showGameData(data);
     })
     .catch((error) => {
       console.error("Error:", error);
       document.getElementById("gameModalLabel").innerText = "Error";
       document.querySelector(".modal-body").innerText = "Failed to load game data.";
     });
-}
\ No newline at end of file
+}
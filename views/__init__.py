@@ -0,0 +1,12 @@
+from views.games import games
+from views.auth import auth
+from views.chat import chat
+from views.exports import exports
+from views.monitoring import monitoring
+
+BLUEPRINTS = (games, auth, chat, exports, monitoring)
+
+
+def register_blueprints(app):
+    for blueprint in BLUEPRINTS:
+        app.register_blueprint(blueprint)
@@ -0,0 +1,230 @@
+from flask import Blueprint, flash, redirect, render_template, request, session
+from helpers import login_required, check_and_flash_if_none, rate_limited
+from extensions import hasher, last_logins, get_db, release_db
+from passwords import MAX_PASSWORD_BYTES
+import db.queries as queries
+
+auth = Blueprint("auth", __name__)
+
+
+@auth.route('/register', methods=['GET', 'POST'])
+@rate_limited("register")
+def register():
+    """
+    Handle user registration.
+    GET:
+        Renders the registration form.
+    POST:
+        Processes the registration form:
+        - Validates the presence of username, email, password, and password confirmation.
+        - Checks if the password and confirmation match.
+        - Rejects passwords longer than bcrypt's MAX_PASSWORD_BYTES.
+        - Hashes the password.
+        - Checks if the username already exists in the database.
+        - Adds the new user to the database.
+        - Commits the transaction.
+        - Redirects to the login page upon successful registration.
+    Returns:
+        - Renders the registration form with error messages if validation fails or an exception occurs.
+        - Redirects to the login page upon successful registration.
+    """
+
+    if request.method == 'GET':
+        return render_template("register.html")
+    if request.method == 'POST':
+        print("POST")
+        username = request.form.get("username")
+        if check_and_flash_if_none(username, "Brak nazwy użytkownika"):
+            return render_template("register.html", error="Brak nazwy użytkownika")
+        email = request.form.get("email")
+        if check_and_flash_if_none(email, "Brak maila"):
+            return render_template("register.html", error="Brak maila")
+        password = request.form.get("password")
+        if check_and_flash_if_none(password, "Brak hasła"):
+            return render_template("register.html", error="Brak hasła")
+        confirmation = request.form.get("confirmation")
+        if check_and_flash_if_none(confirmation, "Brak potwierdzenia hasła"):
+            return render_template("register.html", error="Brak potwierdzenia hasła")
+        if password != confirmation:
+            flash("Hasła nie są zgodne", "error")
+            return render_template("register.html", error="Hasła nie są zgodne")
+        if len(password.encode("utf-8")) > MAX_PASSWORD_BYTES:
+            error = f"Hasło może mieć najwyżej {MAX_PASSWORD_BYTES} bajty"
+            flash(error, "error")
+            return render_template("register.html", error=error)
+        hash = hasher.hash(password)
+        try:
+            with get_db().cursor() as cur:
+                if queries.check_user_exist(cur, username):
+                    flash("Użytkownik już istnieje", "error")
+                    return render_template("register.html", error="Użytkownik już istnieje")
+                queries.add_user(cur, username, email, hash)
+                print("User added to db")
+            get_db().commit()
+            print("User saved")
+            flash("Dodano użytkownika", "success")
+        except Exception as e:
+            print(f"Exception occurred: {e}")
+            flash("Błąd dodawania użytkownika", "error")
+            return render_template("register.html", error="Błąd dodawania użytkownika")
+        return redirect("/login")
+
+@auth.route('/login', methods=['GET', 'POST'])
+@rate_limited("login")
+def login():
+    """
+    Handle user login.
+    This function clears the current session and processes the login request.
+    If the request method is GET, it renders the login page.
+    If the request method is POST, it validates the user credentials and logs the user in.
+    Returns:
+        The rendered template for the login page or preferences page, or a redirect to the home page.
+    Raises:
+        Exception: If there is an error during the login process.
+    """ 
+    session.clear()
+    if request.method == 'GET':
+        return render_template("login.html")
+    if request.method == 'POST':
+        user = request.form.get("user")
+        if check_and_flash_if_none(user, "Brak nazwy użytkownika lub maila"):
+            return render_template("login.html", error="Brak nazwy użytkownika lub maila")
+        if "@" in user:
+            column = "email"
+        else:
+            column = "name"
+        password = request.form.get("password")
+        if check_and_flash_if_none(password, "Brak hasła"):
+            return render_template("login.html", error="Brak hasła")
+        try:
+            with get_db().cursor() as cur:
+                user = queries.get_user_for_login(cur, column, user)
+        except Exception as e:
+            print(f"Exception occurred: {e}")
+            flash("Błąd logowania", "error")
+            return render_template("login.html", error="Błąd logowania")
+        # Połączenie wraca do puli na czas sprawdzania hasła
+        release_db(None)
+        if user is None or not hasher.verify(password, user.hash):
+            flash("Niepoprawne dane", "error")
+            return render_template("login.html", error="Niepoprawne dane")
+        session["user"] = {
+            "id": user.id,
+            "name": user.name,
+            "gm": user.gm
+        }
+        last_logins.record(user.id)
+        if hasher.needs_rehash(user.hash):
+            new_hash = hasher.hash(password)
+            try:
+                with get_db().cursor() as cur:
+                    queries.update_user_hash(cur, user.id, new_hash)
+                get_db().commit()
+            except Exception as e:
+                print(f"Exception occurred: {e}")
+        flash("Zalogowano", "success")
+        if user.filled_preferences:
+            return redirect("/")
+        return render_template("preferences.html")
+
+@auth.route('/logout')
+def logout():
+    """
+    Logs out the current user by clearing the session and redirecting to the home page.
+    Returns:
+        Response: A redirect response to the home page ("/").
+    """
+
+    session.clear()
+    return redirect("/")
+
+@auth.route('/preferences', methods=['GET', 'POST'])
+@login_required
+def preferences():
+    """
+    Handle user preferences for roles.
+    This function handles both GET and POST requests for user preferences.
+    - For GET requests, it renders the preferences form.
+    - For POST requests, it processes the submitted preferences form.
+    POST request processing:
+    1. Retrieves the user ID from the session.
+    2. Checks if the user ID is valid; if not, redirects to the home page with an error message.
+    3. Retrieves the list of selected roles from the form.
+    4. Checks if any preferences were selected; if not, re-renders the preferences form with an error message.
+    5. Updates the user's preferences in the database based on the selected roles.
+    6. Commits the changes to the database and flashes a success message.
+    7. Handles any exceptions by flashing an error message and redirecting to the home page.
+    Returns:
+        - For GET requests: Renders the preferences form.
+        - For POST requests: Redirects to the home page after processing the form.
+    """
+
+    if request.method == 'GET':
+        return render_template("preferences.html")
+    if request.method == 'POST':
+        user = session.get("user")["id"]
+        print(user)
+        if check_and_flash_if_none(user, "Brak użytkownika"):
+            return redirect("/", error="Brak użytkownika")
+        preferences = request.form.getlist("roles")
+        print(preferences)
+        if check_and_flash_if_none(preferences, "Brak preferencji"):
+            return render_template("preferences.html", error="Brak preferencji")
+        try:
+            with get_db().cursor() as cur:
+                if 'player' in preferences:
+                    print("player")
+                    queries.add_player(cur, user)
+                if 'gm' in preferences:
+                    print("gm")
+                    queries.add_gm(cur, user)
+                    session["user"] = {**session["user"], "gm": True}
+                queries.update_preferences_questionary(cur, user)
+                print("filled_preferences")
+                get_db().commit()
+                flash("Wypełniono ankiete", "success")
+        except Exception as e:
+            flash("Błąd uzupełniania preferencji", "error")
+            return redirect("/", error="Błąd preferencji")
+        return redirect("/")
+
+def profile_fetch_failed(e):
+    """Response of /profile when the user couldn't be loaded; shared with asgi.py."""
+    print(f"Exception occurred: {e}")
+    flash("Błąd pobierania użytkownika", "error")
+    return redirect("/")
+
+def render_profile(user_profile):
+    """
+    Render the profile page; shared with asgi.py.
+    Args:
+        user_profile (ProfileView or None): The loaded profile.
+    Returns:
+        Response: The rendered page, or a redirect to the home page when the user doesn't exist.
+    """
+
+    if check_and_flash_if_none(user_profile, "Brak użytkownika"):
+        return redirect("/")
+    return render_template("profile.html", user=user_profile, player_games=user_profile.player_games,
+                           gm_games=user_profile.gm_games)
+
+@auth.route('/profile')
+@login_required
+def profile():
+    """
+    Renders the profile page for the logged-in user.
+    This function loads the user's profile, player and game master (GM) status
+    and both game lists with a single query. If the user is not
+    found or an error occurs during the retrieval process, appropriate error
+    messages are flashed, and the user is redirected to the home page.
+    Returns:
+        Response: Renders the profile page with the user's profile information or redirects to the home page with an error message.
+    """
+
+    user = session.get("user")["id"]
+    try:
+        with get_db().cursor() as cur:
+            user_profile = queries.get_profile_view(cur, user)
+    except Exception as e:
+        return profile_fetch_failed(e)
+    return render_profile(user_profile)
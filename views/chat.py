@@ -0,0 +1,167 @@
+import json
+import queue
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, jsonify, abort, url_for, Response
+from helpers import login_required
+from extensions import get_services, get_db, cached_game
+import db.queries as queries
+
+chat = Blueprint("chat", __name__)
+
+
+def message_json(message):
+    return {
+        "id": message.id,
+        "user_id": message.user_id,
+        "message": message.message,
+        "timestamp": message.timestamp.isoformat(),
+    }
+
+
+def chat_page_args(args):
+    """
+    Read the page cursor of /game_chat/<game_id>; shared with asgi.py.
+    Args:
+        args (MultiDict): The request query arguments.
+    Returns:
+        tuple: The message id the page ends before (None for the newest page) and the page size.
+    """
+
+    return args.get("before", type=int), current_app.config["CHAT_PAGE_SIZE"]
+
+
+def chat_fetch_failed(e):
+    """Response of /game_chat/<game_id> when the messages couldn't be loaded; shared with asgi.py."""
+    print(f"Exception occurred: {e}")
+    flash("Couldn't fetch messages", "error")
+    return redirect("/")
+
+
+def render_chat_page(game_id, before_id, limit, messages, waiting, is_gm):
+    """
+    Render one page of a game's chat history; shared with asgi.py.
+    Args:
+        game_id (int): The game.
+        before_id (int or None): The page cursor from chat_page_args.
+        limit (int): The page size.
+        messages (list): The page's messages, newest first.
+        waiting (list): Players waiting for the GM's acceptance (empty unless is_gm).
+        is_gm (bool): Whether the user runs the game.
+    Returns:
+        str: The rendered page.
+    """
+
+    older_url = None
+    if len(messages) == limit:
+        older_url = url_for("chat.game_chat", game_id=game_id, before=messages[-1].id)
+    last_id = messages[0].id if messages else 0
+    return render_template("game_chat.html", messages=messages, game_id=game_id, older_url=older_url,
+                           last_id=last_id, live=before_id is None, waiting=waiting, is_gm=is_gm)
+
+
+@chat.route('/game_chat/<int:game_id>', methods=['GET'])
+@login_required
+def game_chat(game_id):
+    """
+    Renders one page of the game's chat history, newest first.
+    The first page also subscribes the browser to new messages over Server-Sent Events.
+    Returns:
+        Response: The rendered chat page or a redirect to the home page on error.
+    """
+
+    before_id, limit = chat_page_args(request.args)
+    with get_db().cursor() as cur:
+        try:
+            chatroom = queries.fetch_chat(cur, game_id)
+            messages = []
+            waiting = []
+            is_gm = False
+            if chatroom is not None:
+                messages = queries.fetch_messages(cur, chatroom.id, before_id, limit)
+                game = cached_game(game_id)
+                is_gm = game is not None and game.gm_id == session["user"]["id"]
+                if is_gm:
+                    waiting = queries.fetch_waiting_players(cur, chatroom.id)
+        except Exception as e:
+            return chat_fetch_failed(e)
+    return render_chat_page(game_id, before_id, limit, messages, waiting, is_gm)
+
+
+@chat.route('/game_chat/<int:game_id>/messages', methods=['GET'])
+@login_required
+def game_chat_messages(game_id):
+    """
+    JSON chat history. With `since` returns messages newer than that id (oldest first),
+    otherwise a page of messages older than `before` (newest first).
+    Returns:
+        Response: JSON with the messages and the cursor for the next older page.
+    """
+
+    since_id = request.args.get("since", type=int)
+    before_id = request.args.get("before", type=int)
+    limit = request.args.get("limit", current_app.config["CHAT_PAGE_SIZE"], type=int)
+    limit = max(1, min(limit, current_app.config["CHAT_PAGE_MAX"]))
+    with get_db().cursor() as cur:
+        chatroom = queries.fetch_chat(cur, game_id)
+        if chatroom is None:
+            abort(404)
+        if since_id is not None:
+            messages = queries.fetch_messages_since(cur, chatroom.id, since_id, limit)
+            next_before = None
+        else:
+            messages = queries.fetch_messages(cur, chatroom.id, before_id, limit)
+            next_before = messages[-1].id if len(messages) == limit else None
+    return jsonify(messages=[message_json(m) for m in messages], next_before=next_before)
+
+
+@chat.route('/game_chat/<int:game_id>/stream', methods=['GET'])
+@login_required
+def game_chat_stream(game_id):
+    """
+    Server-Sent Events stream of new chat messages.
+    The stream resumes after the Last-Event-ID header (or the `since` argument) and
+    only checks out a pooled connection briefly when a NOTIFY arrives for the room.
+    Returns:
+        Response: A text/event-stream response.
+    """
+
+    since_id = request.headers.get("Last-Event-ID", type=int)
+    if since_id is None:
+        since_id = request.args.get("since", type=int)
+    since_timestamp = None
+    with get_db().cursor() as cur:
+        chatroom = queries.fetch_chat(cur, game_id)
+        if chatroom is None:
+            abort(404)
+        chatroom_id = chatroom.id
+        if since_id is None:
+            latest = queries.fetch_messages(cur, chatroom_id, limit=1)
+            since_id = latest[0].id if latest else 0
+            since_timestamp = latest[0].timestamp if latest else None
+    services = get_services()
+    services.listener.start()
+    keepalive = current_app.config["CHAT_KEEPALIVE"]
+    batch = current_app.config["CHAT_PAGE_MAX"]
+
+    def stream(last_id, last_timestamp):
+        wakeups = services.chat_subscribers.subscribe(chatroom_id)
+        try:
+            yield "retry: 3000\n\n"
+            while True:
+                while True:
+                    with services.pool.connection() as conn, conn.cursor() as cur:
+                        messages = queries.fetch_messages_since(cur, chatroom_id, last_id, batch, last_timestamp)
+                    for m in messages:
+                        last_id = m.id
+                        last_timestamp = m.timestamp
+                        yield f"id: {last_id}\nevent: message\ndata: {json.dumps(message_json(m))}\n\n"
+                    if len(messages) < batch:
+                        break
+                try:
+                    wakeups.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+        finally:
+            services.chat_subscribers.unsubscribe(chatroom_id, wakeups)
+
+    return Response(stream(since_id, since_timestamp), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
@@ -0,0 +1,206 @@
+import io
+import csv
+import json
+import time
+import threading
+from datetime import datetime
+from flask import Blueprint, current_app, session, abort, Response
+from helpers import login_required
+from extensions import get_services, get_db, cached_game
+from db.view_models import ExportedMessage, ExportedGame
+import db.queries as queries
+
+exports = Blueprint("exports", __name__)
+
+MIMETYPES = {
+    "jsonl": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class ExportTimeout(Exception):
+    """Raised inside an export stream cut off by its ExportGuard."""
+
+
+class ExportGuard:
+    """
+    Returns an export's pooled connection and export slot exactly once.
+
+    Normally that happens when the response is closed. A client that stops reading
+    blocks the server thread inside the write of a chunk, where the stream's own code
+    never runs again and the response isn't closed, so a watchdog thread also releases
+    them when no chunk was taken for `idle_timeout` seconds or the export runs past
+    `time_limit`: it cancels the running statement and the pool discards the connection.
+    Args:
+        services (Services): The app's services (pool and export slots).
+        conn (connection): The export's pooled connection.
+        idle_timeout (float): Seconds the client may stop reading.
+        time_limit (float): Seconds the whole export may take.
+    """
+
+    def __init__(self, services, conn, idle_timeout, time_limit):
+        self.services = services
+        self.conn = conn
+        self.idle_timeout = idle_timeout
+        self.time_limit = time_limit
+        self.deadline = time.monotonic() + time_limit
+        self.progress = time.monotonic()
+        self.timed_out = False
+        self._released = False
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+        threading.Thread(target=self._watch, name="export-watchdog", daemon=True).start()
+
+    def touch(self):
+        """Record that the client took a chunk."""
+        self.progress = time.monotonic()
+
+    def _watch(self):
+        while not self._done.wait(min(1.0, self.idle_timeout)):
+            now = time.monotonic()
+            if now - self.progress > self.idle_timeout or now > self.deadline:
+                print(f"Eksport przerwany: klient nie czyta od {now - self.progress:.0f}s "
+                      f"lub minął limit {self.time_limit}s")
+                self.timed_out = True
+                try:
+                    self.conn.cancel()
+                except Exception:
+                    pass
+                self.release(discard=True)
+                return
+
+    def release(self, discard=False):
+        """Return the connection to the pool (closing it with discard=True) and free the export slot."""
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._done.set()
+        self.services.pool.putconn(self.conn, discard=discard)
+        self.services.export_slots.release()
+
+
+def export_value(value):
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def encode_batches(batches, fields, fmt, guard):
+    """
+    Encode batches of rows as JSON Lines or CSV, one chunk of the response per batch.
+    Args:
+        batches (iterable): Lists of NamedTuple rows from a queries.export_* function.
+        fields (tuple): Field names of the rows; the CSV header.
+        fmt (str): "jsonl" or "csv".
+        guard (ExportGuard): The export's guard, told about every chunk the client took.
+    Yields:
+        str: The encoded rows of one batch.
+    Raises:
+        ExportTimeout: When the guard cut the export off.
+    """
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if fmt == "csv":
+        writer.writerow(fields)
+    for batch in batches:
+        if fmt == "csv":
+            writer.writerows([export_value(value) for value in row] for row in batch)
+            chunk = buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            chunk = "".join(json.dumps({field: export_value(value) for field, value in zip(fields, row)},
+                                       ensure_ascii=False) + "\n" for row in batch)
+        yield chunk
+        guard.touch()
+        if guard.timed_out or time.monotonic() > guard.deadline:
+            # Wyjątek zrywa połączenie bez końcowego chunka: klient widzi przerwane pobieranie,
+            # a nie poprawnie zakończony, ucięty plik
+            raise ExportTimeout(f"Export cut off (idle {guard.idle_timeout}s, limit {guard.time_limit}s)")
+    if fmt == "csv" and buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(export, args, fields, filename, fmt):
+    """
+    Stream an export query of db/queries.py as a JSON Lines or CSV download.
+
+    The export runs on a named cursor on its own pooled connection, not the request's
+    get_db() one, which teardown returns before the body is sent. The connection and a
+    slot of EXPORT_MAX_CONCURRENT are released when the response is closed, or by the
+    export's ExportGuard when the client stops reading for EXPORT_IDLE_TIMEOUT seconds or
+    the export runs past EXPORT_DEADLINE - even while the server is blocked writing to
+    that client. idle_in_transaction_session_timeout ends the transaction on the server
+    if the process itself stops.
+    Args:
+        export (callable): queries.export_chat_messages or queries.export_gm_games.
+        args (tuple): Arguments of the export after the cursor.
+        fields (tuple): Field names of the exported rows.
+        filename (str): Download name without the extension.
+        fmt (str): "jsonl" or "csv".
+    Returns:
+        Response: A streamed attachment, or 503 when too many exports are running.
+    """
+
+    config = current_app.config
+    services = get_services()
+    if not services.export_slots.acquire(blocking=False):
+        return "Trwa zbyt wiele eksportów, spróbuj ponownie za chwilę", 503, {"Retry-After": "5"}
+    try:
+        conn = services.pool.getconn()
+    except Exception:
+        services.export_slots.release()
+        raise
+    guard = ExportGuard(services, conn, config["EXPORT_IDLE_TIMEOUT"], config["EXPORT_DEADLINE"])
+
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SET LOCAL idle_in_transaction_session_timeout = %s", (f"{config['EXPORT_IDLE_TIMEOUT']}s",))
+            cur.execute("SET LOCAL statement_timeout = %s", (f"{config['EXPORT_IDLE_TIMEOUT']}s",))
+        cur = conn.cursor(name="export")
+        cur.itersize = config["EXPORT_BATCH_SIZE"]
+        batches = export(cur, *args, batch_size=config["EXPORT_BATCH_SIZE"])
+    except Exception:
+        guard.release()
+        raise
+    response = Response(encode_batches(batches, fields, fmt, guard), mimetype=MIMETYPES[fmt],
+                        headers={"Content-Disposition": f'attachment; filename="{filename}.{fmt}"'})
+    response.call_on_close(guard.release)
+    return response
+
+
+@exports.route('/game_chat/<int:game_id>/export.<any(jsonl, csv):fmt>', methods=['GET'])
+@login_required
+def export_chat(game_id, fmt):
+    """
+    Downloads the game's whole chat history, oldest first. Only the game's GM can export it.
+    Returns:
+        Response: The chat log as JSON Lines or CSV.
+    """
+
+    game = cached_game(game_id)
+    if game is None:
+        abort(404)
+    if game.gm_id != session["user"]["id"]:
+        abort(403)
+    with get_db().cursor() as cur:
+        chatroom = queries.fetch_chat(cur, game_id)
+    if chatroom is None:
+        abort(404)
+    return export_response(queries.export_chat_messages, (chatroom.id,), ExportedMessage._fields,
+                           f"chat-{game_id}", fmt)
+
+
+@exports.route('/export/games.<any(jsonl, csv):fmt>', methods=['GET'])
+@login_required
+def export_games(fmt):
+    """
+    Downloads the list of games the user runs as GM, with their accepted players.
+    Returns:
+        Response: The games as JSON Lines or CSV.
+    """
+
+    if not session["user"].get("gm"):
+        abort(403)
+    return export_response(queries.export_gm_games, (session["user"]["id"],), ExportedGame._fields,
+                           "games", fmt)
@@ -0,0 +1,455 @@
+from flask import Blueprint, current_app, flash, redirect, render_template, request, session, g, jsonify, abort, url_for
+from helpers import login_required, check_and_flash_if_none, cache_policy, rate_limited
+from extensions import cache, fragments, get_services, get_db, cached_systems, cached_game
+from fragments import render_fragment, render_macro_fragments, fragment_size
+import db.queries as queries
+
+games = Blueprint("games", __name__)
+
+
+def game_board_filters(args):
+    """
+    Read the game board filters and page cursor from the query string.
+    Invalid numbers are ignored instead of failing the request.
+    Args:
+        args (MultiDict): The request query arguments.
+    Returns:
+        dict: Keyword arguments for queries.get_games_page.
+    """
+
+    limit = args.get("limit", current_app.config["GAMES_PAGE_SIZE"], type=int)
+    return {
+        "before_id": args.get("before", type=int),
+        "limit": max(1, min(limit, current_app.config["GAMES_PAGE_MAX"])),
+        "system_id": args.get("system", type=int),
+        "gm_id": args.get("gm", type=int),
+        "open_seats": args.get("open") == "1",
+    }
+
+
+def game_cards(games):
+    """
+    Render the board card of each game, reusing the cached card while the game's row version is unchanged.
+    Args:
+        games (list): Game records with id and version.
+    Returns:
+        list: The cards as Markup, in the order of games.
+    """
+
+    store = get_services().fragments
+    keys = [("card", game.id, game.version) for game in games]
+    cards = [store.get(key) for key in keys]
+    missing = [i for i, card in enumerate(cards) if card is None]
+    if missing:
+        rendered = render_macro_fragments("game_card.html", "game_card", [{"game": games[i]} for i in missing])
+        for i, card in zip(missing, rendered):
+            cards[i] = card
+            store.set(keys[i], card, fragment_size(card))
+    return cards
+
+
+def render_game_list(games):
+    """Render the card grid of game_list.html; the result holds no per-request data."""
+    return render_fragment("game_list.html", cards=game_cards(games), game_data=None)
+
+
+def board_fragment_key(filters):
+    """Cache key of a rendered board page, valid until the next write to the games (version "games")."""
+    return ("board", fragments.version("games"), tuple(sorted(filters.items())))
+
+
+def cache_board(board_key, games, next_cursor):
+    """
+    Render a loaded board page and cache it; shared with asgi.py.
+    Args:
+        board_key (tuple): The board_fragment_key read before the page was loaded.
+        games (list): The games on the page.
+        next_cursor (int or None): Cursor of the next page.
+    Returns:
+        tuple: The rendered card grid and the cursor of the next page.
+    """
+
+    board = (render_game_list(games), next_cursor)
+    fragments.set(board_key, board, fragment_size(board[0]), ttl=current_app.config["BOARD_FRAGMENT_TTL"])
+    return board
+
+
+def render_board(board, systems, filters):
+    """
+    Render the game board page around a cached or fresh board; shared with asgi.py.
+    Args:
+        board (tuple): The rendered card grid and the cursor of the next page.
+        systems (list): System rows for the filter form.
+        filters (dict): The filters from game_board_filters.
+    Returns:
+        str: The rendered page.
+    """
+
+    game_list, next_cursor = board
+    next_url = None
+    if next_cursor is not None:
+        query = {key: value for key, value in request.args.items() if key != "before"}
+        next_url = url_for("games.index", before=next_cursor, **query)
+    return render_template("index.html", game_list=game_list, systems=systems, filters=filters,
+                           next_url=next_url, nonce=g.nonce)
+
+
+@games.route('/')
+@cache_policy("private, no-cache", anonymous_only=True, etag=True)
+def index():
+    filters = game_board_filters(request.args)
+    # Wersja odczytana przed zapytaniem: zapis w trakcie renderowania nie zostanie przykryty
+    board_key = board_fragment_key(filters)
+    board = fragments.get(board_key)
+    if board is None:
+        with get_db().cursor() as cur:
+            board = cache_board(board_key, *queries.get_games_page(cur, **filters))
+    return render_board(board, cached_systems(), filters)
+
+
+@games.route('/api/games', methods=['GET'])
+@cache_policy("public, max-age=10", etag=True)
+def api_games():
+    """
+    JSON version of the game board with the same filters and cursor semantics as "/".
+    Returns:
+        Response: JSON with the games on the page and the cursor of the next page.
+    """
+
+    filters = game_board_filters(request.args)
+    with get_db().cursor() as cur:
+        games, next_cursor = queries.get_games_page(cur, **filters)
+    return jsonify(games=[game._asdict() for game in games], next_cursor=next_cursor)
+
+
+def search_filters(args):
+    """
+    Read the search text, system filter and page offset from the query string.
+    Args:
+        args (MultiDict): The request query arguments.
+    Returns:
+        dict: Keyword arguments for queries.search_games.
+    """
+
+    offset = args.get("offset", 0, type=int)
+    return {
+        "text": args.get("q", "").strip(),
+        "system_id": args.get("system", type=int),
+        "limit": current_app.config["SEARCH_PAGE_SIZE"],
+        "offset": max(0, min(offset, current_app.config["SEARCH_MAX_OFFSET"])),
+    }
+
+
+def search_page(filters):
+    """
+    Run a game search, stopping the next page link at SEARCH_MAX_OFFSET.
+    Returns:
+        tuple: The found games and the offset of the next page (or None).
+    """
+
+    if queries.search_query_text(filters["text"]) is None:
+        return [], None
+    with get_db().cursor() as cur:
+        games, next_offset = queries.search_games(cur, **filters)
+    if next_offset is not None and next_offset > current_app.config["SEARCH_MAX_OFFSET"]:
+        next_offset = None
+    return games, next_offset
+
+
+@games.route('/search', methods=['GET'])
+@cache_policy("private, no-cache", anonymous_only=True, etag=True)
+def search():
+    """
+    Full-text search over game posts, best matches first, optionally within one game system.
+    Returns:
+        Response: The rendered search page.
+    """
+
+    filters = search_filters(request.args)
+    games, next_offset = search_page(filters)
+    next_url = None
+    if next_offset is not None:
+        query = {key: value for key, value in request.args.items() if key != "offset"}
+        next_url = url_for(".search", offset=next_offset, **query)
+    return render_template("search.html", games=games, game_list=render_game_list(games),
+                           systems=cached_systems(), filters=filters, next_url=next_url, nonce=g.nonce)
+
+
+@games.route('/api/search', methods=['GET'])
+@cache_policy("public, max-age=10", etag=True)
+def api_search():
+    """
+    JSON version of /search with the same arguments.
+    Returns:
+        Response: JSON with the ranked games and the offset of the next page.
+    """
+
+    games, next_offset = search_page(search_filters(request.args))
+    return jsonify(games=[game._asdict() for game in games], next_offset=next_offset)
+
+
+@games.route('/post_game', methods=['GET', 'POST'])
+@login_required
+
+def post_game():
+    """
+    Handle the posting of a new game.
+    This function handles both GET and POST requests for posting a new game.
+    - For GET requests, it retrieves the available game systems and renders the "post_game.html" template.
+    - For POST requests, it processes the form data to add a new game to the database.
+    Returns:
+        - For GET requests:
+            - Redirects to the home page with an error message if the user is not logged in.
+            - Renders the "post_game.html" template with the available game systems.
+        - For POST requests:
+            - Redirects to the home page with an error message if the user is not logged in.
+            - Renders the "post_game.html" template with an error message if any required form field is missing.
+            - Adds the new game to the database and redirects to the home page with a success message.
+            - Redirects to the home page with an error message if there is an exception during the database operation.
+
+    """
+    if request.method == 'GET':
+        print("GET")
+        if check_and_flash_if_none(session.get("user"), "Brak użytkownika"):
+            return redirect("/", error="Brak użytkownika")
+        if not session.get("user")["gm"]:
+            flash("Musisz być GM żeby dodać grę", "errore")
+            return redirect("/")
+        try:
+            systems = cached_systems()
+        except Exception as e:
+            print(f"Exception occurred: {e}")
+            flash("Błąd pobierania systemów gier", "error")
+            return redirect("/")
+        return render_template("post_game.html", systems=systems)
+    if request.method == 'POST':
+        print("POST")
+        if check_and_flash_if_none(session.get("user"), "Brak użytkownika"):
+            return redirect("/", error="Brak użytkownika")
+        title = request.form.get("title")
+        if check_and_flash_if_none(title, "Brak tytułu"):
+            return render_template("post_game.html", error="Brak tytułu")
+        system = request.form.get("system")
+        if check_and_flash_if_none(system, "Brak systemu"):
+            return render_template("post_game.html", error="Brak systemu")
+        players = request.form.get("players")
+        if check_and_flash_if_none(players, "Brak liczby graczy"):
+            return render_template("post_game.html", error="Brak liczby graczy")
+        description = request.form.get("description")
+
+        with get_db().cursor() as cur:
+            try:
+                game_id = queries.add_game(cur, session.get("user")["id"], title, players, system, description)
+                cache.invalidate(("game", game_id), cur=cur)
+                get_db().commit()
+                fragments.bump("games")
+                flash("Dodano grę", "success")
+            except Exception as e:
+                flash("Błąd dodawania gry", "error")
+                return redirect("/", error="Błąd dodawania gry")
+        return redirect("/")
+    
+
+def game_etag(game):
+    """Strong ETag of a game post, derived from its row version."""
+    return f"game-{game.id}-v{game.version}"
+
+
+def requested_game_ids(args):
+    """
+    Read the comma separated `ids` argument of /game_data, dropping duplicates.
+    Aborts with 400 for a malformed list or more than GAME_DATA_BATCH_MAX ids.
+    Args:
+        args (MultiDict): The request query arguments.
+    Returns:
+        list: The game ids in request order.
+    """
+
+    try:
+        ids = list(dict.fromkeys(int(id) for id in args.get("ids", "").split(",") if id.strip()))
+    except ValueError:
+        abort(400)
+    if len(ids) > current_app.config["GAME_DATA_BATCH_MAX"]:
+        abort(400)
+    return ids
+
+
+def split_cached_games(ids):
+    """
+    Look requested games up in the query cache; shared with asgi.py.
+    Args:
+        ids (list): The game ids from requested_game_ids.
+    Returns:
+        tuple: The cached games and the ids missing from the cache.
+    """
+
+    games = []
+    missing = []
+    for game_id in ids:
+        game = cache.get(("game", game_id))
+        if game is None:
+            missing.append(game_id)
+        else:
+            games.append(game)
+    return games, missing
+
+
+def cache_games(loaded):
+    """
+    Put games loaded from the database into the query cache; shared with asgi.py.
+    Args:
+        loaded (list): The loaded Game rows.
+    Returns:
+        list: The same games.
+    """
+
+    for game in loaded:
+        cache.set(("game", game.id), game, ttl=current_app.config["GAME_CACHE_TTL"])
+    return loaded
+
+
+@games.route('/game_data', methods=['GET'])
+@cache_policy("public, max-age=0, must-revalidate", etag=True)
+def game_data_batch():
+    """
+    Return many game posts as JSON, e.g. /game_data?ids=1,2,3.
+    Games already in the query cache are served from it; the rest are loaded with one query.
+    Returns:
+        Response: JSON with the found games, or 400 for a malformed id list.
+    """
+
+    games, missing = split_cached_games(requested_game_ids(request.args))
+    if missing:
+        with get_db().cursor() as cur:
+            games.extend(cache_games(queries.get_games_by_ids(cur, missing)))
+    return jsonify(games=[game._asdict() for game in games])
+
+
+def game_data_failed(e):
+    """Response of /game_data/<game_id> when the game couldn't be loaded; shared with asgi.py."""
+    print(f"Exception occurred: {e}")
+    flash("Błąd pobierania danych gry", "error")
+    return redirect("/")
+
+
+def game_data_response(game):
+    """
+    Build the /game_data/<game_id> response; shared with asgi.py.
+    A conditional request whose If-None-Match matches the row version gets 304,
+    without serializing the row.
+    Args:
+        game (Game or None): The loaded game.
+    Returns:
+        Response: The game as JSON or 304 Not Modified; aborts with 404 for a missing game.
+    """
+
+    if game is None:
+        abort(404)
+    etag = game_etag(game)
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    else:
+        response = jsonify(game._asdict())
+    response.set_etag(etag)
+    return response
+
+
+@games.route('/game_data/<int:game_id>', methods=['GET'])
+@cache_policy("public, max-age=0, must-revalidate")
+def game_data(game_id):
+    """
+    Return a game post as JSON.
+    Answers a conditional request whose If-None-Match matches the row version with 304,
+    without serializing the row.
+    Returns:
+        Response: The game as JSON, 304 Not Modified, or 404.
+    """
+
+    try:
+        game = cached_game(game_id)
+    except Exception as e:
+        return game_data_failed(e)
+    return game_data_response(game)
+
+
+@games.route('/apply_for_game/<int:game_id>', methods=['GET', 'POST'])
+@login_required
+@rate_limited("apply_for_game")
+def apply_for_game(game_id):
+    if request.method == 'GET':
+        user = session.get("user")["id"]
+        if check_and_flash_if_none(user, "Brak użytkownika"):
+            return redirect("/", error="Brak użytkownika")
+        with get_db().cursor() as cur:
+            try:
+                game = queries.get_game_title_and_gm(cur, game_id)
+                if check_and_flash_if_none(game, "Nie znaleziono gry"):
+                    return redirect("/", error="Nie znaleziono gry")
+                if game.gm_id == user:
+                    flash("GM nie może aplikowac do swojej gry", "error")
+                    return redirect("/")
+            except Exception as e:
+                flash("Błąd pobierania danych gry", "error")
+                return redirect("/", error="Błąd pobierania danych gry")
+        return render_template("apply_for_game.html", game=game, game_id=game_id)
+    if request.method == 'POST':
+        user_id = session.get("user")["id"]
+        if check_and_flash_if_none(user_id, "Brak użytkownika"):
+            return redirect("/", error="Brak użytkownika")
+        message = request.form.get("message")
+        if not message:
+            message = f'{session.get("user")["name"]} chce dołączyć do gry'
+        try:
+            with get_db().cursor() as cur:
+                result = queries.apply_to_game(cur, game_id, user_id, message)
+            get_db().commit()
+        except Exception as e:
+            print(f"Exception occurred: {e}")
+            flash("Błąd wysyłania wiadomości", "error")
+            return redirect("/")
+        if result == queries.APPLY_GAME_NOT_FOUND:
+            flash("Nie znaleziono gry", "error")
+        elif result == queries.APPLY_OWN_GAME:
+            flash("Jesteś już GM tej gry", "error")
+        elif result == queries.APPLY_ALREADY_APPLIED:
+            flash("Allredy applied to this game", "error")
+        else:
+            flash("Wysłano wiadomość", "success")
+        return redirect("/")
+
+
+@games.route('/accept_player/<int:game_id>/<int:user_id>', methods=['POST'])
+@login_required
+def accept_player(game_id, user_id):
+    """
+    Accept a waiting player into the game. Only the game's GM can do it and only while a seat is free.
+    Returns:
+        Response: A redirect to the game's chat.
+    """
+
+    gm_id = session.get("user")["id"]
+    try:
+        with get_db().cursor() as cur:
+            result = queries.accept_player(cur, game_id, gm_id, user_id)
+            if result == queries.ACCEPT_ACCEPTED:
+                cache.invalidate(("game", game_id), cur=cur)
+        get_db().commit()
+        if result == queries.ACCEPT_ACCEPTED:
+            fragments.bump("games")
+    except Exception as e:
+        print(f"Exception occurred: {e}")
+        get_db().rollback()
+        flash("Błąd akceptowania gracza", "error")
+        return redirect(url_for("chat.game_chat", game_id=game_id))
+    if result == queries.ACCEPT_GAME_NOT_FOUND:
+        flash("Nie znaleziono gry", "error")
+        return redirect("/")
+    if result == queries.ACCEPT_NOT_GM:
+        flash("Tylko GM może akceptować graczy", "error")
+    elif result == queries.ACCEPT_NO_SEATS:
+        flash("Brak wolnych miejsc w grze", "error")
+    elif result == queries.ACCEPT_NOT_WAITING:
+        flash("Ten gracz nie czeka na akceptację", "error")
+    else:
+        flash("Zaakceptowano gracza", "success")
+    return redirect(url_for("chat.game_chat", game_id=game_id))
@@ -0,0 +1,68 @@
+import hmac
+from flask import Blueprint, current_app, request, abort, jsonify, Response
+from extensions import pool, cache, fragments, last_logins, metrics
+from metrics import CONTENT_TYPE
+
+monitoring = Blueprint("monitoring", __name__)
+
+
+@monitoring.before_request
+def restrict_access():
+    """
+    Let only MONITORING_ALLOWED_IPS, or requests with the MONITORING_TOKEN bearer token, see the monitoring routes.
+    Behind reverse proxies the address is the client's only with PROXY_FIX_X_FOR set.
+    Returns:
+        None: When allowed; otherwise aborts with 403.
+    """
+
+    config = current_app.config
+    if request.remote_addr in config["MONITORING_ALLOWED_IPS"]:
+        return None
+    token = config["MONITORING_TOKEN"]
+    if token and hmac.compare_digest(request.headers.get("Authorization", "").encode(), f"Bearer {token}".encode()):
+        return None
+    abort(403)
+
+
+@monitoring.route('/pool_stats', methods=['GET'])
+def pool_stats():
+    """
+    Report connection pool usage (in use, waiting, checkout wait times) for monitoring.
+    Returns:
+        Response: JSON with the pool counters.
+    """
+
+    return jsonify(pool.stats())
+
+
+@monitoring.route('/cache_stats', methods=['GET'])
+def cache_stats():
+    """
+    Report query cache counters (hits, misses, evictions, invalidations) and those of the fragment cache.
+    Returns:
+        Response: JSON with the cache counters.
+    """
+
+    return jsonify(dict(cache.stats(), fragments=fragments.stats()))
+
+
+@monitoring.route('/last_login_stats', methods=['GET'])
+def last_login_stats():
+    """
+    Report the last-login write-behind buffer counters (pending users, flush size and lag).
+    Returns:
+        Response: JSON with the buffer counters.
+    """
+
+    return jsonify(last_logins.stats())
+
+
+@monitoring.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """
+    Report request, query and pool metrics of this process in the Prometheus text format.
+    Returns:
+        Response: The exposition text.
+    """
+
+    return Response(metrics.render(), content_type=CONTENT_TYPE)